@@ -1,14 +1,40 @@
+import hmac
+
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, OAuth2PasswordBearer
 import jwt
 from app.core.config import settings
+from app.core.metrics import AUTH_FAILURES, gauge_lines, registry
+from app.core.token_cache import VerifiedTokenCache
 
 # Configuración de OAuth2 con JWT
 # Esto le dice a FastAPI dónde está el endpoint de login que devuelve el token JWT.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
+# Caché de tokens ya verificados: un token repetido no vuelve a pasar por jwt.decode
+token_cache = VerifiedTokenCache(max_size=settings.TOKEN_CACHE_MAX_SIZE)
+
+
+def _token_cache_metrics():
+    stats = token_cache.stats()
+    return gauge_lines("token_cache", "Caché en proceso de tokens JWT ya verificados.", {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "hit_ratio": stats["hit_ratio"],
+        "size": stats["size"],
+    })
+
+
+registry.add_collector(_token_cache_metrics)
+
+
 # Esta función se usa como dependencia en los endpoints que requieran autenticación.
 def get_current_user(token: str = Depends(oauth2_scheme)):
+    cached = token_cache.get(token)
+    if cached is not None:
+        # Copia para que ningún endpoint pueda modificar la entrada compartida
+        return dict(cached)
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
@@ -18,11 +44,31 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
+            AUTH_FAILURES.inc("invalid_token")
             raise credentials_exception
         # Aquí buscaremos el usuario en la Base de Datos.
         # Validamos que el token tiene formato y firma correctos.
         token_data = {"username": username}
     except jwt.InvalidTokenError:
+        AUTH_FAILURES.inc("invalid_token")
         raise credentials_exception
-        
-    return token_data
\ No newline at end of file
+
+    token_cache.put(token, dict(token_data), payload.get("exp"))
+    return token_data
+
+
+# Endpoints internos (diagnóstico, métricas): Bearer con INTERNAL_API_TOKEN, no un JWT de usuario
+internal_bearer = HTTPBearer(auto_error=False)
+
+
+def require_internal_token(credentials: HTTPAuthorizationCredentials = Depends(internal_bearer)):
+    expected = settings.INTERNAL_API_TOKEN
+    if not expected:
+        # Sin token configurado los endpoints internos están desactivados
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(), expected.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token interno no válido",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -1,44 +1,74 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
 
 # En esta fase inicial, implementamos un sistema de autenticación simple usando JWT.
 # Esto nos permitirá proteger ciertos endpoints y asegurarnos de que solo los usuarios autenticados puedan acceder
-from app.core.security import verify_password, create_access_token, get_password_hash
+from app.core.security import create_access_token, password_hasher
 from app.core.config import settings
+from app.core.metrics import AUTH_FAILURES
 from app.api.deps import get_current_user
+from app.api.schemas import CurrentUserResponse, Token, UserCreated
 from app.db.database import get_db
 from app.db.models import User
 
 router = APIRouter()
 
+def _get_user_by_username(db: Session, username: str):
+    return db.query(User).filter(User.username == username).first()
+
+
+def _create_user(db: Session, username: str, email: str, hashed_password: str) -> User:
+    new_user = User(username=username, email=email, hashed_password=hashed_password)
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return new_user
+
+
+def _update_password_hash(db: Session, user: User, hashed_password: str) -> None:
+    user.hashed_password = hashed_password
+    db.commit()
+
+
+# Los endpoints de registro y login son async: el hash PBKDF2 se hace en el pool dedicado
+# de password_hasher y las consultas a la BD en el threadpool, así una ráfaga de logins
+# no deja sin hilos al resto de endpoints.
+
 # 1. Endpoint para crear un usuario de prueba (Borrar en producción)
 # Este endpoint es solo para propósitos de prueba y desarrollo. En un entorno de producción, deberíamos implementar un sistema de registro más robusto y seguro.
-@router.post("/register")
-def register_user(username: str, email: str, password: str, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == username).first()
+@router.post("/register", response_model=UserCreated)
+async def register_user(username: str, email: str, password: str, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(_get_user_by_username, db, username)
     if db_user:
         raise HTTPException(status_code=400, detail="Usuario ya registrado")
     
-    hashed_password = get_password_hash(password)
-    new_user = User(username=username, email=email, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    hashed_password = await password_hasher.hash(password)
+    new_user = await run_in_threadpool(_create_user, db, username, email, hashed_password)
     return {"message": "Usuario creado exitosamente", "user": new_user.username}
 
 # 2. Login usando la Base de Datos REAL
-@router.post("/login", response_model=dict)
-def login_for_access_token(
+@router.post("/login", response_model=Token)
+async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db) # <-- Inyectamos la BD
 ):
     # Buscar usuario en Postgres
-    user = db.query(User).filter(User.username == form_data.username).first()
-    
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(_get_user_by_username, db, form_data.username)
+    if not user:
+        AUTH_FAILURES.inc("unknown_user")
         raise HTTPException(status_code=400, detail="Usuario o contraseña incorrectos")
+
+    verified, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+    if not verified:
+        AUTH_FAILURES.inc("bad_password")
+        raise HTTPException(status_code=400, detail="Usuario o contraseña incorrectos")
+
+    # Si pwd_context considera el hash desactualizado (ej. se subieron las rondas), lo renovamos
+    if new_hash:
+        await run_in_threadpool(_update_password_hash, db, user, new_hash)
         
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -48,6 +78,6 @@ def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Endpoint protegido para verificar que la autenticación funciona
-@router.get("/me")
+@router.get("/me", response_model=CurrentUserResponse)
 def read_users_me(current_user: dict = Depends(get_current_user)):
     return {"message": "Si ves esto, estás autenticado", "user": current_user}
\ No newline at end of file
@@ -0,0 +1,776 @@
+import base64
+import binascii
+import hashlib
+import json
+import mimetypes
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import APIRouter, Body, Depends, File, Header, HTTPException, Query, Response, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_current_user
+from app.api.schemas import (
+    BatchUploadResult,
+    DirectUploadCompleted,
+    DirectUploadStarted,
+    DocumentItem,
+    DocumentPage,
+    DownloadUrl,
+    SearchHitItem,
+    SearchPage,
+    StorageUsage,
+)
+from app.core.config import settings
+from app.core.responses import available_encodings, encoded_etag, model_response
+from app.db.database import get_db, get_read_db
+from app.db.models import DirectUpload, Document, User, UserUsage
+from app.services import dedup_service, usage_service
+from app.services.async_s3_service import async_s3_service
+from app.services.direct_transfer_service import (
+    TRANSFER_DIRECT,
+    TRANSFER_PROXIED,
+    DirectUploadError,
+    direct_transfer_service,
+    mode_allowed,
+)
+from app.services.document_service import IncomingFile, StoredObject, document_service
+from app.services.export_service import ExportMember, export_service
+from app.services.search_service import search_documents
+from app.services.compression import CODEC_NONE
+from app.services.encryption_service import (
+    HEADER_SIZE,
+    SegmentDecryptor,
+    decrypt_file,
+    encrypted_span,
+    is_stream_format,
+    parse_header,
+    plaintext_size,
+    segment_count,
+)
+
+router = APIRouter()
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# El cliente puede guardar las respuestas (solo él: dependen del usuario), pero debe
+# revalidarlas con If-None-Match; si no han cambiado recibe un 304 sin cuerpo.
+_PRIVATE_CACHE = "private, no-cache"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Comparación débil, como pide la RFC 9110 para If-None-Match
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+# Los listados pueden ir comprimidos según Accept-Encoding (ver app/core/responses.py)
+_LISTING_VARY = "Authorization, Accept-Encoding"
+
+
+def _not_modified(etag: str, vary: str = "Authorization") -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": _PRIVATE_CACHE, "Vary": vary},
+    )
+
+
+def _encode_cursor(upload_date: datetime, document_id: int) -> str:
+    raw = json.dumps([upload_date.isoformat(), document_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        upload_date, document_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(upload_date), int(document_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+
+
+def _listing_etag(owner_id: int, version: int, cursor: Optional[str], limit: int) -> str:
+    digest = hashlib.sha256(f"{owner_id}:{version}:{cursor or ''}:{limit}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+# Listado paginado por cursor (keyset) sobre (owner_id, upload_date, id).
+# - Sin OFFSET: cada página empieza justo después de la última fila de la anterior,
+#   así el coste es el mismo en la página 1 que en la 2.000.
+# - Solo se seleccionan las columnas que se listan (sin objetos ORM ni carga de `owner`).
+# - ETag: la versión de los documentos del usuario (user_usage.documents_version), que
+#   sube en la misma transacción que cada subida o borrado. Se lee antes que la página,
+#   así un ETag nunca acompaña a datos más antiguos que él; si coincide con
+#   If-None-Match se responde 304 sin consultar la página. La versión comprimida lleva
+#   el mismo ETag con el sufijo de la codificación, y cualquiera de los dos vale.
+# - Se serializa con pydantic y, por encima de RESPONSE_COMPRESSION_MIN_BYTES, se
+#   comprime con gzip o zstd si el cliente lo acepta.
+@router.get("", response_model=DocumentPage)
+def get_documents(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    accept_encoding: Optional[str] = Header(None, alias="Accept-Encoding"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    username = current_user.get("username")
+    owner = db.execute(
+        select(User.id, func.coalesce(UserUsage.documents_version, 0))
+        .outerjoin(UserUsage, UserUsage.user_id == User.id)
+        .where(User.username == username)
+    ).first()
+    if owner is None:
+        raise HTTPException(status_code=401, detail="No se pudieron validar las credenciales")
+    owner_id, version = owner
+    etag = _listing_etag(owner_id, version, cursor, limit)
+    for candidate in (etag, *(encoded_etag(etag, encoding) for encoding in available_encodings())):
+        if _etag_matches(if_none_match, candidate):
+            return _not_modified(candidate, _LISTING_VARY)
+
+    query = select(
+        Document.id, Document.filename, Document.upload_date, Document.is_encrypted, Document.size
+    ).where(Document.owner_id == owner_id)
+    if cursor:
+        upload_date, document_id = _decode_cursor(cursor)
+        query = query.where(tuple_(Document.upload_date, Document.id) < (upload_date, document_id))
+    # Pedimos una fila de más para saber si hay página siguiente sin un COUNT
+    query = query.order_by(Document.upload_date.desc(), Document.id.desc()).limit(limit + 1)
+
+    rows = db.execute(query).all()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = _encode_cursor(last.upload_date, last.id)
+
+    listing = DocumentPage(
+        user_requesting=username,
+        documents=[
+            DocumentItem(
+                id=row.id, name=row.filename, size=row.size, encrypted=row.is_encrypted, uploaded_at=row.upload_date
+            )
+            for row in page
+        ],
+        next_cursor=next_cursor,
+    )
+    return model_response(
+        listing,
+        accept_encoding,
+        settings.RESPONSE_COMPRESSION_MIN_BYTES,
+        {"ETag": etag, "Cache-Control": _PRIVATE_CACHE, "Vary": _LISTING_VARY},
+    )
+
+
+# Búsqueda por nombre: prefijo, subcadena o parecido (erratas), ordenada por relevancia.
+# La paginación es por desplazamiento (el orden depende del texto buscado, no hay un
+# cursor estable) y se limita a las primeras páginas, que es donde está lo relevante.
+@router.get("/search", response_model=SearchPage)
+def search(
+    q: str = Query(..., min_length=1, max_length=255),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    accept_encoding: Optional[str] = Header(None, alias="Accept-Encoding"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    owner_id = _get_owner_id(db, current_user.get("username"))
+    # Una fila de más para saber si hay página siguiente
+    hits = search_documents(db, owner_id, q, limit + 1, offset)
+    results = SearchPage(
+        query=q,
+        documents=[
+            SearchHitItem(
+                id=hit.id,
+                name=hit.filename,
+                size=hit.size,
+                encrypted=hit.is_encrypted,
+                uploaded_at=hit.upload_date,
+                match=hit.match,
+                score=round(hit.score, 3),
+            )
+            for hit in hits[:limit]
+        ],
+        next_offset=offset + limit if len(hits) > limit else None,
+    )
+    return model_response(results, accept_encoding, settings.RESPONSE_COMPRESSION_MIN_BYTES, {"Vary": _LISTING_VARY})
+
+
+# Uso de almacenamiento del usuario: se lee de sus contadores, sin recorrer sus documentos
+@router.get("/usage", response_model=StorageUsage)
+def get_usage(
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    owner_id = _get_owner_id(db, current_user.get("username"))
+    return usage_service.get_usage(db, owner_id)
+
+
+def _quota_exceeded(error: usage_service.QuotaExceeded) -> HTTPException:
+    detail = "Cuota de almacenamiento superada"
+    if error.available is not None:
+        detail += f": quedan {error.available} bytes libres y se necesitan {error.requested}"
+    return HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=detail)
+
+
+def _get_owner_id(db: Session, username: str) -> int:
+    owner_id = db.query(User.id).filter(User.username == username).scalar()
+    if owner_id is None:
+        raise HTTPException(status_code=401, detail="No se pudieron validar las credenciales")
+    return owner_id
+
+
+def _require_transfer_mode(mode: str) -> None:
+    if not mode_allowed(mode):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Este despliegue no admite transferencias en modo {mode}",
+        )
+
+
+def _insert_documents(db: Session, owner_id: int, stored: List[StoredObject]) -> List[int]:
+    # Un único INSERT para todo el lote (executemany con RETURNING para obtener los ids)
+    rows = [
+        {
+            "filename": obj.filename,
+            "s3_key": obj.s3_key,
+            "owner_id": owner_id,
+            "is_encrypted": True,
+            "wrapped_key": obj.wrapped_key,
+            "key_provider": obj.key_provider,
+            "size": obj.size,
+            "stored_size": obj.stored_size,
+            "checksum": obj.checksum,
+        }
+        for obj in stored
+    ]
+    ids = db.scalars(insert(Document).returning(Document.id, sort_by_parameter_order=True), rows).all()
+    dedup_service.add_references(db, owner_id, stored)
+    # El uso del usuario cambia en la misma transacción (y aquí se garantiza la cuota)
+    usage_service.charge(
+        db, owner_id, len(stored), sum(obj.size for obj in stored), sum(obj.stored_size for obj in stored)
+    )
+    db.commit()
+    return list(ids)
+
+
+def _new_objects(stored: List[StoredObject]) -> List[StoredObject]:
+    # Objetos subidos en este lote, una vez cada uno (los duplicados del lote comparten objeto)
+    return list({obj.s3_key: obj for obj in stored if not obj.deduplicated}.values())
+
+
+async def _store_files(
+    db: Session, owner_id: int, incoming: Dict[int, IncomingFile], results: List[dict]
+) -> Dict[int, StoredObject]:
+    """
+    Cifra y sube los archivos del lote (por su índice en la petición) y devuelve los que
+    se guardaron. Con la deduplicación activa, un archivo cuyo contenido ya tiene el
+    usuario (o que se repite dentro del lote) no se cifra ni se sube: reutiliza el objeto.
+    Los fallos se anotan en `results`.
+    """
+    content_hashes: Dict[int, bytes] = {}
+    existing = {}
+    if settings.DEDUP_ENABLED and incoming:
+        fingerprints = await document_service.fingerprint_many(list(incoming.values()), owner_id)
+        for index, fingerprint in zip(list(incoming), fingerprints):
+            if isinstance(fingerprint, Exception):
+                results[index].update(status="error", detail=_failure_detail(fingerprint))
+                del incoming[index]
+            else:
+                content_hashes[index] = fingerprint
+        existing = await run_in_threadpool(
+            dedup_service.find_entries, db, owner_id, content_hashes.values()
+        )
+
+    to_store: List[int] = []
+    first_in_batch: Dict[bytes, int] = {}
+    copies: Dict[int, bytes] = {}
+    for index in incoming:
+        content_hash = content_hashes.get(index)
+        if content_hash is not None and (content_hash in existing or content_hash in first_in_batch):
+            copies[index] = content_hash
+        else:
+            to_store.append(index)
+            if content_hash is not None:
+                first_in_batch[content_hash] = index
+
+    stored: Dict[int, StoredObject] = {}
+    outcomes = await document_service.store_many([incoming[i] for i in to_store], owner_id)
+    for index, outcome in zip(to_store, outcomes):
+        if isinstance(outcome, Exception):
+            results[index].update(status="error", detail=_failure_detail(outcome))
+        else:
+            outcome.content_hash = content_hashes.get(index)
+            stored[index] = outcome
+
+    for index, content_hash in copies.items():
+        filename = incoming[index].filename
+        size = document_service.file_size(incoming[index])
+        entry = existing.get(content_hash)
+        if entry is not None:
+            stored[index] = StoredObject(
+                filename, entry.s3_key, entry.wrapped_key, entry.key_provider, content_hash, deduplicated=True,
+                size=size, stored_size=entry.stored_size or 0, checksum=entry.checksum,
+            )
+            continue
+        source = stored.get(first_in_batch[content_hash])
+        if source is None:
+            results[index].update(status="error", detail="No se pudo guardar el documento.")
+            continue
+        stored[index] = StoredObject(
+            filename, source.s3_key, source.wrapped_key, source.key_provider, content_hash,
+            size=size, stored_size=source.stored_size, checksum=source.checksum,
+        )
+    return stored
+
+
+def _apply_quota(incoming: Dict[int, IncomingFile], available: Optional[int], results: List[dict]) -> None:
+    # Antes de cifrar nada: los archivos que ya no caben en la cuota se descartan (en orden)
+    if available is None:
+        return
+    for index in list(incoming):
+        size = document_service.file_size(incoming[index])
+        if size > available:
+            results[index].update(status="error", detail="Cuota de almacenamiento superada")
+            del incoming[index]
+        else:
+            available -= size
+
+
+def _failure_detail(error: Exception) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    print(f"Error guardando documento del lote: {error!r}")
+    return "No se pudo guardar el documento."
+
+
+# Subida por lotes: varios archivos en una sola petición.
+# Los archivos pasan por el pipeline cifrado → S3 de document_service con concurrencia
+# acotada y todas las filas Document se insertan con una sola sentencia. La respuesta
+# informa del resultado de cada archivo: uno defectuoso no hace fallar al resto.
+@router.post("/batch", response_model=BatchUploadResult, response_model_exclude_none=True)
+async def upload_documents_batch(
+    files: List[UploadFile] = File(...),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    _require_transfer_mode(TRANSFER_PROXIED)
+    if len(files) > settings.BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Como máximo {settings.BATCH_UPLOAD_MAX_FILES} archivos por lote",
+        )
+    owner_id = await run_in_threadpool(_get_owner_id, db, current_user.get("username"))
+
+    results: List[dict] = [{"filename": upload.filename} for upload in files]
+    accepted = []
+    for index, upload in enumerate(files):
+        if not upload.filename or not upload.filename.strip():
+            results[index].update(status="error", detail="Nombre de archivo no válido")
+        else:
+            accepted.append(index)
+
+    incoming = {i: IncomingFile(files[i].filename, files[i].file, files[i].size) for i in accepted}
+    available = await run_in_threadpool(usage_service.remaining_bytes, db, owner_id)
+    _apply_quota(incoming, available, results)
+
+    stored_by_index = await _store_files(db, owner_id, incoming, results)
+    stored_indexes = sorted(stored_by_index)
+    stored = [stored_by_index[i] for i in stored_indexes]
+
+    if stored:
+        try:
+            ids = await run_in_threadpool(_insert_documents, db, owner_id, stored)
+        except Exception as e:
+            # Sin filas en la BD los objetos nuevos quedarían huérfanos: los retiramos de S3
+            # (los reutilizados por deduplicación son de otros documentos y se quedan)
+            await run_in_threadpool(db.rollback)
+            await document_service.discard(_new_objects(stored))
+            if isinstance(e, usage_service.QuotaExceeded):
+                # Otra subida simultánea ocupó el espacio que quedaba
+                raise _quota_exceeded(e)
+            if isinstance(e, dedup_service.DedupConflict):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Otra subida modificó los mismos documentos a la vez. Vuelve a intentarlo.",
+                )
+            print(f"Error insertando el lote de documentos: {e!r}")
+            raise HTTPException(status_code=500, detail="No se pudo registrar el lote de documentos.")
+        for index, document_id in zip(stored_indexes, ids):
+            results[index].update(status="ok", id=document_id)
+
+    return {
+        "uploaded": len(stored),
+        "failed": len(files) - len(stored),
+        "results": results,
+    }
+
+
+def _get_direct_upload(db: Session, upload_id: int, username: str) -> DirectUpload:
+    # Igual que con los documentos: una subida ajena da 404, como una inexistente
+    upload = (
+        db.query(DirectUpload)
+        .join(User, DirectUpload.owner_id == User.id)
+        .filter(DirectUpload.id == upload_id, User.username == username)
+        .first()
+    )
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+    return upload
+
+
+# Transferencia directa (ver DirectTransferService): el cliente sube las partes a S3
+# con las URLs prefirmadas que devuelve este endpoint y después llama a /complete.
+@router.post("/direct-uploads", status_code=status.HTTP_201_CREATED, response_model=DirectUploadStarted)
+def start_direct_upload(
+    filename: str = Body(..., min_length=1),
+    size: int = Body(..., ge=0),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    _require_transfer_mode(TRANSFER_DIRECT)
+    if not filename.strip():
+        raise HTTPException(status_code=400, detail="Nombre de archivo no válido")
+    owner_id = _get_owner_id(db, current_user.get("username"))
+    try:
+        upload, urls = direct_transfer_service.initiate(db, owner_id, filename, size)
+    except usage_service.QuotaExceeded as e:
+        raise _quota_exceeded(e)
+    except DirectUploadError as e:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(e))
+    except Exception as e:
+        print(f"Error iniciando la subida directa: {e!r}")
+        raise HTTPException(status_code=500, detail="No se pudo iniciar la subida.")
+    return {
+        "upload_id": upload.id,
+        "part_size": direct_transfer_service.part_size,
+        "expires_in": direct_transfer_service.expires_in,
+        "parts": [{"part_number": number, "url": url} for number, url in enumerate(urls, start=1)],
+    }
+
+
+@router.post(
+    "/direct-uploads/{upload_id}/complete", status_code=status.HTTP_201_CREATED, response_model=DirectUploadCompleted
+)
+def complete_direct_upload(
+    upload_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    upload = _get_direct_upload(db, upload_id, current_user.get("username"))
+    filename, size = upload.filename, upload.size
+    try:
+        document_id = direct_transfer_service.complete(db, upload)
+    except usage_service.QuotaExceeded as e:
+        raise _quota_exceeded(e)
+    except DirectUploadError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except Exception as e:
+        print(f"Error completando la subida directa {upload_id}: {e!r}")
+        raise HTTPException(status_code=500, detail="No se pudo completar la subida.")
+    return {"id": document_id, "name": filename, "size": size}
+
+
+@router.delete("/direct-uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_direct_upload(
+    upload_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    upload = _get_direct_upload(db, upload_id, current_user.get("username"))
+    direct_transfer_service.abort(db, upload)
+
+
+def _get_export_members(db: Session, username: str, ids: Optional[List[int]]) -> List[ExportMember]:
+    query = (
+        select(
+            Document.id,
+            Document.filename,
+            Document.s3_key,
+            Document.wrapped_key,
+            Document.key_provider,
+            Document.upload_date,
+            Document.transfer_mode,
+        )
+        .join(User, Document.owner_id == User.id)
+        .where(User.username == username)
+        .order_by(Document.upload_date, Document.id)
+    )
+    if ids:
+        query = query.where(Document.id.in_(set(ids)))
+    rows = db.execute(query).all()
+    if ids and len(rows) != len(set(ids)):
+        # Algún id no existe o es de otro usuario: mismo 404 que en la descarga individual
+        raise HTTPException(status_code=404, detail="Documento no encontrado")
+    return [
+        ExportMember(
+            row.filename,
+            row.s3_key,
+            row.wrapped_key,
+            row.key_provider,
+            row.upload_date,
+            direct=row.transfer_mode == TRANSFER_DIRECT,
+        )
+        for row in rows
+    ]
+
+
+# Exportación de varios documentos (o de todos, sin `ids`) en un ZIP generado al vuelo.
+# Ver ExportService: cada documento se descarga y descifra mientras se escribe, con
+# una ventana de descargas por adelantado, así que la memoria no crece con el tamaño.
+@router.get("/export")
+async def export_documents(
+    ids: Optional[List[int]] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    members = await run_in_threadpool(_get_export_members, db, current_user.get("username"), ids)
+    return StreamingResponse(
+        export_service.stream_zip(members),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="documentos.zip"'},
+    )
+
+
+def _get_owned_document(db: Session, document_id: int, username: str) -> Document:
+    # Filtramos por propietario en la propia consulta: un documento ajeno da 404,
+    # igual que uno inexistente, para no revelar qué ids existen.
+    document = (
+        db.query(Document)
+        .join(User, Document.owner_id == User.id)
+        .filter(Document.id == document_id, User.username == username)
+        .first()
+    )
+    if document is None:
+        raise HTTPException(status_code=404, detail="Documento no encontrado")
+    return document
+
+
+def _parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta una cabecera Range de un único rango. Devuelve (inicio, fin) inclusivos,
+    o None si hay que servir el documento completo.
+    """
+    if not range_header:
+        return None
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if match is None:
+        # Rangos múltiples o unidades desconocidas: la RFC 9110 permite ignorarlos
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        length = int(last)
+        if length == 0 or size == 0:
+            raise _range_not_satisfiable(size)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise _range_not_satisfiable(size)
+    return start, min(end, size - 1)
+
+
+def _range_not_satisfiable(size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+        detail="Rango no válido para este documento",
+        headers={"Content-Range": f"bytes */{size}"},
+    )
+
+
+def _content_etag(document: Document) -> str:
+    # Los objetos de S3 no se modifican nunca (cada versión va a una s3_key nueva), así que
+    # sin checksum guardado (documentos antiguos o directos) la propia clave sirve de versión
+    if document.checksum:
+        return f'"{document.checksum}"'
+    return f'"{hashlib.sha256(document.s3_key.encode()).hexdigest()}"'
+
+
+def _content_headers(document: Document) -> dict:
+    return {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(document.filename)}",
+        "ETag": _content_etag(document),
+        "Cache-Control": _PRIVATE_CACHE,
+        "Vary": "Authorization",
+    }
+
+
+async def _compressed_content_response(
+    document: Document, header, ciphertext_size: int, media_type: str, headers: dict
+) -> StreamingResponse:
+    # Documento comprimido antes de cifrar: los offsets del original no corresponden a
+    # segmentos ni se conoce su tamaño sin descomprimirlo, así que se sirve completo
+    # (200, sin Content-Length) e ignorando Range, como permite la RFC 9110.
+    headers["Accept-Ranges"] = "none"
+    data_key = await document_service.data_key(document.wrapped_key, document.key_provider)
+    decryptor = SegmentDecryptor(header, segment_count(header, ciphertext_size), key=data_key)
+
+    async def stream_plaintext():
+        async for chunk in async_s3_service.iter_range(
+            document.s3_key, HEADER_SIZE, ciphertext_size - 1, object_size=ciphertext_size
+        ):
+            for plaintext in decryptor.update(chunk):
+                yield plaintext
+        for plaintext in decryptor.finalize():
+            yield plaintext
+
+    return StreamingResponse(stream_plaintext(), media_type=media_type, headers=headers)
+
+
+# Descarga en streaming con descifrado al vuelo y soporte de peticiones Range.
+# Solo se piden a S3 los segmentos cifrados que cubren el rango solicitado, así que
+# saltar al final de un vídeo o un PDF grande no descarga ni descifra el objeto entero.
+# Con la caché de objetos activa (OBJECT_CACHE_MAX_BYTES) los objetos cifrados más pedidos
+# se sirven desde el disco local; el descifrado se hace igual en cada descarga.
+@router.get("/{document_id}/content")
+async def download_document_content(
+    document_id: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    document = await run_in_threadpool(
+        _get_owned_document, db, document_id, current_user.get("username")
+    )
+    # Revalidación: sin tocar S3 ni desenvolver la clave de datos
+    etag = _content_etag(document)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    if document.transfer_mode == TRANSFER_DIRECT:
+        # Lo sirve S3 (rangos incluidos): redirigimos a una URL prefirmada de corta duración
+        url = await run_in_threadpool(direct_transfer_service.download_url, document)
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+    media_type = mimetypes.guess_type(document.filename)[0] or "application/octet-stream"
+    headers = _content_headers(document)
+
+    # Primera lectura: solo la cabecera, que además nos da el tamaño total del objeto
+    prefix, ciphertext_size = await async_s3_service.download_range(document.s3_key, 0, HEADER_SIZE - 1)
+
+    if not is_stream_format(prefix):
+        # Documento antiguo en Fernet: no admite acceso aleatorio, se descifra completo
+        content = decrypt_file(await async_s3_service.download(document.s3_key, object_size=ciphertext_size))
+        requested = _parse_range(range_header, len(content))
+        if requested is None:
+            headers["Content-Length"] = str(len(content))
+            return StreamingResponse(iter([content]), media_type=media_type, headers=headers)
+        start, end = requested
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            iter([content[start:end + 1]]),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    header = parse_header(prefix)
+    if header.codec != CODEC_NONE:
+        return await _compressed_content_response(document, header, ciphertext_size, media_type, headers)
+
+    size = plaintext_size(header, ciphertext_size)
+    requested = _parse_range(range_header, size)
+    start, end = requested if requested is not None else (0, size - 1)
+    status_code = status.HTTP_200_OK
+    if requested is not None:
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+
+    if size == 0:
+        return StreamingResponse(iter([b""]), media_type=media_type, headers=headers)
+
+    first_segment, ciphertext_start, ciphertext_end = encrypted_span(header, ciphertext_size, start, end)
+    data_key = await document_service.data_key(document.wrapped_key, document.key_provider)
+    decryptor = SegmentDecryptor(header, segment_count(header, ciphertext_size), first_segment, key=data_key)
+
+    async def stream_plaintext():
+        # Recortamos el principio del primer segmento y el final del último
+        skip = start - first_segment * header.segment_size
+        remaining = end - start + 1
+
+        def emit(segments):
+            nonlocal skip, remaining
+            for plaintext in segments:
+                if skip:
+                    plaintext = plaintext[skip:]
+                    skip = 0
+                if len(plaintext) > remaining:
+                    plaintext = plaintext[:remaining]
+                remaining -= len(plaintext)
+                if plaintext:
+                    yield plaintext
+
+        async for chunk in async_s3_service.iter_range(
+            document.s3_key, ciphertext_start, ciphertext_end, object_size=ciphertext_size
+        ):
+            for plaintext in emit(decryptor.update(chunk)):
+                yield plaintext
+        for plaintext in emit(decryptor.finalize()):
+            yield plaintext
+
+    return StreamingResponse(
+        stream_plaintext(), status_code=status_code, media_type=media_type, headers=headers
+    )
+
+
+# URL prefirmada para que el cliente descargue directamente de S3 (solo documentos de
+# transferencia directa: los cifrados por la app solo se pueden descifrar en la API).
+@router.get("/{document_id}/download-url", response_model=DownloadUrl)
+def get_download_url(
+    document_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    document = _get_owned_document(db, document_id, current_user.get("username"))
+    if document.transfer_mode != TRANSFER_DIRECT:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Este documento está cifrado por la aplicación: descárgalo desde /content",
+        )
+    return {
+        "url": direct_transfer_service.download_url(document),
+        "expires_in": direct_transfer_service.expires_in,
+    }
+
+
+def _delete_document(db: Session, document_id: int, username: str) -> Optional[str]:
+    # Borra la fila y quita su referencia del índice de deduplicación en la misma
+    # transacción. Devuelve la s3_key si el objeto se ha quedado sin documentos.
+    document = _get_owned_document(db, document_id, username)
+    s3_key = document.s3_key
+    orphaned = s3_key is not None and dedup_service.release(db, s3_key)
+    usage_service.release(db, document.owner_id, 1, document.size or 0, document.stored_size or 0)
+    db.delete(document)
+    db.commit()
+    return s3_key if orphaned else None
+
+
+# Borrado de un documento. Si otros documentos comparten el objeto cifrado (misma
+# huella de contenido), solo se borra la fila; el objeto de S3 se elimina con el último.
+@router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_document(
+    document_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    s3_key = await run_in_threadpool(_delete_document, db, document_id, current_user.get("username"))
+    if s3_key is not None:
+        try:
+            await async_s3_service.delete(s3_key)
+        except Exception as e:
+            # La fila ya no existe: el objeto queda huérfano en S3, pero el borrado es válido
+            print(f"No se pudo eliminar el objeto {s3_key} de S3: {e}")
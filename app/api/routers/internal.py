@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.api.deps import token_cache
+from app.db.database import get_db, get_pool_status, get_replica_status
+from app.db.models import KeyRotationCheckpoint
+from app.jobs import key_rotation
+from app.services.async_s3_service import async_s3_service
+from app.services.key_service import key_service
+
+# Endpoints internos de diagnóstico.
+# No deben publicarse en el balanceador: solo para la red interna / monitorización.
+# main.py los monta tras require_internal_token (Bearer con INTERNAL_API_TOKEN).
+router = APIRouter()
+
+
+@router.get("/db/pool")
+def db_pool_status():
+    return get_pool_status()
+
+
+@router.get("/db/replicas")
+def db_replica_status():
+    return get_replica_status()
+
+
+@router.get("/auth/token-cache")
+def token_cache_status():
+    return token_cache.stats()
+
+
+@router.get("/keys/cache")
+def data_key_cache_status():
+    return key_service.stats()
+
+
+@router.get("/cache/objects")
+def object_cache_status():
+    if async_s3_service.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **async_s3_service.cache.stats()}
+
+
+@router.get("/keys/rotation")
+def key_rotation_status(db: Session = Depends(get_db)):
+    # Progreso de `python -m app.jobs.key_rotation` (se lee del checkpoint en la BD)
+    checkpoint = db.scalars(
+        select(KeyRotationCheckpoint).where(KeyRotationCheckpoint.job == key_rotation.JOB_NAME)
+    ).first()
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="No se ha ejecutado ninguna rotación de claves")
+    return key_rotation.progress(checkpoint)
@@ -0,0 +1,109 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+# Esquemas de las respuestas de la API. Además de documentarla en OpenAPI, con un
+# response_model FastAPI serializa la respuesta con pydantic en vez de con el camino
+# genérico (jsonable_encoder + json.dumps), que es bastante más lento.
+
+
+# --- Sistema ---
+
+class HealthStatus(BaseModel):
+    status: str
+    message: str
+
+
+# --- Usuarios y tokens ---
+
+class UserCreated(BaseModel):
+    message: str
+    user: str
+
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+
+
+class CurrentUser(BaseModel):
+    username: str
+
+
+class CurrentUserResponse(BaseModel):
+    message: str
+    user: CurrentUser
+
+
+# --- Documentos ---
+
+class DocumentItem(BaseModel):
+    id: int
+    name: str
+    # NULL en documentos anteriores a la columna size
+    size: Optional[int] = None
+    encrypted: Optional[bool] = None
+    uploaded_at: Optional[datetime] = None
+
+
+class DocumentPage(BaseModel):
+    user_requesting: str
+    documents: List[DocumentItem]
+    next_cursor: Optional[str] = None
+
+
+class SearchHitItem(DocumentItem):
+    match: str
+    score: float
+
+
+class SearchPage(BaseModel):
+    query: str
+    documents: List[SearchHitItem]
+    next_offset: Optional[int] = None
+
+
+class StorageUsage(BaseModel):
+    document_count: int
+    bytes_used: int
+    bytes_stored: int
+    # None: sin límite
+    quota_bytes: Optional[int] = None
+    bytes_available: Optional[int] = None
+
+
+class BatchFileResult(BaseModel):
+    filename: Optional[str] = None
+    status: str
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class BatchUploadResult(BaseModel):
+    uploaded: int
+    failed: int
+    results: List[BatchFileResult]
+
+
+class UploadPart(BaseModel):
+    part_number: int
+    url: str
+
+
+class DirectUploadStarted(BaseModel):
+    upload_id: int
+    part_size: int
+    expires_in: int
+    parts: List[UploadPart]
+
+
+class DirectUploadCompleted(BaseModel):
+    id: int
+    name: str
+    size: int
+
+
+class DownloadUrl(BaseModel):
+    url: str
+    expires_in: int
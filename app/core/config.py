@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Carga las variables de entorno desde un archivo .env si existe
@@ -10,7 +11,119 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "una-clave-secreta-muy-larga-y-compleja-para-desarrollo")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Token (Bearer) de los endpoints internos: /internal/* y /metrics. Sin él esos
+    # endpoints no existen (404): nunca quedan abiertos por olvidar configurarlo.
+    INTERNAL_API_TOKEN: str = os.getenv("INTERNAL_API_TOKEN", "")
+    # --- Hash de contraseñas (PBKDF2) ---
+    # Rondas de pbkdf2_sha256. Si se suben, los hashes antiguos se recalculan en el siguiente login.
+    PASSWORD_HASH_ROUNDS: int = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+    # Hilos dedicados al hash y máximo de operaciones en cola antes de responder 503
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+    # Número máximo de tokens verificados que se guardan en memoria (0 desactiva la caché)
+    TOKEN_CACHE_MAX_SIZE: int = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
     
+    # Crear las tablas al arrancar la app. Por defecto no: el esquema se crea con
+    # `python -m app.db.init_db` como paso explícito del despliegue.
+    DB_CREATE_SCHEMA_ON_STARTUP: bool = os.getenv("DB_CREATE_SCHEMA_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+    # --- Pool de conexiones a la base de datos ---
+    # DB_POOL_SIZE conexiones permanentes + hasta DB_MAX_OVERFLOW extra en picos;
+    # si no hay ninguna libre se espera DB_POOL_TIMEOUT segundos antes de fallar.
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    # Con pgbouncer en modo "transaction" el pooling lo hace pgbouncer: la app no guarda
+    # conexiones abiertas (NullPool) ni hace pre-ping contra conexiones que ya no son suyas.
+    DB_PGBOUNCER_MODE: bool = os.getenv("DB_PGBOUNCER_MODE", "false").lower() in ("1", "true", "yes")
+
+    # --- Réplicas de lectura (DATABASE_REPLICA_URLS, ver app/db/replicas.py) ---
+    # Una réplica con más retraso que DB_REPLICA_MAX_LAG_SECONDS no recibe lecturas; su
+    # estado se comprueba como mucho cada DB_REPLICA_CHECK_INTERVAL_SECONDS.
+    DB_REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+    DB_REPLICA_CHECK_INTERVAL_SECONDS: float = float(os.getenv("DB_REPLICA_CHECK_INTERVAL_SECONDS", "5"))
+    DB_REPLICA_CONNECT_TIMEOUT: int = int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2"))
+
+    # --- Subida por lotes ---
+    # Máximo de archivos por petición, archivos en vuelo a la vez (limita la memoria)
+    # e hilos dedicados al cifrado (la parte de CPU del pipeline).
+    BATCH_UPLOAD_MAX_FILES: int = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "500"))
+    BATCH_UPLOAD_MAX_IN_FLIGHT: int = int(os.getenv("BATCH_UPLOAD_MAX_IN_FLIGHT", "16"))
+    ENCRYPTION_WORKERS: int = int(os.getenv("ENCRYPTION_WORKERS", str(os.cpu_count() or 2)))
+
+    # --- Compresión antes del cifrado ---
+    # "zlib", "zstd" o "none". Solo se comprimen los documentos cuya muestra inicial
+    # baja al menos hasta COMPRESSION_MAX_RATIO.
+    # Desactivada por defecto: un documento comprimido se descarga siempre completo
+    # (sin Range ni Content-Length), así que solo compensa si importa más el espacio en S3.
+    COMPRESSION_CODEC: str = os.getenv("COMPRESSION_CODEC", "none")
+    COMPRESSION_LEVEL: int = int(os.getenv("COMPRESSION_LEVEL", "3"))
+    COMPRESSION_MAX_RATIO: float = float(os.getenv("COMPRESSION_MAX_RATIO", "0.9"))
+
+    # --- Deduplicación ---
+    # Un archivo idéntico a otro del mismo usuario no se vuelve a cifrar ni a subir:
+    # el nuevo documento apunta al objeto existente en S3.
+    DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Secreto de las huellas de contenido, obligatorio con DEDUP_ENABLED (la app no arranca
+    # sin él). No se rota con ENCRYPTION_KEYS: si cambia, el contenido ya indexado deja de
+    # reconocerse.
+    DEDUP_FINGERPRINT_KEY: str = os.getenv("DEDUP_FINGERPRINT_KEY", "")
+
+    # --- Exportación en ZIP ---
+    # Documentos que se descargan por adelantado mientras se escribe el actual
+    # y trozos descifrados que cada uno puede tener en cola (la memoria queda acotada por ambos).
+    EXPORT_PREFETCH_WINDOW: int = int(os.getenv("EXPORT_PREFETCH_WINDOW", "4"))
+    EXPORT_PREFETCH_CHUNKS: int = int(os.getenv("EXPORT_PREFETCH_CHUNKS", "4"))
+
+    # --- Cifrado envolvente (una clave de datos por documento) ---
+    # "local": las claves de datos se envuelven con ENCRYPTION_KEY. "kms": con la clave KMS_KEY_ID.
+    KEY_PROVIDER: str = os.getenv("KEY_PROVIDER", "local")
+    KMS_KEY_ID: str = os.getenv("KMS_KEY_ID", "")
+    # Caché de claves de datos ya desenvueltas: tamaño, vida máxima y usos máximos por entrada
+    DATA_KEY_CACHE_MAX_SIZE: int = int(os.getenv("DATA_KEY_CACHE_MAX_SIZE", "1000"))
+    DATA_KEY_CACHE_TTL_SECONDS: int = int(os.getenv("DATA_KEY_CACHE_TTL_SECONDS", "300"))
+    DATA_KEY_CACHE_MAX_USES: int = int(os.getenv("DATA_KEY_CACHE_MAX_USES", "1000"))
+
+    # --- Rotación de claves (python -m app.jobs.key_rotation) ---
+    # Documentos por lote (y por checkpoint), objetos re-cifrados en paralelo y máximo
+    # de objetos re-cifrados por segundo (0: sin límite) para no saturar S3 ni la BD.
+    KEY_ROTATION_BATCH_SIZE: int = int(os.getenv("KEY_ROTATION_BATCH_SIZE", "100"))
+    KEY_ROTATION_WORKERS: int = int(os.getenv("KEY_ROTATION_WORKERS", "4"))
+    KEY_ROTATION_MAX_OBJECTS_PER_SECOND: float = float(os.getenv("KEY_ROTATION_MAX_OBJECTS_PER_SECOND", "10"))
+
+    # --- Cuotas de almacenamiento ---
+    # Bytes (de los documentos originales) que puede guardar cada usuario; 0: sin límite.
+    # Se puede fijar otra por usuario en user_usage.quota_bytes.
+    STORAGE_QUOTA_BYTES: int = int(os.getenv("STORAGE_QUOTA_BYTES", "0"))
+
+    # --- Búsqueda por nombre (GET /documents/search) ---
+    # Similitud mínima de trigramas (0-1) para que un nombre cuente como coincidencia con erratas
+    SEARCH_SIMILARITY_THRESHOLD: float = float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", "0.3"))
+
+    # --- Compresión de las respuestas ---
+    # Los listados (GET /documents y /documents/search) cuyo JSON ocupa al menos estos
+    # bytes se comprimen con gzip o zstd si el cliente lo acepta; 0: nunca.
+    RESPONSE_COMPRESSION_MIN_BYTES: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "4096"))
+
+    # --- Caché en disco de objetos cifrados ---
+    # Bytes de disco para guardar los objetos de S3 más descargados (0: desactivada) y
+    # tamaño máximo de cada objeto que se guarda. Solo guarda el objeto cifrado. El límite
+    # es de cada worker: cada uno usa su propio subdirectorio de OBJECT_CACHE_DIR.
+    OBJECT_CACHE_MAX_BYTES: int = int(os.getenv("OBJECT_CACHE_MAX_BYTES", "0"))
+    OBJECT_CACHE_MAX_OBJECT_BYTES: int = int(os.getenv("OBJECT_CACHE_MAX_OBJECT_BYTES", str(64 * 1024 * 1024)))
+    OBJECT_CACHE_DIR: str = os.getenv(
+        "OBJECT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "document-vault-object-cache")
+    )
+
+    # --- Recolección de objetos huérfanos (python -m app.jobs.orphan_gc) ---
+    # Antigüedad mínima de un objeto sin fila para borrarlo (las subidas en curso aún no
+    # tienen fila) y claves por página al listar S3 y la BD.
+    ORPHAN_GC_GRACE_SECONDS: int = int(os.getenv("ORPHAN_GC_GRACE_SECONDS", str(24 * 3600)))
+    ORPHAN_GC_PAGE_SIZE: int = int(os.getenv("ORPHAN_GC_PAGE_SIZE", "1000"))
+
     # --- NUEVO: Configuraciones de AWS ---
     # En un entorno real, estas claves NUNCA deben estar en el código.
     # Deben venir de las variables de entorno o de un servicio como AWS Secrets Manager.
@@ -20,4 +133,31 @@ class Settings:
     AWS_REGION: str = os.getenv("AWS_REGION", "eu-west-1") # Cambia esto por tu región
     AWS_BUCKET_NAME: str = os.getenv("AWS_BUCKET_NAME", "mi-bucket-document-vault-test")
 
+    # --- Pool de conexiones a S3 compartido por el servicio síncrono y el asíncrono ---
+    S3_MAX_POOL_CONNECTIONS: int = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32"))
+    # Límite de operaciones simultáneas por tipo en AsyncS3Service
+    S3_MAX_CONCURRENT_UPLOADS: int = int(os.getenv("S3_MAX_CONCURRENT_UPLOADS", "8"))
+    S3_MAX_CONCURRENT_DOWNLOADS: int = int(os.getenv("S3_MAX_CONCURRENT_DOWNLOADS", "16"))
+    S3_MAX_CONCURRENT_DELETES: int = int(os.getenv("S3_MAX_CONCURRENT_DELETES", "8"))
+    S3_MAX_CONCURRENT_LISTS: int = int(os.getenv("S3_MAX_CONCURRENT_LISTS", "4"))
+
+    # --- Subida multiparte a S3 ---
+    # Tamaño de cada parte (mínimo 5 MiB impuesto por S3) y número de partes subiendo a la vez.
+    # La memoria usada por una subida es aproximadamente S3_MULTIPART_WORKERS × S3_MULTIPART_PART_SIZE.
+    S3_MULTIPART_PART_SIZE: int = int(os.getenv("S3_MULTIPART_PART_SIZE", str(8 * 1024 * 1024)))
+    S3_MULTIPART_WORKERS: int = int(os.getenv("S3_MULTIPART_WORKERS", "4"))
+    S3_MULTIPART_MAX_RETRIES: int = int(os.getenv("S3_MULTIPART_MAX_RETRIES", "3"))
+
+    # --- Modo de transferencia ---
+    # "proxied": los archivos pasan por la API, que los cifra (comportamiento clásico).
+    # "direct": el cliente sube y descarga contra S3 con URLs prefirmadas; cifra S3 (SSE-KMS).
+    # "both": cada subida elige su modo según el endpoint que use, y queda anotado en el documento.
+    TRANSFER_MODE: str = os.getenv("TRANSFER_MODE", "proxied").lower()
+    # Clave KMS de SSE-KMS para los objetos de transferencia directa (vacía: la aws/s3 de la cuenta)
+    S3_SSE_KMS_KEY_ID: str = os.getenv("S3_SSE_KMS_KEY_ID", "")
+    PRESIGNED_URL_EXPIRES_SECONDS: int = int(os.getenv("PRESIGNED_URL_EXPIRES_SECONDS", "900"))
+    # Subidas directas sin completar: pasado este tiempo el barrido de app.jobs.orphan_gc
+    # las aborta en S3 (sus partes ocupan espacio facturado) y borra su fila.
+    DIRECT_UPLOAD_TTL_SECONDS: int = int(os.getenv("DIRECT_UPLOAD_TTL_SECONDS", str(24 * 3600)))
+
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,310 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# --- Métricas (formato de exposición de Prometheus) ---
+# Contadores, gauges e histogramas en memoria del proceso, sin dependencias externas.
+# Registrar una observación es una búsqueda binaria en los límites del histograma y
+# unas sumas bajo un lock: del orden de un microsegundo, apto para cada petición.
+# Las etiquetas deben tener pocos valores posibles (plantilla de la ruta, no la URL).
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Líneas del formato de exposición (cabecera incluida)."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Pone a cero todas las series."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por cada combinación de etiquetas: [cuenta por cubo..., cubo +Inf, suma, total]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *labelvalues: str) -> "Timer":
+        return Timer(self, labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        with self._lock:
+            series = self._series.get(labelvalues)
+            return series[-1] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        lines = self._header()
+        for labels, values in series:
+            cumulative = 0
+            for limit, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = f'le="{_format_value(limit)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{label_text} {values[-1]}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Timer:
+    """Context manager que observa en un histograma la duración del bloque (también si falla)."""
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> "Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """Función que genera líneas adicionales al exportar (estado leído en ese momento)."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"Error recogiendo métricas: {e!r}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+registry = MetricsRegistry()
+
+# --- Métricas de la aplicación ---
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "Peticiones HTTP atendidas.", ("method", "route", "status")
+)
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP.", ("method", "route")
+)
+HTTP_IN_PROGRESS = registry.gauge("http_requests_in_progress", "Peticiones HTTP en curso.")
+
+S3_LATENCY = registry.histogram(
+    "s3_request_duration_seconds", "Duración de las llamadas a la API de S3.", ("operation",)
+)
+S3_ERRORS = registry.counter("s3_errors_total", "Llamadas a S3 fallidas.", ("operation",))
+
+ENCRYPTION_LATENCY = registry.histogram(
+    "encryption_duration_seconds",
+    "Duración del cifrado/descifrado de documentos completos.",
+    ("operation",),
+)
+ENCRYPTION_BYTES = registry.counter(
+    "encryption_bytes_total", "Bytes procesados por el cifrado por segmentos.", ("operation",)
+)
+ENCRYPTION_SECONDS = registry.counter(
+    "encryption_seconds_total", "Tiempo de CPU en el cifrado por segmentos.", ("operation",)
+)
+
+PASSWORD_VERIFY_LATENCY = registry.histogram(
+    "password_verify_duration_seconds", "Duración de la verificación de contraseñas (PBKDF2)."
+)
+AUTH_FAILURES = registry.counter(
+    "auth_failures_total", "Fallos de autenticación.", ("reason",)
+)
+
+DB_QUERY_LATENCY = registry.histogram(
+    "db_query_duration_seconds", "Duración de las sentencias SQL.", ("statement",)
+)
+DB_READ_SESSIONS = registry.counter(
+    "db_read_sessions_total", "Sesiones de solo lectura según dónde leyeron (réplica o primario).", ("target",)
+)
+
+
+def statement_kind(statement: str) -> str:
+    """Tipo de sentencia SQL (SELECT, INSERT...) para usarlo como etiqueta."""
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return kind if kind in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+# Middleware ASGI puro (sin BaseHTTPMiddleware, que añade una tarea y colas por petición).
+# La ruta se etiqueta con su plantilla (/documents/{document_id}/content), que FastAPI
+# deja en scope["route"] al enrutar; las URLs que no casan con ninguna van a "unmatched".
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_PROGRESS.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_LATENCY.observe(elapsed, method, route_path)
+            HTTP_REQUESTS.inc(method, route_path, str(status_code))
+
+
+def gauge_lines(name: str, documentation: str, values: Dict[str, Optional[float]]) -> List[str]:
+    """Líneas de un gauge sin etiquetas por cada valor de `values` (para los collectors)."""
+    lines = []
+    for suffix, value in values.items():
+        if value is None:
+            continue
+        metric_name = f"{name}_{suffix}"
+        lines += [f"# HELP {metric_name} {documentation}", f"# TYPE {metric_name} gauge", f"{metric_name} {value}"]
+    return lines
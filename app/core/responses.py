@@ -0,0 +1,95 @@
+import gzip
+from typing import Any, Dict, Optional
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+# --- Serialización JSON de las respuestas ---
+# FastJSONResponse es la clase por defecto de la app. En los endpoints con
+# response_model, pydantic convierte la respuesta a tipos JSON (sin jsonable_encoder, que
+# recorre el objeto en Python puro) y esta clase la escribe con orjson (dependencia de
+# requirements.txt; si faltara, con el json de la biblioteca estándar).
+#
+# Los listados, que son las respuestas grandes, se saltan también ese paso: model_response
+# los serializa directamente a bytes con el núcleo de pydantic y, cuando el JSON pasa de
+# RESPONSE_COMPRESSION_MIN_BYTES, los comprime (gzip, o zstd si el cliente lo acepta).
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depende del entorno
+    zstandard = None
+
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def available_encodings() -> tuple:
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Codificación a usar según Accept-Encoding (zstd antes que gzip); None: sin comprimir."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for encoding in available_encodings():
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    # Cada codificación es una representación distinta y necesita su propio ETag fuerte
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def model_response(
+    model: BaseModel,
+    accept_encoding: Optional[str],
+    min_bytes: int,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Serializa `model` con pydantic y lo comprime si el JSON ocupa al menos `min_bytes`
+    (0: nunca) y el cliente acepta alguna codificación disponible. Si hay ETag en
+    `headers`, en la respuesta comprimida lleva el sufijo de la codificación.
+    """
+    body = to_json(model)
+    headers = dict(headers or {})
+    encoding = negotiate_encoding(accept_encoding) if 0 < min_bytes <= len(body) else None
+    if encoding is not None:
+        body = compress_body(body, encoding)
+        headers["Content-Encoding"] = encoding
+        if "ETag" in headers:
+            headers["ETag"] = encoded_etag(headers["ETag"], encoding)
+    return Response(content=body, media_type="application/json", headers=headers)
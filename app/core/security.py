@@ -1,23 +1,103 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 
 import jwt
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.metrics import PASSWORD_VERIFY_LATENCY
 
-# Esquema estable en CI y sin límite de 72 bytes de bcrypt
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Esquema estable en CI y sin límite de 72 bytes de bcrypt.
+# min_rounds = default_rounds: cualquier hash con menos rondas que las configuradas
+# se considera desactualizado y se recalcula de forma transparente en el login.
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=settings.PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with PASSWORD_VERIFY_LATENCY.time():
+        return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    with PASSWORD_VERIFY_LATENCY.time():
+        return pwd_context.verify_and_update(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+# Servicio de hash de contraseñas fuera de los hilos de las peticiones.
+#
+# PBKDF2 con muchas rondas tarda decenas de milisegundos por llamada. Ejecutado dentro
+# de los handlers, una ráfaga de logins ocupaba todo el threadpool de Starlette y
+# endpoints sin relación (ej. /health) esperaban. Aquí el hash corre en un pool de hilos
+# propio (hashlib.pbkdf2_hmac libera el GIL, así que los hilos trabajan en paralelo)
+# con un número máximo de operaciones pendientes: si se supera, se responde 503 al
+# momento en lugar de acumular una cola que solo aumentaría la latencia.
+class PasswordHashingService:
+    def __init__(self, max_workers: int, max_pending: int):
+        self._max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="pwd-hash"
+                )
+            return self._executor
+
+    def _submit(self, func, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servicio de autenticación saturado, inténtalo de nuevo en unos segundos",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifica la contraseña y, si el hash está desactualizado, devuelve también el nuevo hash.
+        """
+        return await asyncio.wrap_future(
+            self._submit(verify_and_update_password, plain_password, hashed_password)
+        )
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(pwd_context.hash, password))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+password_hasher = PasswordHashingService(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -0,0 +1,72 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+# Caché en proceso de tokens JWT ya verificados.
+#
+# get_current_user se ejecuta en cada petición autenticada y jwt.decode (HMAC + parseo
+# de claims) es una parte medible del consumo de CPU con clientes que hacen polling.
+# Si el mismo token vuelve a llegar, reutilizamos el resultado de la verificación.
+#
+# - La clave es el SHA-256 del token COMPLETO (cabecera, payload y firma): cualquier
+#   token manipulado produce otra clave y pasa por la verificación criptográfica.
+# - Cada entrada caduca en el `exp` del propio token, nunca después.
+# - El tamaño está acotado con expulsión LRU.
+class VerifiedTokenCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            token_data, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return token_data
+
+    def put(self, token: str, token_data: dict, expires_at: Optional[float]) -> None:
+        # Los tokens sin `exp` no se cachean: no sabríamos hasta cuándo son válidos
+        if self.max_size <= 0 or expires_at is None:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (token_data, float(expires_at))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
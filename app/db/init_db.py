@@ -0,0 +1,18 @@
+"""
+Creación explícita del esquema de la base de datos.
+
+Antes las tablas se creaban al importar app.main; ahora es un paso separado:
+    python -m app.db.init_db
+(o DB_CREATE_SCHEMA_ON_STARTUP=true para hacerlo en el arranque de la app).
+"""
+from app.db.database import Base, get_engine
+from app.db import models  # noqa: F401  (registra los modelos en Base.metadata)
+
+
+def init_db() -> None:
+    Base.metadata.create_all(bind=get_engine())
+
+
+if __name__ == "__main__":
+    init_db()
+    print("Esquema de la base de datos creado/actualizado.")
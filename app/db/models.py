@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import DDL, BigInteger, Column, Integer, String, Boolean, DateTime, ForeignKey, Index, LargeBinary, UniqueConstraint, event
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.db.database import Base
@@ -24,9 +24,140 @@ class Document(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True, nullable=False)
-    s3_key = Column(String, unique=True, nullable=True) # Lo usaremos con AWS
+    # No es único: con la deduplicación varios documentos pueden apuntar al mismo objeto
+    s3_key = Column(String, index=True, nullable=True) # Lo usaremos con AWS
     upload_date = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     is_encrypted = Column(Boolean, default=True)
+    # Cifrado envolvente: clave de datos del documento, envuelta por el proveedor de claves.
+    # NULL en documentos antiguos, cifrados directamente con la clave global.
+    wrapped_key = Column(LargeBinary, nullable=True)
+    key_provider = Column(String(32), nullable=True)
+    # "proxied": cifrado por la app (formato por segmentos o Fernet).
+    # "direct": subido por el cliente con URLs prefirmadas y cifrado por S3 (SSE-KMS).
+    transfer_mode = Column(String(16), nullable=False, default="proxied", server_default="proxied")
+    # Tamaño del documento original y del objeto guardado en S3 (cifrado y quizá comprimido).
+    # NULL en documentos anteriores a estas columnas (python -m app.jobs.usage_reconcile --backfill).
+    size = Column(BigInteger, nullable=True)
+    stored_size = Column(BigInteger, nullable=True)
+    # SHA-256 (hex) del objeto cifrado: ETag del contenido. NULL en documentos antiguos
+    # y de transferencia directa (la app no ve sus bytes).
+    checksum = Column(String(64), nullable=True)
     
     owner_id = Column(Integer, ForeignKey("users.id"))
-    owner = relationship("User", back_populates="documents")
\ No newline at end of file
+    owner = relationship("User", back_populates="documents")
+
+    # Índice compuesto para el listado paginado por cursor (keyset):
+    # WHERE owner_id = ? AND (upload_date, id) < (?, ?) ORDER BY upload_date DESC, id DESC
+    # se resuelve recorriendo solo las filas de la página, sin OFFSET.
+    __table_args__ = (
+        Index("ix_documents_owner_upload_date_id", "owner_id", "upload_date", "id"),
+        # Búsqueda por nombre (GET /documents/search): índice de trigramas (pg_trgm) que
+        # sirve a ILIKE '%texto%' y a la similitud (%>), donde el B-tree no ayuda.
+        # Solo en PostgreSQL; en SQLite la búsqueda se resuelve en Python.
+        Index(
+            "ix_documents_filename_trgm",
+            "filename",
+            postgresql_using="gin",
+            postgresql_ops={"filename": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+# La extensión pg_trgm tiene que existir antes de crear el índice de trigramas
+event.listen(
+    Document.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+class DedupEntry(Base):
+    """
+    Índice de deduplicación: un objeto cifrado en S3 por cada contenido distinto de
+    cada usuario. `content_hash` es un HMAC del texto plano con una clave derivada de
+    DEDUP_FINGERPRINT_KEY y del usuario (no un hash simple: no revela el contenido ni permite
+    comparar archivos entre usuarios). `ref_count` cuenta los Document que lo usan.
+    """
+    __tablename__ = "dedup_index"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    content_hash = Column(LargeBinary(32), nullable=False)
+    s3_key = Column(String, unique=True, nullable=False)
+    wrapped_key = Column(LargeBinary, nullable=True)
+    key_provider = Column(String(32), nullable=True)
+    ref_count = Column(Integer, nullable=False, default=1)
+    # Tamaños y checksum del objeto, para anotarlos en los documentos que lo reutilizan
+    size = Column(BigInteger, nullable=True)
+    stored_size = Column(BigInteger, nullable=True)
+    checksum = Column(String(64), nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        UniqueConstraint("owner_id", "content_hash", name="uq_dedup_index_owner_hash"),
+    )
+
+
+class DirectUpload(Base):
+    """
+    Subida directa a S3 iniciada y aún no completada. Guarda la subida multiparte
+    (s3_key, upload_id) del lado del servidor: el cliente solo conoce el id de esta
+    fila, así no puede registrar como suyo un objeto que no haya iniciado él.
+    """
+    __tablename__ = "direct_uploads"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    s3_key = Column(String, unique=True, nullable=False)
+    upload_id = Column(String, nullable=False)
+    # Tamaño anunciado al iniciar: al completar se comprueba contra lo recibido
+    size = Column(BigInteger, nullable=False)
+    part_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class UserUsage(Base):
+    """
+    Uso de almacenamiento de cada usuario, precalculado: se actualiza en la misma
+    transacción que inserta o borra sus documentos, así las comprobaciones de cuota leen
+    una fila en vez de sumar todos sus documentos. Cada documento cuenta entero aunque
+    comparta objeto por deduplicación. `python -m app.jobs.usage_reconcile` lo recalcula.
+    """
+    __tablename__ = "user_usage"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    document_count = Column(Integer, nullable=False, default=0)
+    # Bytes de los documentos originales (lo que cuenta para la cuota) y bytes en S3
+    bytes_used = Column(BigInteger, nullable=False, default=0)
+    bytes_stored = Column(BigInteger, nullable=False, default=0)
+    # Cuota propia del usuario en bytes; NULL: la general (STORAGE_QUOTA_BYTES)
+    quota_bytes = Column(BigInteger, nullable=True)
+    # Sube con cada cambio en los documentos del usuario: ETag del listado
+    documents_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class KeyRotationCheckpoint(Base):
+    """
+    Progreso de la rotación de claves (app/jobs/key_rotation.py). Se actualiza en la
+    misma transacción que cada lote de documentos migrados: tras una caída el trabajo
+    sigue desde `last_document_id`. `target_key` identifica la clave principal a la
+    que se está migrando (una huella, nunca la clave).
+    """
+    __tablename__ = "key_rotation_checkpoints"
+
+    id = Column(Integer, primary_key=True)
+    job = Column(String(64), unique=True, nullable=False)
+    target_key = Column(String(64), nullable=False)
+    last_document_id = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    reencrypted = Column(Integer, nullable=False, default=0)
+    rewrapped = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    bytes_reencrypted = Column(BigInteger, nullable=False, default=0)
+    started_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime, nullable=True)
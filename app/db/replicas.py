@@ -0,0 +1,162 @@
+import itertools
+import threading
+import time
+from typing import Callable, List, Optional
+
+from sqlalchemy import Select, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core.metrics import DB_READ_SESSIONS
+
+# --- Réplicas de lectura ---
+# Los endpoints de solo lectura (listado, búsqueda, uso) usan RoutingSession: sus SELECT
+# van a una réplica y todo lo demás al primario.
+#
+# - Reparto: round-robin entre las réplicas disponibles. Cada sesión (una petición) se
+#   queda con la misma réplica, así todas sus consultas ven el mismo estado.
+# - Disponibilidad: cada réplica se comprueba como mucho una vez cada `check_interval`
+#   segundos, desde la propia petición que la necesita (sin hilos de fondo). Si no
+#   responde o su retraso pasa de `max_lag` segundos, se deja de usar hasta la siguiente
+#   comprobación; sin réplicas disponibles se lee del primario.
+# - Leer lo escrito: en cuanto la sesión escribe (flush, INSERT/UPDATE/DELETE, SELECT ...
+#   FOR UPDATE o cualquier sentencia que no sea un SELECT) queda fijada al primario para
+#   el resto de la petición.
+
+# Retraso de la réplica en segundos. Si ha aplicado todo lo recibido, 0: con el primario
+# sin escrituras pg_last_xact_replay_timestamp() envejece sin que haya retraso real.
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replica_lag(connection) -> float:
+    """Segundos de retraso de la réplica (0 en bases que no son PostgreSQL)."""
+    if connection.dialect.name != "postgresql":
+        return 0.0
+    return float(connection.execute(_PG_LAG_SQL).scalar() or 0)
+
+
+class Replica:
+    def __init__(self, url: str, engine_factory: Callable[[str], Engine]):
+        self.url = url
+        self._engine_factory = engine_factory
+        self._engine: Optional[Engine] = None
+        self._engine_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.checked_at = float("-inf")
+
+    @property
+    def engine(self) -> Engine:
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    engine = self._engine_factory(self.url)
+                    # Un error de conexión en plena consulta la retira hasta la próxima comprobación
+                    event.listen(engine, "handle_error", self._on_error)
+                    self._engine = engine
+        return self._engine
+
+    def _on_error(self, context) -> None:
+        if context.is_disconnect:
+            self.mark_down(str(context.original_exception))
+
+    def mark_down(self, reason: str) -> None:
+        print(f"Réplica de lectura no disponible: {reason}")
+        self.healthy = False
+        self.last_error = reason
+        self.checked_at = time.monotonic()
+
+    def available(self, max_lag: float, check_interval: float) -> bool:
+        # Solo una petición comprueba cada vez; las demás usan el último resultado
+        if time.monotonic() - self.checked_at >= check_interval and self._check_lock.acquire(blocking=False):
+            try:
+                self._check(max_lag)
+            finally:
+                self._check_lock.release()
+        return self.healthy
+
+    def _check(self, max_lag: float) -> None:
+        try:
+            with self.engine.connect() as connection:
+                self.lag = replica_lag(connection)
+        except Exception as e:
+            self.lag = None
+            self.mark_down(repr(e))
+            return
+        self.healthy = self.lag <= max_lag
+        self.last_error = None if self.healthy else f"retraso de {self.lag:.1f} s"
+        self.checked_at = time.monotonic()
+
+    def dispose(self) -> None:
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
+
+    def status(self) -> dict:
+        return {"healthy": self.healthy, "lag_seconds": self.lag, "last_error": self.last_error}
+
+
+class ReplicaRouter:
+    def __init__(
+        self,
+        urls: List[str],
+        engine_factory: Callable[[str], Engine],
+        max_lag: float,
+        check_interval: float,
+    ):
+        self.replicas = [Replica(url, engine_factory) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = itertools.count()
+
+    def choose(self) -> Optional[Engine]:
+        """Engine de una réplica disponible, o None si hay que leer del primario."""
+        available = [r for r in self.replicas if r.available(self.max_lag, self.check_interval)]
+        if not available:
+            return None
+        return available[next(self._next) % len(available)].engine
+
+    def dispose(self) -> None:
+        for replica in self.replicas:
+            replica.dispose()
+
+    def status(self) -> List[dict]:
+        # Sin credenciales: solo el número de réplica y su estado
+        return [{"replica": index, **replica.status()} for index, replica in enumerate(self.replicas)]
+
+
+class RoutingSession(Session):
+    """
+    Sesión para endpoints de solo lectura: los SELECT van a una réplica (ver
+    ReplicaRouter) y, desde la primera escritura, todo va al primario.
+    """
+
+    def __init__(self, *args, router: Optional[ReplicaRouter] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.router = router
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        primary = super().get_bind(mapper=mapper, clause=clause, **kw)
+        if self.router is None:
+            return primary
+        if clause is None and not self._flushing:
+            # get_bind() sin sentencia (p. ej. para mirar el dialecto): primario, sin fijarlo
+            return primary
+        # El flush pide la conexión sin sentencia (clause=None): ese sí fija el primario
+        if self.info.get("primary") or not _is_plain_select(clause):
+            self.info["primary"] = True
+            return primary
+        if "replica" not in self.info:
+            replica = self.router.choose()
+            DB_READ_SESSIONS.inc("replica" if replica is not None else "primary")
+            self.info["replica"] = replica
+        return self.info["replica"] or primary
+
+
+def _is_plain_select(clause) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
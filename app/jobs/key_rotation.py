@@ -0,0 +1,369 @@
+"""
+Rotación de claves: migra todos los documentos a la clave principal.
+
+Con ENCRYPTION_KEYS="nueva,antigua" la app ya cifra con la nueva y sigue leyendo lo
+cifrado con la antigua. Este trabajo recorre la tabla documents por lotes y deja cada
+documento dependiendo solo de la clave principal, para poder retirar la antigua:
+
+- Documentos con cifrado envolvente local: solo se vuelve a envolver su clave de datos
+  con la clave principal (una actualización en la BD, sin tocar S3).
+- Documentos antiguos cifrados directamente con la clave global (Fernet o formato por
+  segmentos sin clave de datos): se descargan, se descifran y se vuelven a cifrar con
+  una clave de datos nueva en un objeto nuevo; la fila pasa a apuntar al objeto nuevo
+  y el antiguo se borra después de confirmar la transacción.
+- Documentos con KMS o de transferencia directa (SSE-KMS) no dependen de ENCRYPTION_KEY.
+
+Los objetos se re-cifran en paralelo (KEY_ROTATION_WORKERS) con un límite de objetos por
+segundo (KEY_ROTATION_MAX_OBJECTS_PER_SECOND). Cada lote se confirma junto con el
+checkpoint, así que tras una caída o un SIGTERM el trabajo sigue desde el último lote.
+Repetir un documento ya migrado no hace nada: se detecta y se salta.
+
+Uso:
+    python -m app.jobs.key_rotation
+    python -m app.jobs.key_rotation --restart --workers 8 --rate 20
+"""
+import argparse
+import hashlib
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import DedupEntry, Document, KeyRotationCheckpoint
+from app.services.direct_transfer_service import TRANSFER_DIRECT
+from app.services import usage_service
+from app.services.document_service import CiphertextMeter, compression_options
+from app.services.encryption_service import decrypt_stream, encrypt_stream, master_key_material
+from app.services.key_service import EnvelopeKeyService, LocalKeyProvider, key_service
+from app.services.s3_services import S3Service, s3_service
+
+JOB_NAME = "key-rotation"
+
+REWRAPPED = "rewrapped"
+REENCRYPTED = "reencrypted"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+def key_fingerprint(material: bytes) -> str:
+    """Identificador estable de una clave que no revela nada de ella."""
+    return hashlib.sha256(b"sdv-key-id" + material).hexdigest()[:16]
+
+
+class RateLimiter:
+    """Token bucket: como mucho `rate` adquisiciones por segundo (ráfagas de hasta `burst`)."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class Outcome:
+    document_id: int
+    action: str
+    s3_key: Optional[str] = None
+    new_s3_key: Optional[str] = None
+    old_wrapped: Optional[bytes] = None
+    new_wrapped: Optional[bytes] = None
+    key_provider: Optional[str] = None
+    size: int = 0
+    # Para los re-cifrados: el uso del usuario pasa del tamaño anotado al del objeto nuevo
+    owner_id: Optional[int] = None
+    old_stored_size: int = 0
+    new_size: int = 0
+    new_checksum: Optional[str] = None
+
+
+def progress(checkpoint: KeyRotationCheckpoint, now: Optional[datetime] = None) -> dict:
+    """Estado de la rotación con throughput y tiempo restante estimado."""
+    now = now or datetime.now(timezone.utc)
+    started_at = checkpoint.started_at
+    if started_at.tzinfo is None:
+        started_at = started_at.replace(tzinfo=timezone.utc)
+    end = checkpoint.finished_at or now
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    elapsed = max((end - started_at).total_seconds(), 1e-9)
+    rate = checkpoint.processed / elapsed
+    remaining = max(checkpoint.total - checkpoint.processed, 0)
+    return {
+        "target_key": checkpoint.target_key,
+        "last_document_id": checkpoint.last_document_id,
+        "total": checkpoint.total,
+        "processed": checkpoint.processed,
+        "reencrypted": checkpoint.reencrypted,
+        "rewrapped": checkpoint.rewrapped,
+        "skipped": checkpoint.skipped,
+        "failed": checkpoint.failed,
+        "documents_per_second": round(rate, 2),
+        "mb_per_second": round(checkpoint.bytes_reencrypted / elapsed / (1024 * 1024), 2),
+        "eta_seconds": 0 if checkpoint.finished_at else (round(remaining / rate) if rate else None),
+        "started_at": checkpoint.started_at,
+        "finished_at": checkpoint.finished_at,
+    }
+
+
+class KeyRotationJob:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        storage: S3Service = s3_service,
+        keys: EnvelopeKeyService = key_service,
+        batch_size: int = settings.KEY_ROTATION_BATCH_SIZE,
+        workers: int = settings.KEY_ROTATION_WORKERS,
+        max_objects_per_second: float = settings.KEY_ROTATION_MAX_OBJECTS_PER_SECOND,
+        log: Callable[[str], None] = print,
+    ):
+        self.session_factory = session_factory
+        self.storage = storage
+        self.keys = keys
+        self.local: LocalKeyProvider = keys.providers["local"]
+        self.batch_size = max(batch_size, 1)
+        self.workers = max(workers, 1)
+        self.limiter = RateLimiter(max_objects_per_second)
+        self.log = log
+        self.stop_event = threading.Event()
+
+    # --- Un documento (en un hilo del pool) ---
+
+    def _rotate(self, row) -> Outcome:
+        try:
+            if (
+                row.s3_key is None
+                or row.transfer_mode == TRANSFER_DIRECT
+                or (row.wrapped_key is not None and row.key_provider != "local")
+            ):
+                return Outcome(row.id, SKIPPED)
+            if row.wrapped_key is not None:
+                return self._rewrap(row)
+            return self._reencrypt(row)
+        except Exception as e:
+            print(f"Rotación: error en el documento {row.id}: {e!r}")
+            return Outcome(row.id, FAILED)
+
+    def _rewrap(self, row) -> Outcome:
+        plaintext, index = self.local.unwrap_with_index(row.wrapped_key)
+        if index == 0:
+            return Outcome(row.id, SKIPPED)
+        return Outcome(
+            row.id, REWRAPPED, s3_key=row.s3_key, old_wrapped=row.wrapped_key, new_wrapped=self.local.wrap(plaintext)
+        )
+
+    def _reencrypt(self, row) -> Outcome:
+        self.limiter.acquire()
+        response = self.storage.get_object(row.s3_key)
+        body = response["Body"]
+        try:
+            data_key = self.keys.new_data_key()
+            plaintext = decrypt_stream(body.iter_chunks(256 * 1024))
+            chunks = CiphertextMeter(encrypt_stream(plaintext, key=data_key.plaintext, **compression_options()))
+            new_s3_key = self.storage.upload_stream(chunks, row.filename, row.owner_id)
+        finally:
+            body.close()
+        return Outcome(
+            row.id,
+            REENCRYPTED,
+            s3_key=row.s3_key,
+            new_s3_key=new_s3_key,
+            new_wrapped=data_key.wrapped,
+            key_provider=data_key.provider,
+            size=response["ContentLength"],
+            owner_id=row.owner_id,
+            old_stored_size=row.stored_size or 0,
+            new_size=chunks.total,
+            new_checksum=chunks.checksum,
+        )
+
+    # --- Un lote (en el hilo principal, una transacción) ---
+
+    def _apply(self, db: Session, checkpoint: KeyRotationCheckpoint, outcomes: List[Outcome], last_id: int) -> List[str]:
+        """Aplica el lote y el checkpoint juntos. Devuelve los objetos antiguos a borrar."""
+        superseded = []
+        for outcome in outcomes:
+            if outcome.action == REWRAPPED:
+                # Por clave primaria (y la entrada de deduplicación por su s3_key, única): la
+                # clave envuelta solo confirma que la fila no cambió mientras tanto. Las copias
+                # deduplicadas son otros Document y se re-envuelven al llegarles el turno.
+                db.execute(
+                    update(Document)
+                    .where(
+                        Document.id == outcome.document_id,
+                        Document.wrapped_key == outcome.old_wrapped,
+                        Document.key_provider == "local",
+                    )
+                    .values(wrapped_key=outcome.new_wrapped)
+                )
+                db.execute(
+                    update(DedupEntry)
+                    .where(
+                        DedupEntry.s3_key == outcome.s3_key,
+                        DedupEntry.wrapped_key == outcome.old_wrapped,
+                        DedupEntry.key_provider == "local",
+                    )
+                    .values(wrapped_key=outcome.new_wrapped)
+                )
+            elif outcome.action == REENCRYPTED:
+                moved = db.execute(
+                    update(Document)
+                    .where(Document.s3_key == outcome.s3_key, Document.wrapped_key.is_(None))
+                    .values(
+                        s3_key=outcome.new_s3_key,
+                        wrapped_key=outcome.new_wrapped,
+                        key_provider=outcome.key_provider,
+                        stored_size=outcome.new_size,
+                        checksum=outcome.new_checksum,
+                    )
+                ).rowcount
+                if moved:
+                    superseded.append(outcome.s3_key)
+                    # El objeto nuevo puede medir distinto (p. ej. ahora va comprimido)
+                    usage_service.charge(
+                        db, outcome.owner_id, 0, 0, (outcome.new_size - outcome.old_stored_size) * moved, enforce_quota=False
+                    )
+                else:
+                    # El documento se borró mientras tanto: el objeto nuevo sobra
+                    superseded.append(outcome.new_s3_key)
+
+        counts = {action: 0 for action in (REWRAPPED, REENCRYPTED, SKIPPED, FAILED)}
+        for outcome in outcomes:
+            counts[outcome.action] += 1
+        checkpoint.last_document_id = last_id
+        checkpoint.processed += len(outcomes)
+        checkpoint.rewrapped += counts[REWRAPPED]
+        checkpoint.reencrypted += counts[REENCRYPTED]
+        checkpoint.skipped += counts[SKIPPED]
+        checkpoint.failed += counts[FAILED]
+        checkpoint.bytes_reencrypted += sum(outcome.size for outcome in outcomes)
+        checkpoint.updated_at = datetime.now(timezone.utc)
+        db.commit()
+        return superseded
+
+    def _delete_objects(self, s3_keys: List[str]) -> None:
+        for s3_key in s3_keys:
+            try:
+                self.storage.delete_file(s3_key)
+            except Exception as e:
+                print(f"Rotación: no se pudo eliminar el objeto {s3_key}: {e}")
+
+    def _load_checkpoint(self, db: Session, restart: bool) -> KeyRotationCheckpoint:
+        target = key_fingerprint(master_key_material())
+        checkpoint = db.scalars(select(KeyRotationCheckpoint).where(KeyRotationCheckpoint.job == JOB_NAME)).first()
+        if checkpoint is None:
+            checkpoint = KeyRotationCheckpoint(job=JOB_NAME, target_key=target)
+            db.add(checkpoint)
+            db.flush()
+        elif restart or checkpoint.target_key != target:
+            # Otra clave principal (o reinicio pedido): la rotación empieza de cero
+            checkpoint.target_key = target
+            checkpoint.last_document_id = 0
+            for counter in ("processed", "reencrypted", "rewrapped", "skipped", "failed", "bytes_reencrypted"):
+                setattr(checkpoint, counter, 0)
+            checkpoint.started_at = datetime.now(timezone.utc)
+            checkpoint.finished_at = None
+        elif checkpoint.finished_at is None:
+            self.log(f"Rotación: se reanuda tras el documento {checkpoint.last_document_id}")
+        remaining = db.scalar(select(func.count(Document.id)).where(Document.id > checkpoint.last_document_id))
+        checkpoint.total = checkpoint.processed + remaining
+        if remaining:
+            checkpoint.finished_at = None
+        db.commit()
+        return checkpoint
+
+    def run(self, restart: bool = False) -> dict:
+        """Ejecuta (o reanuda) la rotación hasta el final o hasta stop_event. Devuelve el progreso."""
+        with self.session_factory() as db, ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="key-rotation"
+        ) as pool:
+            checkpoint = self._load_checkpoint(db, restart)
+            while not self.stop_event.is_set():
+                rows = db.execute(
+                    select(
+                        Document.id,
+                        Document.filename,
+                        Document.owner_id,
+                        Document.s3_key,
+                        Document.wrapped_key,
+                        Document.key_provider,
+                        Document.transfer_mode,
+                        Document.stored_size,
+                    )
+                    .where(Document.id > checkpoint.last_document_id)
+                    .order_by(Document.id)
+                    .limit(self.batch_size)
+                ).all()
+                if not rows:
+                    checkpoint.finished_at = datetime.now(timezone.utc)
+                    db.commit()
+                    break
+                outcomes = list(pool.map(self._rotate, rows))
+                try:
+                    superseded = self._apply(db, checkpoint, outcomes, rows[-1].id)
+                except Exception:
+                    # Lote sin confirmar: se repetirá al reanudar; los objetos nuevos sobran
+                    db.rollback()
+                    self._delete_objects([o.new_s3_key for o in outcomes if o.action == REENCRYPTED])
+                    raise
+                self._delete_objects(superseded)
+                self._report(checkpoint)
+            return progress(checkpoint)
+
+    def _report(self, checkpoint: KeyRotationCheckpoint) -> None:
+        state = progress(checkpoint)
+        eta = state["eta_seconds"]
+        self.log(
+            f"Rotación: {state['processed']}/{state['total']} documentos "
+            f"({state['reencrypted']} re-cifrados, {state['rewrapped']} re-envueltos, {state['failed']} fallidos) "
+            f"· {state['documents_per_second']} doc/s · {state['mb_per_second']} MB/s "
+            f"· ETA {'?' if eta is None else f'{eta}s'}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--restart", action="store_true", help="empezar desde el principio en vez de reanudar")
+    parser.add_argument("--batch-size", type=int, default=settings.KEY_ROTATION_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=settings.KEY_ROTATION_WORKERS)
+    parser.add_argument("--rate", type=float, default=settings.KEY_ROTATION_MAX_OBJECTS_PER_SECOND,
+                        help="objetos re-cifrados por segundo como máximo (0: sin límite)")
+    args = parser.parse_args()
+
+    from app.db.database import SessionLocal, get_engine
+
+    get_engine()
+    job = KeyRotationJob(
+        SessionLocal, batch_size=args.batch_size, workers=args.workers, max_objects_per_second=args.rate
+    )
+    # SIGTERM/Ctrl+C: se termina el lote en curso y se sale con el checkpoint al día
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: job.stop_event.set())
+    state = job.run(restart=args.restart)
+    print(f"Rotación {'completada' if state['finished_at'] else 'interrumpida'}: {state}")
+
+
+if __name__ == "__main__":
+    main()
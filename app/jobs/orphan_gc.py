@@ -0,0 +1,242 @@
+"""
+Recolección de objetos huérfanos en S3.
+
+Un borrado que falla a medias (la fila se elimina pero el DeleteObject no) o una subida
+interrumpida antes de insertar el documento dejan objetos en S3 que ninguna fila usa.
+Este trabajo los encuentra y los borra:
+
+- Recorre los objetos bajo el prefijo (por defecto "user_", es decir, todos los
+  "user_{id}/") con el listado paginado de S3, que devuelve las claves ordenadas.
+- Recorre en paralelo las claves referenciadas en la BD (documents, dedup_index y las
+  subidas directas pendientes) con paginación por clave, en el mismo orden.
+- Cruza ambas secuencias como un merge: en memoria solo hay una página de cada lado y el
+  lote de borrado en curso, sea cual sea el tamaño del bucket.
+
+Los objetos más recientes que ORPHAN_GC_GRACE_SECONDS no se tocan (pueden ser subidas en
+curso cuya fila aún no existe). Antes de borrar cada lote se vuelve a comprobar contra la
+BD, y se borra con DeleteObjects, hasta 1000 claves por llamada. Las filas cuyo objeto ya
+no existe solo se informan: borrarlas ocultaría el problema al usuario.
+
+Antes del recorrido se retiran las subidas directas pendientes con más de
+DIRECT_UPLOAD_TTL_SECONDS: se abortan en S3 (sus partes no aparecen en el listado de
+objetos, pero se facturan) y se borran sus filas.
+
+Uso:
+    python -m app.jobs.orphan_gc --dry-run
+    python -m app.jobs.orphan_gc --grace-seconds 3600
+"""
+import argparse
+import heapq
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import DedupEntry, Document, DirectUpload
+from app.services.direct_transfer_service import DirectTransferService
+from app.services.s3_services import MAX_DELETE_BATCH, S3Service, s3_service
+
+
+class OrphanGCJob:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        storage: S3Service = s3_service,
+        prefix: str = "user_",
+        grace_seconds: int = settings.ORPHAN_GC_GRACE_SECONDS,
+        direct_upload_ttl_seconds: int = settings.DIRECT_UPLOAD_TTL_SECONDS,
+        page_size: int = settings.ORPHAN_GC_PAGE_SIZE,
+        delete_batch_size: int = MAX_DELETE_BATCH,
+        sample_size: int = 20,
+        log: Callable[[str], None] = print,
+    ):
+        self.session_factory = session_factory
+        self.storage = storage
+        self.prefix = prefix
+        self.grace = timedelta(seconds=max(grace_seconds, 0))
+        self.direct_upload_ttl = timedelta(seconds=max(direct_upload_ttl_seconds, 0))
+        self.transfers = DirectTransferService(
+            storage, settings.S3_MULTIPART_PART_SIZE, settings.PRESIGNED_URL_EXPIRES_SECONDS
+        )
+        self.page_size = max(page_size, 1)
+        self.delete_batch_size = min(max(delete_batch_size, 1), MAX_DELETE_BATCH)
+        self.sample_size = sample_size
+        self.log = log
+
+    # --- Claves referenciadas en la BD, ordenadas como las lista S3 ---
+
+    def _sort_key(self, db: Session, column):
+        # S3 ordena por bytes UTF-8; en PostgreSQL la collation por defecto no, "C" sí.
+        # SQLite compara con BINARY, que para UTF-8 da el mismo orden.
+        if db.get_bind().dialect.name == "postgresql":
+            return column.collate("C")
+        return column
+
+    def _iter_column(self, db: Session, column, required: bool) -> Iterator[Tuple[str, bool]]:
+        """Valores distintos de una columna bajo el prefijo, por páginas (keyset)."""
+        sort_key = self._sort_key(db, column)
+        last = None
+        while True:
+            query = select(sort_key).distinct().where(column.startswith(self.prefix, autoescape=True))
+            if last is not None:
+                query = query.where(sort_key > last)
+            page = db.scalars(query.order_by(sort_key).limit(self.page_size)).all()
+            for value in page:
+                yield value, required
+            if len(page) < self.page_size:
+                return
+            last = page[-1]
+
+    def _referenced_keys(self, db: Session) -> Iterator[Tuple[str, bool]]:
+        """
+        (clave, debe_existir) sin repetir, en orden. Las subidas directas pendientes
+        reservan su clave pero su objeto aún no existe, así que no cuentan como perdidas.
+        """
+        merged = heapq.merge(
+            self._iter_column(db, Document.s3_key, True),
+            self._iter_column(db, DedupEntry.s3_key, True),
+            self._iter_column(db, DirectUpload.s3_key, False),
+            key=lambda item: item[0].encode("utf-8"),
+        )
+        current: Optional[str] = None
+        required = False
+        for key, key_required in merged:
+            if key != current:
+                if current is not None:
+                    yield current, required
+                current, required = key, False
+            required = required or key_required
+        if current is not None:
+            yield current, required
+
+    def _still_referenced(self, db: Session, s3_keys: List[str]) -> set:
+        referenced = set()
+        for column in (Document.s3_key, DedupEntry.s3_key, DirectUpload.s3_key):
+            referenced.update(db.scalars(select(column).where(column.in_(s3_keys))))
+        return referenced
+
+    # --- Recorrido ---
+
+    def _sample(self, items: list, value) -> None:
+        if len(items) < self.sample_size:
+            items.append(value)
+
+    def _flush(self, db: Session, report: dict, batch: List[dict], dry_run: bool) -> None:
+        if not batch:
+            return
+        keys = [obj["Key"] for obj in batch]
+        # Otra petición pudo crear una fila para el objeto después de pasar por su clave
+        referenced = self._still_referenced(db, keys)
+        db.rollback()
+        orphans = [obj for obj in batch if obj["Key"] not in referenced]
+        report["referenced_on_recheck"] += len(batch) - len(orphans)
+        report["orphans"] += len(orphans)
+        report["orphan_bytes"] += sum(obj.get("Size", 0) for obj in orphans)
+        for obj in orphans:
+            self._sample(report["orphan_sample"], obj["Key"])
+        if dry_run or not orphans:
+            return
+        failed = self.storage.delete_files([obj["Key"] for obj in orphans])
+        report["deleted"] += len(orphans) - len(failed)
+        report["delete_errors"] += len(failed)
+        self.log(f"GC: {report['deleted']} objetos huérfanos eliminados de {report['scanned']} revisados")
+
+    def run(self, dry_run: bool = False) -> dict:
+        """Recorre el prefijo una vez y devuelve el informe (en dry_run no se borra nada)."""
+        report = {
+            "prefix": self.prefix,
+            "dry_run": dry_run,
+            "scanned": 0,
+            "scanned_bytes": 0,
+            "referenced": 0,
+            "too_recent": 0,
+            "referenced_on_recheck": 0,
+            "orphans": 0,
+            "orphan_bytes": 0,
+            "deleted": 0,
+            "delete_errors": 0,
+            "missing_objects": 0,
+            "orphan_sample": [],
+            "missing_sample": [],
+            "expired_uploads": 0,
+            "expired_upload_errors": 0,
+        }
+        now = datetime.now(timezone.utc)
+        cutoff = now - self.grace
+        batch: List[dict] = []
+
+        with self.session_factory() as db:
+            expired = self.transfers.expire_stale(db, now - self.direct_upload_ttl, self.page_size, dry_run)
+            report["expired_uploads"] = expired["expired"]
+            report["expired_upload_errors"] = expired["errors"]
+            if expired["expired"] and not dry_run:
+                self.log(f"GC: {expired['expired']} subidas directas caducadas abortadas")
+
+            objects = self.storage.iter_objects(self.prefix, page_size=self.page_size)
+            references = self._referenced_keys(db)
+            obj = next(objects, None)
+            ref = next(references, None)
+            while obj is not None or ref is not None:
+                obj_key = obj["Key"].encode("utf-8") if obj is not None else None
+                ref_key = ref[0].encode("utf-8") if ref is not None else None
+
+                if ref_key is None or (obj_key is not None and obj_key < ref_key):
+                    # Objeto sin fila
+                    report["scanned"] += 1
+                    report["scanned_bytes"] += obj.get("Size", 0)
+                    if obj["LastModified"] > cutoff:
+                        report["too_recent"] += 1
+                    else:
+                        batch.append(obj)
+                        if len(batch) >= self.delete_batch_size:
+                            self._flush(db, report, batch, dry_run)
+                            batch = []
+                    obj = next(objects, None)
+                elif obj_key is None or ref_key < obj_key:
+                    # Fila sin objeto
+                    if ref[1]:
+                        report["missing_objects"] += 1
+                        self._sample(report["missing_sample"], ref[0])
+                    ref = next(references, None)
+                else:
+                    report["scanned"] += 1
+                    report["scanned_bytes"] += obj.get("Size", 0)
+                    report["referenced"] += 1
+                    obj = next(objects, None)
+                    ref = next(references, None)
+            self._flush(db, report, batch, dry_run)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="solo informar, sin borrar nada")
+    parser.add_argument("--prefix", default="user_", help='prefijo a revisar (ej. "user_42/")')
+    parser.add_argument("--grace-seconds", type=int, default=settings.ORPHAN_GC_GRACE_SECONDS,
+                        help="no tocar objetos más recientes que esto")
+    parser.add_argument("--direct-upload-ttl-seconds", type=int, default=settings.DIRECT_UPLOAD_TTL_SECONDS,
+                        help="abortar las subidas directas pendientes más antiguas que esto")
+    parser.add_argument("--page-size", type=int, default=settings.ORPHAN_GC_PAGE_SIZE)
+    parser.add_argument("--sample", type=int, default=20, help="claves de ejemplo en el informe")
+    args = parser.parse_args()
+
+    from app.db.database import SessionLocal, get_engine
+
+    get_engine()
+    job = OrphanGCJob(
+        SessionLocal,
+        prefix=args.prefix,
+        grace_seconds=args.grace_seconds,
+        direct_upload_ttl_seconds=args.direct_upload_ttl_seconds,
+        page_size=args.page_size,
+        sample_size=args.sample,
+    )
+    report = job.run(dry_run=args.dry_run)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Reconstrucción de los contadores de uso (tabla user_usage).
+
+Los contadores se mantienen al día en cada subida y borrado; este comando los recalcula
+en bloque a partir de la tabla documents, por si algo los ha desviado (cambios hechos a
+mano en la BD, documentos anteriores a los contadores...). Son dos sentencias en una
+transacción; en PostgreSQL la tabla se bloquea mientras tanto para no perder las
+subidas y borrados que lleguen a la vez.
+
+Con --backfill antes se completan los tamaños de los documentos anteriores a las
+columnas size/stored_size: el tamaño en S3 sale de la cabecera de una lectura por rangos
+(los primeros bytes del objeto) y el del original, de la cabecera del formato por
+segmentos cuando no va comprimido, o del propio objeto en la transferencia directa. Los
+demás (Fernet o comprimidos) quedan sin tamaño original y cuentan 0 para la cuota.
+
+Uso:
+    python -m app.jobs.usage_reconcile
+    python -m app.jobs.usage_reconcile --backfill
+"""
+import argparse
+import json
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.db.models import Document
+from app.services import usage_service
+from app.services.compression import CODEC_NONE
+from app.services.direct_transfer_service import TRANSFER_DIRECT
+from app.services.encryption_service import HEADER_SIZE, is_stream_format, parse_header, plaintext_size
+from app.services.s3_services import S3Service, s3_service
+
+
+def _object_sizes(storage: S3Service, s3_key: str, transfer_mode: str) -> Tuple[int, Optional[int]]:
+    """(tamaño en S3, tamaño original o None si no se puede saber sin descifrar)."""
+    response = storage.get_object(s3_key, 0, HEADER_SIZE - 1)
+    try:
+        head = response["Body"].read()
+    finally:
+        response["Body"].close()
+    content_range = response.get("ContentRange")
+    stored_size = int(content_range.rsplit("/", 1)[1]) if content_range else response["ContentLength"]
+    if transfer_mode == TRANSFER_DIRECT:
+        return stored_size, stored_size
+    if is_stream_format(head):
+        header = parse_header(head)
+        if header.codec == CODEC_NONE:
+            return stored_size, plaintext_size(header, stored_size)
+    return stored_size, None
+
+
+def backfill_sizes(
+    session_factory: Callable[[], Session],
+    storage: S3Service = s3_service,
+    batch_size: int = 500,
+    log: Callable[[str], None] = print,
+) -> dict:
+    """Completa stored_size (y size cuando se puede) en los documentos que no lo tienen."""
+    report = {"documents": 0, "with_size": 0, "failed": 0}
+    last_id = 0
+    with session_factory() as db:
+        while True:
+            rows = db.execute(
+                select(Document.id, Document.s3_key, Document.transfer_mode)
+                .where(Document.id > last_id, Document.stored_size.is_(None), Document.s3_key.is_not(None))
+                .order_by(Document.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            changes = []
+            for row in rows:
+                try:
+                    stored_size, size = _object_sizes(storage, row.s3_key, row.transfer_mode)
+                except Exception as e:
+                    print(f"Uso: no se pudo leer el objeto del documento {row.id}: {e}")
+                    report["failed"] += 1
+                    continue
+                changes.append({"id": row.id, "stored_size": stored_size, "size": size})
+                report["with_size"] += size is not None
+            if changes:
+                # UPDATE por clave primaria de todo el lote
+                db.execute(update(Document), changes)
+                db.commit()
+            report["documents"] += len(changes)
+            log(f"Uso: tamaños completados en {report['documents']} documentos")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true", help="completar antes los tamaños que faltan")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from app.db.database import SessionLocal, get_engine
+
+    get_engine()
+    report = {}
+    if args.backfill:
+        report["backfill"] = backfill_sizes(SessionLocal, batch_size=args.batch_size)
+    with SessionLocal() as db:
+        report["reconcile"] = usage_service.reconcile(db)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,80 @@
-from fastapi import FastAPI, Depends
-from app.api.routers import auth
-from app.api.deps import get_current_user
-
-# --- NUEVO: Importaciones de la Base de Datos ---
-from app.db.database import engine
-from app.db.models import Base
-
-# --- NUEVO: Esto le dice a SQLAlchemy que cree las tablas en PostgreSQL al arrancar ---
-Base.metadata.create_all(bind=engine)
-
-# En esta fase inicial, nos centramos en establecer la estructura básica de la API
-# y en implementar un sistema de autenticación simple.
-app = FastAPI(
-    title="AWS Secure Document Vault",
-    description="API para gestión y cifrado de documentos en la nube.",
-    version="1.0.0"
-)
-
-# Incluimos las rutas de autenticación
-# Esto añade los endpoints /api/v1/auth/login y /api/v1/auth/me a tu API
-app.include_router(auth.router, prefix="/api/v1/auth", tags=["Autenticación"])
-
-# 1. Endpoint de Salud (Health Check)
-# Estrategia: Cuando despleguemos en AWS, el balanceador de carga usará 
-# esta ruta para saber si nuestra API está viva o si se ha caída.
-@app.get("/health", tags=["System"])
-def health_check():
-    return {"status": "ok", "message": "El servidor está funcionando correctamente"}
-
-# 2. Endpoint base para documentos (En el futuro conectará con S3)
-# -> NUEVO: Ahora requerimos que el usuario esté autenticado para ver los documentos
-# Esto se logra usando Depends(get_current_user), que verifica el token JWT y devuelve la información del usuario.
-@app.get("/documents", tags=["Documents"])
-def get_documents(current_user: dict = Depends(get_current_user)):
-    # Por ahora devolvemos datos falsos (Mock data). 
-    # En la Fase 2, esto leerá los archivos reales desde Amazon S3.
-    
-    # Podemos incluso ver qué usuario nos está pidiendo los documentos
-    # Esto es útil para personalizar la respuesta o para fines de auditoría.
-    usuario_peticion = current_user.get("username")
-    
-    return {
-        "user_requesting": usuario_peticion,
-        "documents": [
-            {"id": 1, "name": "informe_secreto.pdf", "size": "2MB", "encrypted": True},
-            {"id": 2, "name": "claves_aws.txt", "size": "15KB", "encrypted": True}
-        ]
-    }
\ No newline at end of file
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI
+from fastapi.responses import PlainTextResponse
+from app.api.deps import require_internal_token
+from app.api.routers import auth, documents, internal
+from app.api.schemas import HealthStatus
+from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, registry
+from app.core.responses import FastJSONResponse
+from app.core.security import password_hasher
+
+# --- Importaciones de la Base de Datos ---
+from app.db.database import dispose_engine
+from app.services.async_s3_service import async_s3_service
+from app.services.dedup_service import check_configuration as check_dedup_configuration
+from app.services.document_service import document_service
+from app.services.encryption_service import get_cipher_suite
+
+
+# Ciclo de vida de la app: importar este módulo no tiene efectos secundarios.
+# El engine de la BD y el cliente de S3 se crean perezosamente en su primer uso;
+# aquí solo se validan la clave de cifrado y el secreto de deduplicación (barato, y
+# mejor fallar al arrancar que en la primera subida) y se liberan los recursos al apagar.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_cipher_suite()
+    check_dedup_configuration()
+    if settings.DB_CREATE_SCHEMA_ON_STARTUP:
+        from app.db.init_db import init_db
+        init_db()
+    yield
+    document_service.close()
+    async_s3_service.close()
+    password_hasher.shutdown()
+    dispose_engine()
+
+
+def create_app() -> FastAPI:
+    # En esta fase inicial, nos centramos en establecer la estructura básica de la API
+    # y en implementar un sistema de autenticación simple.
+    application = FastAPI(
+        title="AWS Secure Document Vault",
+        description="API para gestión y cifrado de documentos en la nube.",
+        version="1.0.0",
+        lifespan=lifespan,
+        # JSON escrito con orjson (ver app/core/responses.py)
+        default_response_class=FastJSONResponse,
+    )
+    # Latencia y contadores por ruta (ver app/core/metrics.py)
+    application.add_middleware(MetricsMiddleware)
+
+    # Incluimos las rutas de autenticación
+    # Esto añade los endpoints /api/v1/auth/login y /api/v1/auth/me a tu API
+    application.include_router(auth.router, prefix="/api/v1/auth", tags=["Autenticación"])
+    # Rutas de documentos (listado, descarga, etc.)
+    application.include_router(documents.router, prefix="/documents", tags=["Documents"])
+    # Diagnóstico interno (estado del pool de la BD, etc.), solo con INTERNAL_API_TOKEN
+    application.include_router(
+        internal.router, prefix="/internal", tags=["System"], dependencies=[Depends(require_internal_token)]
+    )
+
+    # 1. Endpoint de Salud (Health Check)
+    # Estrategia: Cuando despleguemos en AWS, el balanceador de carga usará
+    # esta ruta para saber si nuestra API está viva o si se ha caída.
+    @application.get("/health", tags=["System"], response_model=HealthStatus)
+    def health_check():
+        return {"status": "ok", "message": "El servidor está funcionando correctamente"}
+
+    # 2. Métricas en formato de exposición de Prometheus (para el scraper, con INTERNAL_API_TOKEN)
+    @application.get(
+        "/metrics", tags=["System"], response_class=PlainTextResponse, dependencies=[Depends(require_internal_token)]
+    )
+    def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    return application
+
+
+app = create_app()
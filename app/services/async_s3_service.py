@@ -0,0 +1,196 @@
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.core.metrics import gauge_lines, registry
+from app.services.object_cache import CachedObject, ObjectCache, object_cache
+from app.services.s3_services import S3Service, s3_service
+
+# Interfaz asíncrona sobre S3Service para usar desde endpoints `async def`.
+#
+# boto3 es síncrono, así que cada llamada se ejecuta en un pool de hilos propio y
+# acotado (no en el threadpool de FastAPI/Starlette): una ráfaga de subidas lentas
+# nunca deja sin hilos al resto de endpoints ni bloquea el event loop.
+# El pool tiene tantos hilos como conexiones el cliente de S3, de modo que los hilos
+# nunca esperan por una conexión, y cada tipo de operación tiene su propio semáforo.
+#
+# Con `cache` (ver object_cache.py) las lecturas se sirven desde el disco local cuando el
+# objeto está allí, y los borrados y escrituras lo invalidan.
+class AsyncS3Service:
+    def __init__(self, service: S3Service, max_workers: Optional[int] = None, cache: Optional[ObjectCache] = None):
+        self.service = service
+        self.cache = cache
+        self._max_workers = max_workers or settings.S3_MAX_POOL_CONNECTIONS
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._limits = {
+            "upload": settings.S3_MAX_CONCURRENT_UPLOADS,
+            "download": settings.S3_MAX_CONCURRENT_DOWNLOADS,
+            "delete": settings.S3_MAX_CONCURRENT_DELETES,
+            "list": settings.S3_MAX_CONCURRENT_LISTS,
+        }
+        # Los semáforos de asyncio pertenecen a un event loop; guardamos uno por loop
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_workers, thread_name_prefix="s3-async"
+            )
+        return self._executor
+
+    def _semaphore(self, operation: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphores = self._semaphores.get(loop)
+        if semaphores is None:
+            semaphores = {op: asyncio.Semaphore(limit) for op, limit in self._limits.items()}
+            self._semaphores[loop] = semaphores
+        return semaphores[operation]
+
+    async def _run(self, operation: str, func, *args, **kwargs):
+        async with self._semaphore(operation):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), partial(func, *args, **kwargs))
+
+    async def _cached(self, s3_key: str, fill: bool, count: bool = True) -> Optional[CachedObject]:
+        """
+        El objeto desde la caché, o None si hay que leerlo de S3. Con `fill`, un fallo
+        trae el objeto entero a la caché; las peticiones simultáneas esperan a esa descarga.
+        `count=False` no cuenta la consulta en el ratio de aciertos.
+        """
+        cache = self.cache
+        if cache is None:
+            return None
+        if not fill:
+            return cache.get(s3_key, count)
+        future, leader = cache.claim(s3_key)
+        if leader:
+            await self._run("download", cache.fill, s3_key, future, partial(self.service.get_object, s3_key))
+        # shield: si esta petición se cancela, las que esperan el mismo objeto siguen esperando
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _admits(self, object_size: Optional[int]) -> bool:
+        # Sin tamaño conocido no se llena la caché: un objeto que no cabe se descargaría dos veces
+        return object_size is not None and self.cache is not None and self.cache.admits(object_size)
+
+    def _invalidate(self, s3_key: str) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(s3_key)
+
+    async def upload(
+        self,
+        data: Union[bytes, Iterable[bytes]],
+        original_filename: str,
+        user_id: int,
+    ) -> str:
+        """
+        Sube un documento y devuelve su s3_key. Los flujos (iterables) se suben por partes.
+        """
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            s3_key = await self._run("upload", self.service.upload_file, bytes(data), original_filename, user_id)
+        else:
+            s3_key = await self._run("upload", self.service.upload_stream, data, original_filename, user_id)
+        self._invalidate(s3_key)
+        return s3_key
+
+    async def download(self, s3_key: str, object_size: Optional[int] = None) -> bytes:
+        """
+        Descarga un objeto completo. Igual que en iter_range, un fallo solo lo trae a la
+        caché si se conoce su tamaño (`object_size`) y cabe en ella.
+        """
+        cached = await self._cached(s3_key, self._admits(object_size))
+        if cached is not None:
+            return cached.read()
+        return await self._run("download", self.service.download_file, s3_key)
+
+    async def download_range(self, s3_key: str, start: int, end: int) -> Tuple[bytes, int]:
+        """
+        Descarga el rango [start, end] de un objeto. Devuelve los bytes y el tamaño total del objeto.
+        No cuenta en el ratio de aciertos de la caché: la descarga de contenido lo usa para
+        leer la cabecera y después consulta otra vez con download o iter_range.
+        """
+        cached = await self._cached(s3_key, fill=False, count=False)
+        if cached is not None:
+            return cached.read(start, end), cached.size
+
+        def _read_range():
+            response = self.service.get_object(s3_key, start, end)
+            content_range = response.get("ContentRange")
+            total = int(content_range.rsplit("/", 1)[1]) if content_range else response["ContentLength"]
+            return response["Body"].read(), total
+
+        return await self._run("download", _read_range)
+
+    async def iter_range(
+        self,
+        s3_key: str,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        chunk_size: int = 256 * 1024,
+        object_size: Optional[int] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Lee un objeto (o un rango) en trozos de `chunk_size` sin cargarlo entero en memoria.
+        Si se conoce el tamaño del objeto (`object_size`) y cabe en la caché, un fallo lo
+        trae entero a la caché y el rango se sirve desde allí.
+        """
+        cached = await self._cached(s3_key, self._admits(object_size))
+        if cached is not None:
+            for chunk in cached.iter_range(start, end, chunk_size):
+                yield chunk
+            return
+
+        response = await self._run("download", self.service.get_object, s3_key, start, end)
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await self._run("download", body.read, chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete(self, s3_key: str) -> None:
+        try:
+            await self._run("delete", self.service.delete_file, s3_key)
+        finally:
+            self._invalidate(s3_key)
+
+    async def list(self, prefix: str) -> List[str]:
+        return await self._run("list", self.service.list_files, prefix)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self.cache is not None:
+            # Sin el índice en memoria los ficheros de la caché ya no sirven
+            self.cache.clear()
+
+
+# Instancia global, comparte el cliente (y por tanto el pool de conexiones) con s3_service
+async_s3_service = AsyncS3Service(s3_service, cache=object_cache)
+
+
+def _object_cache_metrics():
+    cache = async_s3_service.cache
+    if cache is None:
+        return []
+    stats = cache.stats()
+    return gauge_lines("object_cache", "Caché en disco de objetos cifrados de S3.", {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "hit_ratio": stats["hit_ratio"],
+        "coalesced": stats["coalesced"],
+        "evictions": stats["evictions"],
+        "entries": stats["entries"],
+        "bytes": stats["bytes"],
+    })
+
+
+registry.add_collector(_object_cache_metrics)
@@ -0,0 +1,103 @@
+import zlib
+from typing import Iterable, Iterator, Optional
+
+# --- Compresión antes del cifrado ---
+# Lo cifrado no se puede comprimir, así que si se comprime tiene que ser antes.
+# El códec usado va en los 4 bits bajos del byte de flags de la cabecera SDVS
+# (autenticada como AAD), de modo que cada objeto dice cómo descomprimirlo.
+#
+# Antes de comprimir se prueba con una muestra (el primer trozo del documento): si no
+# baja de `max_ratio` (JPEG, ZIP, PDFs con imágenes...) el documento se guarda sin
+# comprimir y no se gasta CPU en él.
+#
+# zlib viene con Python; zstd (más rápido a igual ratio) usa el paquete `zstandard` de
+# requirements.txt y, si faltara, se usa zlib.
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_MASK = 0x0F
+
+CODECS = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+# Por debajo de este tamaño la muestra no es representativa y el ahorro es despreciable
+MIN_SAMPLE_SIZE = 512
+_MAX_OUTPUT = 1024 * 1024
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depende del entorno
+    zstandard = None
+
+
+def codec_from_name(name: Optional[str]) -> int:
+    if not name:
+        return CODEC_NONE
+    codec = CODECS.get(name.lower())
+    if codec is None:
+        raise ValueError(f"Códec de compresión desconocido: {name}")
+    if codec == CODEC_ZSTD and zstandard is None:
+        print("zstandard no está instalado: se usa zlib para comprimir.")
+        return CODEC_ZLIB
+    return codec
+
+
+def _compressor(codec: int, level: int):
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(level)
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError("Códec de compresión no válido.")
+
+
+def worth_compressing(sample: bytes, codec: int, level: int, max_ratio: float) -> bool:
+    """Comprime la muestra y decide si el documento merece comprimirse."""
+    if codec == CODEC_NONE or len(sample) < MIN_SAMPLE_SIZE:
+        return False
+    compressor = _compressor(codec, level)
+    compressed = len(compressor.compress(sample)) + len(compressor.flush())
+    return compressed <= len(sample) * max_ratio
+
+
+def compress_chunks(chunks: Iterable[bytes], codec: int, level: int) -> Iterator[bytes]:
+    compressor = _compressor(codec, level)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class Decompressor:
+    """Descompresión incremental, alimentada con los segmentos ya descifrados."""
+
+    def __init__(self, codec: int):
+        self.codec = codec
+        if codec == CODEC_ZLIB:
+            self._zlib = zlib.decompressobj()
+        elif codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ValueError("El documento está comprimido con zstd y zstandard no está instalado.")
+            self._zstd = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            raise ValueError("Códec de compresión no válido.")
+
+    def update(self, data: bytes) -> Iterator[bytes]:
+        if self.codec == CODEC_ZSTD:
+            output = self._zstd.decompress(data)
+            if output:
+                yield output
+            return
+        # Limitamos cada salida de zlib: un segmento muy comprimible no se expande de golpe
+        output = self._zlib.decompress(data, _MAX_OUTPUT)
+        while output:
+            yield output
+            output = self._zlib.decompress(self._zlib.unconsumed_tail, _MAX_OUTPUT)
+
+    def finalize(self) -> Iterator[bytes]:
+        if self.codec == CODEC_ZLIB:
+            output = self._zlib.flush()
+            if output:
+                yield output
+            if not self._zlib.eof:
+                raise ValueError("Flujo comprimido incompleto.")
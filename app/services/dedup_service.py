@@ -0,0 +1,147 @@
+import hashlib
+import hmac
+import threading
+from collections import Counter
+from typing import BinaryIO, Dict, Iterable, List, Optional
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import DedupEntry
+
+# --- Deduplicación por contenido ---
+# Antes de cifrar un archivo se calcula su huella: HMAC-SHA256 del texto plano con una
+# clave propia de cada usuario (derivada de DEDUP_FINGERPRINT_KEY). Si el usuario ya tiene ese
+# contenido, el documento nuevo reutiliza el objeto cifrado (y su clave de datos) y solo
+# se inserta la fila en la BD. `ref_count` lleva la cuenta de documentos por objeto:
+# al borrar, el objeto de S3 solo se elimina cuando deja de usarlo el último.
+
+_READ_SIZE = 1024 * 1024
+
+
+class ContentFingerprinter:
+    def __init__(self, master_key: Optional[bytes] = None):
+        self._master_key = master_key
+        self._key: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def _get_key(self) -> bytes:
+        if self._key is None:
+            with self._lock:
+                if self._key is None:
+                    self._key = HKDF(
+                        algorithm=hashes.SHA256(), length=32, salt=None, info=b"sdv-dedup-v1"
+                    ).derive(self._master_key or _fingerprint_key_material())
+        return self._key
+
+    def fingerprint(self, file: BinaryIO, owner_id: int) -> bytes:
+        """Huella del contenido de `file` para `owner_id`. Deja el archivo donde estaba."""
+        owner_key = hmac.new(self._get_key(), f"owner:{owner_id}".encode(), hashlib.sha256).digest()
+        mac = hmac.new(owner_key, digestmod=hashlib.sha256)
+        position = file.tell()
+        for chunk in iter(lambda: file.read(_READ_SIZE), b""):
+            mac.update(chunk)
+        file.seek(position)
+        return mac.digest()
+
+
+def _fingerprint_key_material() -> bytes:
+    # Secreto propio, no una de ENCRYPTION_KEYS: si las huellas dependieran de una clave de
+    # cifrado, al retirarla tras una rotación el índice dejaría de reconocer todo el contenido
+    if not settings.DEDUP_FINGERPRINT_KEY:
+        raise RuntimeError("Falta DEDUP_FINGERPRINT_KEY: es obligatoria con DEDUP_ENABLED.")
+    return settings.DEDUP_FINGERPRINT_KEY.encode()
+
+
+def check_configuration() -> None:
+    """Falla al arrancar si la deduplicación está activa sin secreto para las huellas."""
+    if settings.DEDUP_ENABLED:
+        _fingerprint_key_material()
+
+
+fingerprinter = ContentFingerprinter()
+
+
+class DedupConflict(Exception):
+    """
+    Otra petición cambió el índice a la vez: borró el objeto que se iba a reutilizar
+    o indexó antes el mismo contenido. El lote se puede reintentar.
+    """
+
+
+def find_entries(db: Session, owner_id: int, content_hashes: Iterable[bytes]) -> Dict[bytes, DedupEntry]:
+    content_hashes = list(set(content_hashes))
+    if not content_hashes:
+        return {}
+    entries = db.scalars(
+        select(DedupEntry).where(
+            DedupEntry.owner_id == owner_id, DedupEntry.content_hash.in_(content_hashes)
+        )
+    ).all()
+    return {entry.content_hash: entry for entry in entries}
+
+
+def add_references(db: Session, owner_id: int, stored: List) -> None:
+    """
+    Registra en el índice los documentos de un lote, en la transacción del llamador.
+    `stored` son StoredObject con `content_hash`: los reutilizados (`deduplicated`) suman
+    referencias a su entrada; los subidos ahora crean la suya.
+    """
+    reused = Counter(obj.content_hash for obj in stored if obj.content_hash and obj.deduplicated)
+    for content_hash, count in reused.items():
+        result = db.execute(
+            update(DedupEntry)
+            .where(
+                DedupEntry.owner_id == owner_id,
+                DedupEntry.content_hash == content_hash,
+                DedupEntry.ref_count > 0,
+            )
+            .values(ref_count=DedupEntry.ref_count + count)
+        )
+        if result.rowcount == 0:
+            raise DedupConflict()
+
+    fresh: Dict[bytes, list] = {}
+    for obj in stored:
+        if obj.content_hash and not obj.deduplicated:
+            fresh.setdefault(obj.content_hash, []).append(obj)
+    for content_hash, objects in fresh.items():
+        first = objects[0]
+        try:
+            db.execute(
+                insert(DedupEntry).values(
+                    owner_id=owner_id,
+                    content_hash=content_hash,
+                    s3_key=first.s3_key,
+                    wrapped_key=first.wrapped_key,
+                    key_provider=first.key_provider,
+                    ref_count=len(objects),
+                    size=first.size,
+                    stored_size=first.stored_size,
+                    checksum=first.checksum,
+                )
+            )
+        except IntegrityError:
+            raise DedupConflict()
+
+
+def release(db: Session, s3_key: str) -> bool:
+    """
+    Quita una referencia al objeto `s3_key`, en la transacción del llamador.
+    Devuelve True si ya nadie lo usa y hay que borrarlo de S3.
+    """
+    entry = db.scalars(
+        select(DedupEntry).where(DedupEntry.s3_key == s3_key).with_for_update()
+    ).first()
+    if entry is None:
+        # Objeto fuera del índice (documento antiguo o sin deduplicar): es solo suyo
+        return True
+    entry.ref_count -= 1
+    if entry.ref_count > 0:
+        return False
+    db.delete(entry)
+    return True
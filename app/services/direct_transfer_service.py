@@ -0,0 +1,181 @@
+import math
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import DirectUpload, Document
+from app.services import usage_service
+from app.services.s3_services import S3Service, s3_service
+
+TRANSFER_PROXIED = "proxied"
+TRANSFER_DIRECT = "direct"
+
+# Límite de S3 en el número de partes de una subida multiparte
+MAX_PARTS = 10_000
+
+
+class DirectUploadError(Exception):
+    """La subida directa no se puede completar en su estado actual (faltan partes, tamaño distinto...)."""
+
+
+def mode_allowed(mode: str) -> bool:
+    """Si el despliegue admite transferencias en `mode` (ver TRANSFER_MODE)."""
+    return settings.TRANSFER_MODE in (mode, "both")
+
+
+# Transferencia directa: la API solo firma URLs y registra el documento.
+#
+# 1. initiate(): crea la subida multiparte en S3 (con SSE-KMS) y devuelve una URL
+#    prefirmada por parte. El cliente sube las partes directamente a S3, en paralelo.
+# 2. complete(): comprueba en S3 que han llegado todas las partes con el tamaño
+#    anunciado, cierra la subida y crea la fila Document en la misma transacción
+#    que borra la subida pendiente.
+# 3. download_url(): URL prefirmada de descarga; S3 descifra y sirve el objeto.
+# El ancho de banda de los documentos ya no pasa por las instancias de la API.
+# Las subidas que el cliente abandona las retira expire_stale() (desde app.jobs.orphan_gc);
+# la regla de ciclo de vida AbortIncompleteMultipartUpload del bucket queda de respaldo.
+class DirectTransferService:
+    def __init__(self, storage: S3Service, part_size: int, expires_in: int):
+        self.storage = storage
+        self.part_size = part_size
+        self.expires_in = expires_in
+
+    def part_count(self, size: int) -> int:
+        count = max(math.ceil(size / self.part_size), 1)
+        if count > MAX_PARTS:
+            raise DirectUploadError(
+                f"El archivo supera el máximo de {MAX_PARTS} partes de {self.part_size} bytes."
+            )
+        return count
+
+    def initiate(self, db: Session, owner_id: int, filename: str, size: int) -> Tuple[DirectUpload, List[str]]:
+        """Inicia una subida directa. Devuelve la subida pendiente y las URLs de sus partes."""
+        part_count = self.part_count(size)
+        usage_service.check_quota(db, owner_id, size)
+        s3_key, upload_id = self.storage.create_direct_upload(filename, owner_id)
+        upload = DirectUpload(
+            owner_id=owner_id,
+            filename=filename,
+            s3_key=s3_key,
+            upload_id=upload_id,
+            size=size,
+            part_count=part_count,
+        )
+        try:
+            db.add(upload)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.storage.abort_direct_upload(s3_key, upload_id)
+            raise
+        urls = self.storage.presign_upload_parts(s3_key, upload_id, part_count, self.expires_in)
+        return upload, urls
+
+    def complete(self, db: Session, upload: DirectUpload) -> int:
+        """
+        Cierra la subida en S3 y registra el documento. Devuelve el id del Document.
+        Si faltan partes o el tamaño no coincide no se toca nada: el cliente puede
+        subir las partes que faltan (o abortar) y volver a completar.
+        """
+        parts = self.storage.list_uploaded_parts(upload.s3_key, upload.upload_id)
+        received = {part["PartNumber"] for part in parts}
+        missing = sorted(set(range(1, upload.part_count + 1)) - received)
+        if missing:
+            raise DirectUploadError(f"Faltan partes por subir: {missing[:20]}")
+        if len(received) != upload.part_count:
+            raise DirectUploadError("Se han subido más partes de las anunciadas.")
+        total = sum(part["Size"] for part in parts)
+        if total != upload.size:
+            raise DirectUploadError(f"Se han recibido {total} bytes y se anunciaron {upload.size}.")
+        usage_service.check_quota(db, upload.owner_id, total)
+
+        self.storage.complete_direct_upload(upload.s3_key, upload.upload_id, parts)
+        try:
+            removed = db.execute(delete(DirectUpload).where(DirectUpload.id == upload.id)).rowcount
+            if removed == 0:
+                # Otra petición completó la misma subida a la vez y ya registró el documento
+                db.rollback()
+                raise DirectUploadError("La subida ya se ha completado.")
+            document_id = db.scalar(
+                insert(Document)
+                .values(
+                    filename=upload.filename,
+                    s3_key=upload.s3_key,
+                    owner_id=upload.owner_id,
+                    is_encrypted=True,
+                    transfer_mode=TRANSFER_DIRECT,
+                    size=total,
+                    stored_size=total,
+                )
+                .returning(Document.id)
+            )
+            usage_service.charge(db, upload.owner_id, 1, total, total)
+            db.commit()
+            return document_id
+        except DirectUploadError:
+            raise
+        except usage_service.QuotaExceeded:
+            # Otra subida ocupó el espacio mientras tanto: el objeto ya está completo en
+            # S3, así que la subida no se puede reintentar y se retira entera
+            db.rollback()
+            self._discard(upload.s3_key)
+            db.execute(delete(DirectUpload).where(DirectUpload.id == upload.id))
+            db.commit()
+            raise
+        except Exception:
+            # Sin fila en la BD el objeto quedaría huérfano en S3
+            db.rollback()
+            self._discard(upload.s3_key)
+            raise
+
+    def _discard(self, s3_key: str) -> None:
+        try:
+            self.storage.delete_file(s3_key)
+        except Exception as e:
+            print(f"No se pudo eliminar el objeto huérfano {s3_key}: {e}")
+
+    def abort(self, db: Session, upload: DirectUpload) -> None:
+        """Cancela una subida pendiente: S3 descarta las partes recibidas."""
+        self.storage.abort_direct_upload(upload.s3_key, upload.upload_id)
+        db.delete(upload)
+        db.commit()
+
+    def expire_stale(self, db: Session, older_than: datetime, page_size: int = 1000, dry_run: bool = False) -> dict:
+        """
+        Aborta en S3 las subidas pendientes iniciadas antes de `older_than` y borra sus
+        filas. Si S3 no deja abortar una, su fila se queda para el siguiente barrido.
+        """
+        report = {"expired": 0, "errors": 0}
+        last_id = 0
+        while True:
+            stale = db.execute(
+                select(DirectUpload.id, DirectUpload.s3_key, DirectUpload.upload_id)
+                .where(DirectUpload.created_at < older_than, DirectUpload.id > last_id)
+                .order_by(DirectUpload.id)
+                .limit(page_size)
+            ).all()
+            db.rollback()
+            if not stale:
+                return report
+            last_id = stale[-1].id
+            if dry_run:
+                report["expired"] += len(stale)
+                continue
+            aborted = [row.id for row in stale if self.storage.abort_direct_upload(row.s3_key, row.upload_id)]
+            report["errors"] += len(stale) - len(aborted)
+            if aborted:
+                report["expired"] += db.execute(delete(DirectUpload).where(DirectUpload.id.in_(aborted))).rowcount
+                db.commit()
+
+    def download_url(self, document: Document) -> str:
+        return self.storage.presign_download(document.s3_key, document.filename, self.expires_in)
+
+
+direct_transfer_service = DirectTransferService(
+    storage=s3_service,
+    part_size=settings.S3_MULTIPART_PART_SIZE,
+    expires_in=settings.PRESIGNED_URL_EXPIRES_SECONDS,
+)
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, List, Optional, Sequence, Union
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.async_s3_service import AsyncS3Service, async_s3_service
+from app.services.compression import codec_from_name
+from app.services.dedup_service import fingerprinter
+from app.services.encryption_service import (
+    HEADER_SIZE,
+    SegmentDecryptor,
+    decrypt_file,
+    encrypt_stream,
+    is_stream_format,
+    parse_header,
+)
+from app.services.key_service import EnvelopeKeyService, key_service
+
+
+@dataclass
+class StoredObject:
+    """Resultado de cifrar y guardar un documento en S3 (lo que necesita la fila Document)."""
+    filename: str
+    s3_key: str
+    wrapped_key: bytes
+    key_provider: str
+    # Huella del contenido (índice de deduplicación) y si reutiliza un objeto que ya existía
+    content_hash: Optional[bytes] = None
+    deduplicated: bool = False
+    # Tamaño del original y del objeto en S3 (para Document y el uso del usuario)
+    size: int = 0
+    stored_size: int = 0
+    checksum: Optional[str] = None
+
+
+@dataclass
+class IncomingFile:
+    filename: str
+    file: BinaryIO
+    size: Optional[int] = None
+
+
+# Pipeline de ingesta: cifrar (CPU) → subir a S3 (E/S).
+#
+# Cada archivo pasa por dos etapas con límites independientes:
+# - cifrado en un pool de hilos propio del tamaño de la CPU disponible,
+# - subida a S3 con los límites de AsyncS3Service.
+# Como hay varios archivos en vuelo a la vez (BATCH_UPLOAD_MAX_IN_FLIGHT), mientras
+# unos se suben otros se están cifrando, y la memoria queda acotada por ese límite.
+# Los archivos grandes no se cifran enteros en memoria: van por la subida multiparte,
+# que cifra la parte siguiente mientras sube las anteriores.
+class DocumentService:
+    def __init__(
+        self,
+        storage: AsyncS3Service,
+        keys: EnvelopeKeyService,
+        encryption_workers: int,
+        max_in_flight: int,
+    ):
+        self.storage = storage
+        self.keys = keys
+        self._encryption_workers = encryption_workers
+        self._max_in_flight = max_in_flight
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._encryption_workers, thread_name_prefix="encrypt"
+            )
+        return self._executor
+
+    @staticmethod
+    def file_size(incoming: IncomingFile) -> int:
+        if incoming.size is not None:
+            return incoming.size
+        position = incoming.file.tell()
+        incoming.file.seek(0, os.SEEK_END)
+        size = incoming.file.tell() - position
+        incoming.file.seek(position)
+        return size
+
+    async def store(self, incoming: IncomingFile, owner_id: int) -> StoredObject:
+        """Cifra un documento con su propia clave de datos y lo sube a S3."""
+        data_key = await run_in_threadpool(self.keys.new_data_key)
+
+        size = self.file_size(incoming)
+        if size >= settings.S3_MULTIPART_PART_SIZE:
+            # Grande: cifrado y subida en streaming por partes
+            meter = CiphertextMeter(encrypt_stream(incoming.file, key=data_key.plaintext, **compression_options()))
+            s3_key = await self.storage.upload(meter, incoming.filename, owner_id)
+            stored_size, checksum = meter.total, meter.checksum
+        else:
+            loop = asyncio.get_running_loop()
+            encrypted = await loop.run_in_executor(
+                self._get_executor(),
+                partial(_encrypt_whole, incoming.file, data_key.plaintext),
+            )
+            s3_key = await self.storage.upload(encrypted, incoming.filename, owner_id)
+            stored_size, checksum = len(encrypted), hashlib.sha256(encrypted).hexdigest()
+
+        return StoredObject(
+            incoming.filename, s3_key, data_key.wrapped, data_key.provider,
+            size=size, stored_size=stored_size, checksum=checksum,
+        )
+
+    async def fingerprint_many(
+        self, files: Sequence[IncomingFile], owner_id: int
+    ) -> List[Union[bytes, Exception]]:
+        """Huellas de contenido de un lote (para el índice de deduplicación), en el pool de cifrado."""
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(
+            *(
+                loop.run_in_executor(self._get_executor(), fingerprinter.fingerprint, f.file, owner_id)
+                for f in files
+            ),
+            return_exceptions=True,
+        )
+
+    async def store_many(
+        self, files: Sequence[IncomingFile], owner_id: int
+    ) -> List[Union[StoredObject, Exception]]:
+        """
+        Procesa un lote de archivos por el pipeline. Devuelve, en el mismo orden, el
+        StoredObject de cada archivo o la excepción que lo hizo fallar: un archivo
+        defectuoso no tumba el resto del lote.
+        """
+        in_flight = asyncio.Semaphore(self._max_in_flight)
+
+        async def _guarded(incoming: IncomingFile):
+            async with in_flight:
+                return await self.store(incoming, owner_id)
+
+        return await asyncio.gather(*(_guarded(f) for f in files), return_exceptions=True)
+
+    async def discard(self, stored: Sequence[StoredObject]) -> None:
+        """Borra objetos ya subidos cuyo registro en la BD no llegó a crearse."""
+        results = await asyncio.gather(
+            *(self.storage.delete(obj.s3_key) for obj in stored), return_exceptions=True
+        )
+        for obj, result in zip(stored, results):
+            if isinstance(result, Exception):
+                print(f"No se pudo eliminar el objeto huérfano {obj.s3_key}: {result}")
+
+    async def data_key(self, wrapped_key: Optional[bytes], key_provider: Optional[str]) -> Optional[bytes]:
+        # Documentos con cifrado envolvente: su clave de datos (desde caché si está caliente).
+        # Documentos antiguos: None, se usa la clave global.
+        if wrapped_key is None:
+            return None
+        return await run_in_threadpool(self.keys.unwrap, key_provider, wrapped_key)
+
+    async def iter_plaintext(
+        self,
+        s3_key: str,
+        wrapped_key: Optional[bytes] = None,
+        key_provider: Optional[str] = None,
+        direct: bool = False,
+    ) -> AsyncIterator[bytes]:
+        """
+        Descarga y descifra un documento completo trozo a trozo. Los documentos en
+        formato por segmentos nunca se tienen enteros en memoria; los antiguos en
+        Fernet sí (el formato no permite otra cosa). Los de transferencia directa
+        (`direct`) los descifra S3 (SSE-KMS) y se devuelven tal cual llegan.
+        """
+        chunks = self.storage.iter_range(s3_key)
+        if direct:
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+            return
+
+        data_key = await self.data_key(wrapped_key, key_provider)
+        prefix = bytearray()
+        try:
+            async for chunk in chunks:
+                prefix += chunk
+                if len(prefix) >= HEADER_SIZE:
+                    break
+            if not is_stream_format(bytes(prefix)):
+                async for chunk in chunks:
+                    prefix += chunk
+                yield decrypt_file(bytes(prefix))
+                return
+
+            decryptor = SegmentDecryptor(parse_header(bytes(prefix[:HEADER_SIZE])), None, key=data_key)
+            for plaintext in decryptor.update(bytes(prefix[HEADER_SIZE:])):
+                yield plaintext
+            async for chunk in chunks:
+                for plaintext in decryptor.update(chunk):
+                    yield plaintext
+            for plaintext in decryptor.finalize():
+                yield plaintext
+        finally:
+            await chunks.aclose()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def compression_options() -> dict:
+    """Parámetros de compresión de encrypt_stream según la configuración (COMPRESSION_*)."""
+    return {
+        "codec": codec_from_name(settings.COMPRESSION_CODEC),
+        "compression_level": settings.COMPRESSION_LEVEL,
+        "max_compression_ratio": settings.COMPRESSION_MAX_RATIO,
+    }
+
+
+class CiphertextMeter:
+    """Deja pasar un flujo de trozos midiendo el objeto resultante: bytes y SHA-256."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = chunks
+        self._digest = hashlib.sha256()
+        self.total = 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._chunks:
+            self.total += len(chunk)
+            self._digest.update(chunk)
+            yield chunk
+
+    @property
+    def checksum(self) -> str:
+        return self._digest.hexdigest()
+
+
+def _encrypt_whole(file: BinaryIO, key: bytes) -> bytes:
+    return b"".join(encrypt_stream(file, key=key, **compression_options()))
+
+
+document_service = DocumentService(
+    storage=async_s3_service,
+    keys=key_service,
+    encryption_workers=settings.ENCRYPTION_WORKERS,
+    max_in_flight=settings.BATCH_UPLOAD_MAX_IN_FLIGHT,
+)
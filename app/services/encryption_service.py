@@ -1,25 +1,448 @@
+import base64
+import itertools
 import os
-from cryptography.fernet import Fernet
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from fastapi import HTTPException
 
+from app.core.metrics import ENCRYPTION_BYTES, ENCRYPTION_LATENCY, ENCRYPTION_SECONDS
+from app.services.compression import (
+    CODEC_MASK,
+    CODEC_NONE,
+    CODECS,
+    Decompressor,
+    compress_chunks,
+    worth_compressing,
+)
+
 # En un entorno real, esta clave NUNCA debe estar en el código.
 # Debe venir de las variables de entorno o de un servicio como AWS KMS.
-# Para generarla por primera vez puedes usar en consola: 
+# Para generarla por primera vez puedes usar en consola:
 # python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
-ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+#
+# La clave se lee y valida la primera vez que se necesita (no al importar el módulo).
+#
+# Rotación (al estilo de MultiFernet): ENCRYPTION_KEYS admite varias claves separadas por
+# comas. La primera es la principal y es la única con la que se cifra; las demás solo se
+# usan para descifrar lo que aún no se ha migrado (ver app/jobs/key_rotation.py).
+# Sin ENCRYPTION_KEYS se usa ENCRYPTION_KEY como única clave.
+_keys_lock = threading.Lock()
+_encryption_key: Optional[str] = None
+_encryption_keys: Optional[List[str]] = None
+_cipher_suite: Optional[MultiFernet] = None
+
+
+def _configured_keys() -> List[str]:
+    keys = [key.strip() for key in os.getenv("ENCRYPTION_KEYS", "").split(",") if key.strip()]
+    if not keys:
+        keys = [os.getenv("ENCRYPTION_KEY") or Fernet.generate_key().decode()]
+    return keys
+
+
+def _load_key() -> None:
+    global _encryption_key, _encryption_keys, _cipher_suite
+    with _keys_lock:
+        if _cipher_suite is not None:
+            return
+        keys = _configured_keys()
+        try:
+            _cipher_suite = MultiFernet([Fernet(key.encode()) for key in keys])
+        except ValueError:
+            raise RuntimeError("La ENCRYPTION_KEY no es válida. Debe ser una clave base64 de 32 bytes.")
+        _encryption_keys = keys
+        _encryption_key = keys[0]
+
+
+def get_cipher_suite() -> MultiFernet:
+    if _cipher_suite is None:
+        _load_key()
+    return _cipher_suite
+
+
+def __getattr__(name):
+    # Compatibilidad con el acceso directo a los atributos del módulo, ahora perezosos
+    if name == "cipher_suite":
+        return get_cipher_suite()
+    if name == "ENCRYPTION_KEY":
+        get_cipher_suite()
+        return _encryption_key
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Formato de cifrado por segmentos (streaming) ---
+# Fernet obliga a tener el documento entero en memoria y añade un 33% por el base64.
+# El formato "SDVS" cifra el documento en segmentos de tamaño fijo con AES-256-GCM:
+#
+#   cabecera: MAGIC (4) | versión (1) | flags (1) | tamaño de segmento (4) | salt (16)
+#   segmentos: AES-GCM(bloque de texto plano) + tag de 16 bytes
+#
+# - Cada documento deriva su propia clave (HKDF con el salt aleatorio de la cabecera),
+#   así el nonce puede ser simplemente el índice del segmento.
+# - La cabecera entera va como AAD en cada segmento: no se puede alterar sin detectarlo.
+# - El último segmento siempre es más corto que el tamaño de segmento (puede estar vacío)
+#   y lleva una marca en el nonce, de modo que truncar el objeto también se detecta.
+STREAM_MAGIC = b"SDVS"
+STREAM_VERSION = 1
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+MAX_SEGMENT_SIZE = 16 * 1024 * 1024
+TAG_SIZE = 16
+SALT_SIZE = 16
+
+_HEADER_STRUCT = struct.Struct(">4sBBI16s")
+HEADER_SIZE = _HEADER_STRUCT.size
+_HKDF_INFO = b"sdv-stream-v1"
+
+Source = Union[Iterable[bytes], BinaryIO]
+
+
+@dataclass(frozen=True)
+class StreamHeader:
+    """Cabecera de un objeto cifrado con el formato por segmentos."""
+    version: int
+    flags: int
+    segment_size: int
+    salt: bytes
+    raw: bytes
+
+    @property
+    def codec(self) -> int:
+        """Códec con el que se comprimió el documento antes de cifrarlo (0: sin comprimir)."""
+        return self.flags & CODEC_MASK
+
+
+def master_key_material() -> bytes:
+    # La clave Fernet son 32 bytes en base64; la usamos como material para HKDF.
+    return master_key_materials()[0]
+
+
+def master_key_materials() -> List[bytes]:
+    """Material de todas las claves configuradas, la principal primero."""
+    get_cipher_suite()
+    return [base64.urlsafe_b64decode(key.encode()) for key in _encryption_keys]
+
+
+def _new_header(segment_size: int, flags: int = 0) -> StreamHeader:
+    salt = os.urandom(SALT_SIZE)
+    raw = _HEADER_STRUCT.pack(STREAM_MAGIC, STREAM_VERSION, flags, segment_size, salt)
+    return StreamHeader(STREAM_VERSION, flags, segment_size, salt, raw)
+
+
+def parse_header(raw: bytes) -> StreamHeader:
+    """
+    Interpreta los primeros HEADER_SIZE bytes de un objeto cifrado por segmentos.
+    """
+    if len(raw) < HEADER_SIZE:
+        raise ValueError("Cabecera de cifrado incompleta.")
+    magic, version, flags, segment_size, salt = _HEADER_STRUCT.unpack(raw[:HEADER_SIZE])
+    if magic != STREAM_MAGIC or version != STREAM_VERSION:
+        raise ValueError("Formato de cifrado desconocido.")
+    if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+        raise ValueError("Tamaño de segmento no válido.")
+    if flags & CODEC_MASK not in CODECS.values():
+        raise ValueError("Códec de compresión desconocido.")
+    return StreamHeader(version, flags, segment_size, salt, bytes(raw[:HEADER_SIZE]))
+
+
+def is_stream_format(data: bytes) -> bool:
+    return data[:len(STREAM_MAGIC)] == STREAM_MAGIC
+
+
+class _SegmentCipher:
+    """
+    AES-GCM con la clave derivada para un documento concreto.
+
+    Sin clave de datos (documentos cifrados directamente con la clave global) el
+    objeto no indica con cuál de las claves configuradas se cifró: el primer segmento
+    se prueba con cada una, como hace MultiFernet, y la que funciona se queda fija.
+    Cifrar siempre usa la clave principal.
+    """
+
+    def __init__(self, header: StreamHeader, key: Optional[bytes] = None):
+        self._salt = header.salt
+        self._aad = header.raw
+        self._candidates = [key] if key is not None else master_key_materials()
+        self._aead = self._derive(self._candidates[0])
+        self._resolved = len(self._candidates) == 1
+
+    def _derive(self, material: bytes) -> AESGCM:
+        derived = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=self._salt,
+            info=_HKDF_INFO,
+        ).derive(material)
+        return AESGCM(derived)
+
+    def _resolve(self, nonce: bytes, data: bytes) -> bytes:
+        for position, material in enumerate(self._candidates):
+            aead = self._aead if position == 0 else self._derive(material)
+            try:
+                result = aead.decrypt(nonce, data, self._aad)
+            except InvalidTag:
+                continue
+            self._aead = aead
+            self._resolved = True
+            return result
+        raise InvalidTag()
+
+    @staticmethod
+    def _nonce(index: int, last: bool) -> bytes:
+        return index.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+
+    def encrypt(self, index: int, data: bytes, last: bool) -> bytes:
+        start = time.perf_counter()
+        result = self._aead.encrypt(self._nonce(index, last), data, self._aad)
+        _record_segment("encrypt", len(data), start)
+        return result
+
+    def decrypt(self, index: int, data: bytes, last: bool) -> bytes:
+        start = time.perf_counter()
+        if self._resolved:
+            result = self._aead.decrypt(self._nonce(index, last), data, self._aad)
+        else:
+            result = self._resolve(self._nonce(index, last), data)
+        _record_segment("decrypt", len(result), start)
+        return result
+
+
+def _record_segment(operation: str, size: int, start: float) -> None:
+    # Contadores y no histograma: por segmento solo interesa el throughput agregado
+    ENCRYPTION_SECONDS.inc(operation, amount=time.perf_counter() - start)
+    ENCRYPTION_BYTES.inc(operation, amount=size)
+
+
+def _iter_source(source: Source, chunk_size: int) -> Iterator[bytes]:
+    # Aceptamos tanto un objeto tipo fichero (UploadFile.file, open(...)) como un iterable de bytes.
+    if hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from source
+
+
+def _rechunk(chunks: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """
+    Reagrupa un flujo de bytes en bloques de exactamente `size` bytes.
+    El último bloque siempre es más corto que `size` (puede estar vacío).
+    """
+    pending = bytearray()
+    for chunk in chunks:
+        view = memoryview(chunk)
+        if pending:
+            take = size - len(pending)
+            pending += view[:take]
+            view = view[take:]
+            if len(pending) < size:
+                continue
+            yield bytes(pending)
+            pending = bytearray()
+        while len(view) >= size:
+            yield bytes(view[:size])
+            view = view[size:]
+        pending += view
+    yield bytes(pending)
+
+
+def _take_sample(chunks: Iterator[bytes], size: int) -> Tuple[bytes, bytes]:
+    """Lee del flujo hasta tener `size` bytes. Devuelve (muestra, lo leído de más)."""
+    sample = bytearray()
+    for chunk in chunks:
+        sample += chunk
+        if len(sample) >= size:
+            break
+    return bytes(sample[:size]), bytes(sample[size:])
+
+
+def encrypt_stream(
+    source: Source,
+    key: Optional[bytes] = None,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    codec: int = CODEC_NONE,
+    compression_level: int = 3,
+    max_compression_ratio: float = 0.9,
+) -> Iterator[bytes]:
+    """
+    Cifra un flujo de bytes (iterable o fichero) y va devolviendo la cabecera y los
+    segmentos cifrados. La memoria usada es constante: un segmento cada vez.
+
+    Con `codec` distinto de CODEC_NONE el flujo se comprime antes de cifrarlo, salvo
+    que la muestra inicial no baje de `max_compression_ratio` (ver compression.py).
+    """
+    if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+        raise ValueError("Tamaño de segmento no válido.")
+    chunks = _iter_source(source, segment_size)
+    if codec != CODEC_NONE:
+        sample, extra = _take_sample(chunks, segment_size)
+        chunks = itertools.chain([sample, extra], chunks)
+        if worth_compressing(sample, codec, compression_level, max_compression_ratio):
+            chunks = compress_chunks(chunks, codec, compression_level)
+        else:
+            codec = CODEC_NONE
+    try:
+        header = _new_header(segment_size, flags=codec)
+        cipher = _SegmentCipher(header, key)
+    except Exception as e:
+        print(f"Error durante el cifrado: {e}")
+        raise HTTPException(status_code=500, detail="Error al cifrar el documento.")
+
+    yield header.raw
+    for index, block in enumerate(_rechunk(chunks, segment_size)):
+        yield cipher.encrypt(index, block, last=len(block) < segment_size)
+
+
+def decrypt_stream(source: Source, key: Optional[bytes] = None) -> Iterator[bytes]:
+    """
+    Descifra un flujo producido por `encrypt_stream` segmento a segmento.
+    Si el contenido es un token Fernet antiguo, lo acumula y lo descifra de una vez
+    para que los documentos ya almacenados sigan siendo legibles.
+    """
+    chunks = _iter_source(source, DEFAULT_SEGMENT_SIZE + TAG_SIZE)
+    prefix = b""
+    for chunk in chunks:
+        prefix += chunk
+        if len(prefix) >= HEADER_SIZE:
+            break
+
+    if not is_stream_format(prefix):
+        yield decrypt_file(prefix + b"".join(chunks))
+        return
+
+    try:
+        header = parse_header(prefix)
+    except ValueError as e:
+        print(f"Error durante el descifrado: {e}")
+        raise HTTPException(status_code=500, detail="Error al descifrar el documento o clave inválida.")
+    decryptor = SegmentDecryptor(header, None, key=key)
+    yield from decryptor.update(prefix[HEADER_SIZE:])
+    for chunk in chunks:
+        yield from decryptor.update(chunk)
+    yield from decryptor.finalize()
+
+
+def plaintext_size(header: StreamHeader, ciphertext_size: int) -> int:
+    """
+    Calcula el tamaño del documento original a partir del tamaño del objeto cifrado,
+    sin necesidad de descargarlo.
+    """
+    body = ciphertext_size - HEADER_SIZE - TAG_SIZE
+    if body < 0:
+        raise ValueError("Objeto cifrado truncado.")
+    full_segments, remainder = divmod(body, header.segment_size + TAG_SIZE)
+    return full_segments * header.segment_size + remainder
+
+
+def segment_count(header: StreamHeader, ciphertext_size: int) -> int:
+    return (ciphertext_size - HEADER_SIZE - TAG_SIZE) // (header.segment_size + TAG_SIZE) + 1
+
+
+def encrypted_span(header: StreamHeader, ciphertext_size: int, start: int, end: int):
+    """
+    Traduce un rango de texto plano [start, end] (inclusivo) al rango mínimo de bytes
+    cifrados que lo contiene. Devuelve (primer segmento, inicio cifrado, fin cifrado).
+    """
+    encrypted_segment_size = header.segment_size + TAG_SIZE
+    first = start // header.segment_size
+    last = end // header.segment_size
+    ciphertext_start = HEADER_SIZE + first * encrypted_segment_size
+    ciphertext_end = min(HEADER_SIZE + (last + 1) * encrypted_segment_size, ciphertext_size) - 1
+    return first, ciphertext_start, ciphertext_end
+
+
+class SegmentDecryptor:
+    """
+    Descifra incrementalmente segmentos consecutivos que empiezan en `first_index`
+    (por ejemplo, la respuesta a una petición Range contra S3). Sigue el patrón
+    update()/finalize() para poder alimentarlo desde un flujo síncrono o asíncrono.
+
+    Con `total_segments=None` se descifra el objeto completo sin conocer su tamaño:
+    el último segmento es el bloque (más corto) que queda pendiente en finalize().
+    Si el documento se comprimió al cifrarlo, la salida ya sale descomprimida (y en
+    ese caso solo se puede descifrar desde el primer segmento).
+    """
+
+    def __init__(
+        self,
+        header: StreamHeader,
+        total_segments: Optional[int],
+        first_index: int = 0,
+        key: Optional[bytes] = None,
+    ):
+        if header.codec != CODEC_NONE and first_index != 0:
+            raise ValueError("Un documento comprimido no admite acceso aleatorio.")
+        try:
+            self._cipher = _SegmentCipher(header, key)
+            self._decompressor = Decompressor(header.codec) if header.codec != CODEC_NONE else None
+        except Exception as e:
+            print(f"Error durante el descifrado: {e}")
+            raise HTTPException(status_code=500, detail="Error al descifrar el documento o clave inválida.")
+        self._encrypted_segment_size = header.segment_size + TAG_SIZE
+        self._total_segments = total_segments
+        self._index = first_index
+        self._pending = bytearray()
+
+    def _decrypt(self, block: bytes, final: bool = False) -> bytes:
+        index = self._index
+        self._index += 1
+        if self._total_segments is None:
+            last = final
+        else:
+            last = index == self._total_segments - 1
+        try:
+            return self._cipher.decrypt(index, block, last=last)
+        except (InvalidTag, ValueError) as e:
+            print(f"Error durante el descifrado: {e!r}")
+            raise HTTPException(status_code=500, detail="Error al descifrar el documento o clave inválida.")
+
+    def _decompress(self, plaintext: bytes, final: bool = False) -> Iterator[bytes]:
+        if self._decompressor is None:
+            yield plaintext
+            return
+        try:
+            yield from self._decompressor.update(plaintext)
+            if final:
+                yield from self._decompressor.finalize()
+        except Exception as e:
+            print(f"Error durante la descompresión: {e!r}")
+            raise HTTPException(status_code=500, detail="Error al descifrar el documento o clave inválida.")
+
+    def update(self, chunk: bytes) -> Iterator[bytes]:
+        self._pending += chunk
+        size = self._encrypted_segment_size
+        while len(self._pending) >= size:
+            block = bytes(self._pending[:size])
+            del self._pending[:size]
+            yield from self._decompress(self._decrypt(block))
+
+    def finalize(self) -> Iterator[bytes]:
+        # Si el rango terminaba en un límite de segmento no queda nada pendiente
+        # (el último segmento real nunca está vacío: al menos contiene su tag).
+        if self._pending or self._total_segments is None:
+            block = bytes(self._pending)
+            self._pending = bytearray()
+            last = self._total_segments is None or self._index == self._total_segments - 1
+            yield from self._decompress(self._decrypt(block, final=True), final=last)
 
-try:
-    cipher_suite = Fernet(ENCRYPTION_KEY.encode())
-except ValueError:
-    raise RuntimeError("La ENCRYPTION_KEY no es válida. Debe ser una clave base64 de 32 bytes.")
 
 def encrypt_file(file_content: bytes) -> bytes:
     """
     Toma el contenido de un archivo en bytes y devuelve el contenido cifrado.
     """
     try:
-        encrypted_data = cipher_suite.encrypt(file_content)
-        return encrypted_data
+        with ENCRYPTION_LATENCY.time("encrypt_file"):
+            return b"".join(encrypt_stream([file_content]))
+    except HTTPException:
+        raise
     except Exception as e:
         # Registramos el error pero no exponemos detalles internos
         print(f"Error durante el cifrado: {e}")
@@ -28,10 +451,15 @@ def encrypt_file(file_content: bytes) -> bytes:
 def decrypt_file(encrypted_content: bytes) -> bytes:
     """
     Toma el contenido de un archivo cifrado en bytes y lo descifra.
+    Acepta tanto el formato por segmentos como los tokens Fernet antiguos.
     """
+    if is_stream_format(encrypted_content):
+        with ENCRYPTION_LATENCY.time("decrypt_file"):
+            return b"".join(decrypt_stream([encrypted_content]))
     try:
-        decrypted_data = cipher_suite.decrypt(encrypted_content)
+        with ENCRYPTION_LATENCY.time("decrypt_file_fernet"):
+            decrypted_data = get_cipher_suite().decrypt(encrypted_content)
         return decrypted_data
     except Exception as e:
         print(f"Error durante el descifrado: {e}")
-        raise HTTPException(status_code=500, detail="Error al descifrar el documento o clave inválida.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error al descifrar el documento o clave inválida.")
@@ -0,0 +1,162 @@
+import asyncio
+import posixpath
+import zipfile
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Deque, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.document_service import DocumentService, document_service
+
+
+@dataclass
+class ExportMember:
+    """Un documento a incluir en la exportación (lo necesario para leerlo de S3 y descifrarlo)."""
+    filename: str
+    s3_key: str
+    wrapped_key: Optional[bytes]
+    key_provider: Optional[str]
+    modified: datetime
+    # Transferencia directa: el objeto lo cifra S3 (SSE-KMS), no la app
+    direct: bool = False
+
+
+class _ZipSink:
+    """
+    Destino de zipfile que no admite seek: zipfile escribe entonces cada miembro con
+    descriptor de datos (tamaños y CRC al final) y nunca vuelve atrás. Lo escrito se
+    acumula solo hasta que el generador lo recoge con take().
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+_END = object()
+
+
+def _member_names(members: Iterable[ExportMember]) -> List[str]:
+    # Solo el nombre base (nada de rutas ni "..") y sin repetidos dentro del ZIP
+    names: List[str] = []
+    used: Set[str] = set()
+    for member in members:
+        name = posixpath.basename(member.filename.replace("\\", "/")).strip() or "documento"
+        if name in (".", ".."):
+            name = "documento"
+        candidate = name
+        stem, ext = posixpath.splitext(name)
+        counter = 1
+        while candidate.lower() in used:
+            candidate = f"{stem} ({counter}){ext}"
+            counter += 1
+        used.add(candidate.lower())
+        names.append(candidate)
+    return names
+
+
+def _zip_date_time(value: datetime) -> Tuple[int, int, int, int, int, int]:
+    # El formato ZIP no admite fechas anteriores a 1980
+    if value.year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return value.timetuple()[:6]
+
+
+# Exportación en streaming de muchos documentos en un único ZIP.
+#
+# El archivo nunca se construye en memoria ni en disco: cada miembro se descarga de S3,
+# se descifra y se escribe en el ZIP trozo a trozo, y lo escrito se envía al cliente
+# en cuanto se produce. Para no esperar a S3 entre documentos, los siguientes
+# `prefetch_window` documentos se empiezan a descargar mientras se escribe el actual,
+# cada uno con una cola de como mucho `prefetch_chunks` trozos: la memoria depende de
+# esos dos límites, no del tamaño de la exportación.
+class ExportService:
+    def __init__(self, documents: DocumentService, prefetch_window: int, prefetch_chunks: int):
+        self.documents = documents
+        self.prefetch_window = max(prefetch_window, 1)
+        self.prefetch_chunks = max(prefetch_chunks, 1)
+
+    async def _fetch(self, member: ExportMember, queue: asyncio.Queue) -> None:
+        # Cualquier fallo (también al abrir el documento) llega al consumidor por la cola:
+        # si la tarea muriera sin avisar, stream_zip esperaría para siempre
+        try:
+            chunks = self.documents.iter_plaintext(
+                member.s3_key, member.wrapped_key, member.key_provider, direct=member.direct
+            )
+            try:
+                async for chunk in chunks:
+                    await queue.put(chunk)
+            finally:
+                await chunks.aclose()
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_END)
+
+    async def stream_zip(self, members: List[ExportMember]) -> AsyncIterator[bytes]:
+        sink = _ZipSink()
+        archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+        names = iter(zip(members, _member_names(members)))
+        in_flight: Deque[Tuple[ExportMember, str, asyncio.Queue, asyncio.Task]] = deque()
+
+        def start_next() -> None:
+            entry = next(names, None)
+            if entry is None:
+                return
+            member, name = entry
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.prefetch_chunks)
+            in_flight.append((member, name, queue, asyncio.create_task(self._fetch(member, queue))))
+
+        # El documento que se está escribiendo más `prefetch_window` por adelantado
+        for _ in range(self.prefetch_window + 1):
+            start_next()
+
+        try:
+            while in_flight:
+                # Se queda en la cola hasta terminar: si el cliente corta, también se cancela
+                member, name, queue, task = in_flight[0]
+                info = zipfile.ZipInfo(name, date_time=_zip_date_time(member.modified))
+                info.compress_type = zipfile.ZIP_STORED
+                # Tamaño desconocido de antemano: forzamos ZIP64 para admitir miembros de más de 4 GiB
+                with archive.open(info, mode="w", force_zip64=True) as destination:
+                    while True:
+                        item = await queue.get()
+                        if item is _END:
+                            break
+                        if isinstance(item, Exception):
+                            print(f"Error exportando el documento {member.s3_key}: {item!r}")
+                            raise item
+                        destination.write(item)
+                        data = sink.take()
+                        if data:
+                            yield data
+                await task
+                in_flight.popleft()
+                start_next()
+                data = sink.take()
+                if data:
+                    yield data
+            archive.close()
+            yield sink.take()
+        finally:
+            for _, _, _, task in in_flight:
+                task.cancel()
+
+
+export_service = ExportService(
+    documents=document_service,
+    prefetch_window=settings.EXPORT_PREFETCH_WINDOW,
+    prefetch_chunks=settings.EXPORT_PREFETCH_CHUNKS,
+)
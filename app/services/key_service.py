@@ -0,0 +1,277 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.metrics import gauge_lines, registry
+from app.services.encryption_service import master_key_materials
+
+# --- Cifrado envolvente (envelope encryption) ---
+# Cada documento se cifra con su propia clave de datos (data key) aleatoria de 256 bits.
+# En la base de datos solo se guarda la clave de datos "envuelta" (cifrada) por un
+# proveedor de claves: local (con ENCRYPTION_KEY) o KMS, con la misma interfaz que
+# GenerateDataKey/Decrypt de AWS KMS. Comprometer una clave de datos solo expone un documento.
+
+DATA_KEY_SIZE = 32
+
+
+class DataKey(NamedTuple):
+    plaintext: bytes
+    wrapped: bytes
+    provider: str
+
+
+class KeyProvider(ABC):
+    """Interfaz de un proveedor de claves (compatible con el modelo de AWS KMS)."""
+    name = ""
+
+    @abstractmethod
+    def generate_data_key(self) -> Tuple[bytes, bytes]:
+        """Devuelve (clave de datos en claro, clave de datos envuelta)."""
+
+    @abstractmethod
+    def decrypt_data_key(self, wrapped: bytes) -> bytes:
+        """Devuelve la clave de datos en claro de una clave envuelta."""
+
+
+class LocalKeyProvider(KeyProvider):
+    """
+    Envuelve las claves de datos con AES-GCM usando una clave derivada de ENCRYPTION_KEY.
+    Con varias claves configuradas (ENCRYPTION_KEYS) envuelve con la principal y
+    desenvuelve con cualquiera de ellas.
+    """
+    name = "local"
+    _VERSION = b"\x01"
+    _NONCE_SIZE = 12
+
+    def __init__(self, master_key: Optional[bytes] = None, master_keys: Optional[Sequence[bytes]] = None):
+        if master_key is not None:
+            master_keys = [master_key]
+        self._master_keys = list(master_keys) if master_keys else None
+        self._aeads: Optional[List[AESGCM]] = None
+
+    def _get_aeads(self) -> List[AESGCM]:
+        if self._aeads is None:
+            self._aeads = [
+                AESGCM(HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"sdv-kek-v1").derive(material))
+                for material in (self._master_keys or master_key_materials())
+            ]
+        return self._aeads
+
+    def generate_data_key(self) -> Tuple[bytes, bytes]:
+        plaintext = os.urandom(DATA_KEY_SIZE)
+        return plaintext, self.wrap(plaintext)
+
+    def wrap(self, plaintext: bytes) -> bytes:
+        nonce = os.urandom(self._NONCE_SIZE)
+        return self._VERSION + nonce + self._get_aeads()[0].encrypt(nonce, plaintext, self._VERSION)
+
+    def unwrap_with_index(self, wrapped: bytes) -> Tuple[bytes, int]:
+        """Desenvuelve y devuelve también qué clave lo consiguió (0: la principal)."""
+        if wrapped[:1] != self._VERSION:
+            raise ValueError("Formato de clave envuelta desconocido.")
+        nonce = wrapped[1:1 + self._NONCE_SIZE]
+        for index, aead in enumerate(self._get_aeads()):
+            try:
+                return aead.decrypt(nonce, wrapped[1 + self._NONCE_SIZE:], self._VERSION), index
+            except InvalidTag:
+                continue
+        raise InvalidTag()
+
+    def decrypt_data_key(self, wrapped: bytes) -> bytes:
+        return self.unwrap_with_index(wrapped)[0]
+
+
+class KmsKeyProvider(KeyProvider):
+    """Proveedor respaldado por AWS KMS (GenerateDataKey / Decrypt)."""
+    name = "kms"
+
+    def __init__(self, key_id: str):
+        self.key_id = key_id
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+
+                    self._client = boto3.client(
+                        "kms",
+                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                        region_name=settings.AWS_REGION,
+                    )
+        return self._client
+
+    def generate_data_key(self) -> Tuple[bytes, bytes]:
+        response = self.client.generate_data_key(KeyId=self.key_id, KeySpec="AES_256")
+        return response["Plaintext"], response["CiphertextBlob"]
+
+    def decrypt_data_key(self, wrapped: bytes) -> bytes:
+        return self.client.decrypt(CiphertextBlob=wrapped, KeyId=self.key_id)["Plaintext"]
+
+
+class DataKeyCache:
+    """
+    Caché de claves de datos desenvueltas, acotada por número de entradas (LRU),
+    por tiempo de vida y por número de usos de cada entrada.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, max_uses: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_uses = max_uses
+        self._entries: "OrderedDict[Tuple[str, bytes], list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, provider: str, wrapped: bytes) -> Optional[bytes]:
+        key = (provider, bytes(wrapped))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            plaintext, expires_at, uses = entry
+            if expires_at <= time.monotonic() or uses >= self.max_uses:
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            entry[2] = uses + 1
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return plaintext
+
+    def put(self, provider: str, wrapped: bytes, plaintext: bytes) -> None:
+        if self.max_size <= 0:
+            return
+        key = (provider, bytes(wrapped))
+        with self._lock:
+            self._entries[key] = [plaintext, time.monotonic() + self.ttl_seconds, 0]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class EnvelopeKeyService:
+    def __init__(self, providers: Dict[str, KeyProvider], default_provider: str, cache: DataKeyCache):
+        self.providers = providers
+        self.default_provider = default_provider
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.provider_calls = 0
+
+    def _provider(self, name: str) -> KeyProvider:
+        provider = self.providers.get(name)
+        if provider is None:
+            raise HTTPException(status_code=500, detail="Proveedor de claves no configurado.")
+        return provider
+
+    def _count_call(self) -> None:
+        with self._lock:
+            self.provider_calls += 1
+
+    def new_data_key(self) -> DataKey:
+        """
+        Genera la clave de datos de un documento nuevo. La clave ya queda en caché:
+        las primeras descargas del documento no necesitan desenvolverla.
+        """
+        provider = self._provider(self.default_provider)
+        try:
+            plaintext, wrapped = provider.generate_data_key()
+        except Exception as e:
+            print(f"Error generando la clave de datos: {e}")
+            raise HTTPException(status_code=500, detail="Error al cifrar el documento.")
+        finally:
+            self._count_call()
+        self.cache.put(provider.name, wrapped, plaintext)
+        return DataKey(plaintext, wrapped, provider.name)
+
+    def unwrap(self, provider_name: str, wrapped: bytes) -> bytes:
+        """Devuelve la clave de datos en claro, desde la caché si es posible."""
+        plaintext = self.cache.get(provider_name, wrapped)
+        if plaintext is not None:
+            return plaintext
+        provider = self._provider(provider_name)
+        try:
+            plaintext = provider.decrypt_data_key(wrapped)
+        except Exception as e:
+            print(f"Error desenvolviendo la clave de datos: {e!r}")
+            raise HTTPException(status_code=500, detail="Error al descifrar el documento o clave inválida.")
+        finally:
+            self._count_call()
+        self.cache.put(provider_name, wrapped, plaintext)
+        return plaintext
+
+    def stats(self) -> dict:
+        cache_stats = self.cache.stats()
+        with self._lock:
+            provider_calls = self.provider_calls
+        return {
+            "provider": self.default_provider,
+            "provider_calls": provider_calls,
+            # Cada acierto de caché es una llamada al proveedor (KMS) que nos ahorramos
+            "provider_calls_avoided": cache_stats["hits"],
+            "cache": cache_stats,
+        }
+
+
+def _build_providers() -> Dict[str, KeyProvider]:
+    providers: Dict[str, KeyProvider] = {"local": LocalKeyProvider()}
+    if settings.KMS_KEY_ID:
+        providers["kms"] = KmsKeyProvider(settings.KMS_KEY_ID)
+    return providers
+
+
+key_service = EnvelopeKeyService(
+    providers=_build_providers(),
+    default_provider=settings.KEY_PROVIDER,
+    cache=DataKeyCache(
+        max_size=settings.DATA_KEY_CACHE_MAX_SIZE,
+        ttl_seconds=settings.DATA_KEY_CACHE_TTL_SECONDS,
+        max_uses=settings.DATA_KEY_CACHE_MAX_USES,
+    ),
+)
+
+
+def _key_metrics():
+    stats = key_service.stats()
+    return gauge_lines("data_key", "Caché de claves de datos y llamadas al proveedor de claves.", {
+        "provider_calls": stats["provider_calls"],
+        "cache_hits": stats["cache"]["hits"],
+        "cache_misses": stats["cache"]["misses"],
+        "cache_size": stats["cache"]["size"],
+    })
+
+
+registry.add_collector(_key_metrics)
@@ -0,0 +1,260 @@
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+# --- Caché en disco de objetos cifrados ---
+# Algunos documentos (plantillas, políticas compartidas) se descargan cientos de veces
+# por hora. La caché guarda en el disco local una copia de los objetos de S3 más pedidos
+# y los sirve desde un mmap, sin volver a S3.
+#
+# - Solo contiene lo mismo que S3: el objeto cifrado tal cual. El descifrado sigue
+#   haciéndose en cada descarga, así que el disco no guarda nada en claro. Los objetos de
+#   transferencia directa (que S3 descifra al leerlos) no pasan por aquí: se sirven con
+#   una URL prefirmada.
+# - Acotada por bytes totales con expulsión LRU, y por tamaño de cada objeto.
+# - Un fallo trae el objeto entero una sola vez: las peticiones simultáneas del mismo
+#   objeto esperan a esa descarga (single-flight) en vez de lanzar una cada una.
+# - Las claves de S3 nunca se reutilizan (llevan un uuid), pero la caché se invalida
+#   igualmente al borrar o escribir un objeto por AsyncS3Service.
+# - El índice vive en memoria y es de cada proceso: cada worker guarda sus ficheros en un
+#   subdirectorio propio de OBJECT_CACHE_DIR (pid y sufijo aleatorio) y solo borra los
+#   suyos, así varios workers pueden compartir el directorio. Al cerrar se borra entero;
+#   el de un worker que muera de golpe queda ahí hasta que se limpie a mano.
+
+_CHUNK_SIZE = 256 * 1024
+
+
+class CachedObject:
+    """Objeto guardado en la caché, leído desde un mmap de solo lectura."""
+    __slots__ = ("key", "path", "size", "_map")
+
+    def __init__(self, key: str, path: str, size: int, mapped: mmap.mmap):
+        self.key = key
+        self.path = path
+        self.size = size
+        self._map = mapped
+
+    def read(self, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Bytes [start, end] (ambos incluidos, como los rangos de S3)."""
+        end = self.size - 1 if end is None else min(end, self.size - 1)
+        return self._map[start:end + 1]
+
+    def iter_range(self, start: Optional[int] = None, end: Optional[int] = None, chunk_size: int = _CHUNK_SIZE) -> Iterator[bytes]:
+        position = start or 0
+        stop = self.size if end is None else min(end + 1, self.size)
+        while position < stop:
+            chunk_end = min(position + chunk_size, stop)
+            yield self._map[position:chunk_end]
+            position = chunk_end
+
+
+def _map_file(path: str) -> mmap.mmap:
+    # El mmap sigue siendo válido aunque después se cierre el fichero o se borre
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ObjectCache:
+    def __init__(self, directory: str, max_bytes: int, max_object_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self._entries: "OrderedDict[str, CachedObject]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        # Ficheros que el sistema no dejó borrar (en Windows, mientras alguien los tiene mapeados)
+        self._pending_removal: List[str] = []
+        self._lock = threading.Lock()
+        # Subdirectorio de este proceso, creado en la primera descarga (ya dentro del worker)
+        self.path: Optional[str] = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fills = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _prepare(self) -> str:
+        # El directorio se prepara en la primera descarga: importar el módulo no toca el disco
+        with self._lock:
+            if self.path is None:
+                os.makedirs(self.directory, mode=0o700, exist_ok=True)
+                self.path = tempfile.mkdtemp(prefix=f"worker-{os.getpid()}-", dir=self.directory)
+            return self.path
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Caché de objetos: no se pudo borrar {path}, se reintentará: {e}")
+            self._pending_removal.append(path)
+
+    def _remove_pending(self) -> None:
+        pending, self._pending_removal = self._pending_removal, []
+        for path in pending:
+            self._remove(path)
+
+    def admits(self, size: int) -> bool:
+        return 0 < size <= self.max_object_bytes
+
+    def _lookup(self, key: str, count: bool) -> Optional[CachedObject]:
+        # Con el lock tomado. Cada petición debe contar una sola consulta (acierto o fallo)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        if count:
+            if entry is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry
+
+    def get(self, key: str, count: bool = True) -> Optional[CachedObject]:
+        """
+        El objeto si está en la caché. Con `count=False` no cuenta en las estadísticas
+        (una lectura previa de la misma petición, que después consultará con `claim`).
+        """
+        with self._lock:
+            return self._lookup(key, count)
+
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Consulta la caché (cuenta como acierto o fallo) y devuelve un Future con el objeto
+        y si le toca traerlo a quien llama (con `fill`). En un acierto el Future ya tiene
+        el objeto; si otra petición lo está trayendo, solo hay que esperar el resultado.
+        """
+        future = Future()
+        # En curso desde ya: nadie puede cancelarlo y dejar sin resultado a los demás
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            entry = self._lookup(key, count=True)
+            if entry is not None:
+                future.set_result(entry)
+                return future, False
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.coalesced += 1
+                return inflight, False
+            self._inflight[key] = future
+            return future, True
+
+    def fill(self, key: str, future: Future, open_object: Callable[[], dict]) -> None:
+        """
+        Descarga el objeto al disco y resuelve `future` con él (None si no cabe en la
+        caché). `open_object` devuelve la respuesta de GetObject (como S3Service.get_object).
+        No lanza excepciones: los errores los reciben quienes esperan el future.
+        """
+        try:
+            entry = self._download(key, open_object)
+        except Exception as e:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            future.set_exception(e)
+            return
+
+        evicted: List[str] = []
+        with self._lock:
+            admitted = entry is not None and self._inflight.get(key) is future
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if admitted:
+                self._entries[key] = entry
+                self.bytes += entry.size
+                self.fills += 1
+                while self.bytes > self.max_bytes:
+                    _, oldest = self._entries.popitem(last=False)
+                    self.bytes -= oldest.size
+                    self.evictions += 1
+                    evicted.append(oldest.path)
+            if entry is not None and not admitted:
+                # Invalidado mientras se descargaba: sirve a quien lo esperaba, pero no se guarda
+                evicted.append(entry.path)
+            self._remove_pending()
+            for path in evicted:
+                self._remove(path)
+        future.set_result(entry)
+
+    def _download(self, key: str, open_object: Callable[[], dict]) -> Optional[CachedObject]:
+        response = open_object()
+        body = response["Body"]
+        try:
+            size = response["ContentLength"]
+            if not self.admits(size):
+                return None
+            fd, path = tempfile.mkstemp(prefix="obj-", suffix=".obj", dir=self._prepare())
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    for chunk in iter(lambda: body.read(_CHUNK_SIZE), b""):
+                        out.write(chunk)
+                    written = out.tell()
+                if written != size:
+                    raise ValueError(f"Objeto incompleto: {written} de {size} bytes")
+                return CachedObject(key, path, size, _map_file(path))
+            except BaseException:
+                self._remove(path)
+                raise
+        finally:
+            body.close()
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            # Una descarga en curso ya no se guardará al terminar
+            self._inflight.pop(key, None)
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self.bytes -= entry.size
+            self.invalidations += 1
+            self._remove(entry.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries.values():
+                self._remove(entry.path)
+            self._entries.clear()
+            self.bytes = 0
+            if self.path is not None and not self._pending_removal:
+                try:
+                    os.rmdir(self.path)
+                    self.path = None
+                except OSError as e:
+                    # Queda una descarga en curso escribiendo en él: se reutiliza
+                    print(f"Caché de objetos: no se pudo borrar {self.path}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "max_object_bytes": self.max_object_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "coalesced": self.coalesced,
+                "fills": self.fills,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _build_cache() -> Optional[ObjectCache]:
+    if settings.OBJECT_CACHE_MAX_BYTES <= 0:
+        return None
+    return ObjectCache(
+        settings.OBJECT_CACHE_DIR, settings.OBJECT_CACHE_MAX_BYTES, settings.OBJECT_CACHE_MAX_OBJECT_BYTES
+    )
+
+
+# Instancia global (None si la caché está desactivada); la usa async_s3_service
+object_cache = _build_cache()
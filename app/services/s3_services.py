@@ -1,30 +1,67 @@
-import boto3
-from botocore.exceptions import ClientError
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from botocore.exceptions import BotoCoreError, ClientError
 from app.core.config import settings
+from app.core.metrics import S3_ERRORS, S3_LATENCY
+
+# S3 exige que todas las partes salvo la última tengan al menos 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+# Máximo de claves por llamada a DeleteObjects
+MAX_DELETE_BATCH = 1000
+
 # Este servicio se encarga de manejar la interacción con Amazon S3 para subir archivos.
 class S3Service:
     def __init__(self):
-        # Inicializa el cliente de S3 usando las credenciales de la configuración
-        # En un entorno real, estas credenciales deben manejarse con cuidado (ej. usando IAM roles, AWS Secrets Manager, etc.)
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
-        )
+        # El cliente se crea la primera vez que se usa, no al importar el módulo:
+        # construirlo (y cargar boto3) es lento y no hace falta para arrancar la app.
+        self._client = None
+        self._client_lock = threading.Lock()
         self.bucket_name = settings.AWS_BUCKET_NAME
 
-    def upload_file(self, file_content: bytes, original_filename: str, user_id: int) -> str:
-        """
-        Sube un archivo a S3 y devuelve la clave (s3_key) generada.
-        """
+    @property
+    def s3_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    # Inicializa el cliente de S3 usando las credenciales de la configuración
+                    # En un entorno real, estas credenciales deben manejarse con cuidado (ej. usando IAM roles, AWS Secrets Manager, etc.)
+                    self._client = boto3.client(
+                        's3',
+                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                        region_name=settings.AWS_REGION,
+                        # Un único pool de conexiones acotado, compartido por todos los hilos que usan el cliente
+                        # SigV4 explícito: las URLs prefirmadas de objetos con SSE-KMS lo exigen
+                        config=Config(
+                            max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                            signature_version="s3v4",
+                        ),
+                    )
+                    _instrument_client(self._client)
+        return self._client
+
+    @staticmethod
+    def build_key(original_filename: str, user_id: int) -> str:
         # Generamos un nombre único para evitar colisiones (ej. si dos usuarios suben "foto.png")
         # Estructuramos carpetas por usuario en S3: "user_1/1234-uuid-foto.png"
         # Extraemos la extensión del archivo para mantenerla en el nombre final
         file_extension = original_filename.split(".")[-1] if "." in original_filename else ""
         unique_id = str(uuid.uuid4())
-        s3_key = f"user_{user_id}/{unique_id}.{file_extension}"
+        return f"user_{user_id}/{unique_id}.{file_extension}"
+
+    def upload_file(self, file_content: bytes, original_filename: str, user_id: int) -> str:
+        """
+        Sube un archivo a S3 y devuelve la clave (s3_key) generada.
+        """
+        s3_key = self.build_key(original_filename, user_id)
 
         try:
             self.s3_client.put_object(
@@ -37,7 +74,366 @@ class S3Service:
             print(f"Error subiendo archivo a S3: {e}")
             raise Exception("No se pudo subir el archivo al almacenamiento en la nube.")
 
+    def download_file(self, s3_key: str) -> bytes:
+        """
+        Descarga un objeto completo de S3 y devuelve su contenido (cifrado).
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
+            return response["Body"].read()
+        except ClientError as e:
+            print(f"Error descargando archivo de S3: {e}")
+            raise Exception("No se pudo descargar el archivo del almacenamiento en la nube.")
+
+    def get_object(self, s3_key: str, start: Optional[int] = None, end: Optional[int] = None) -> dict:
+        """
+        Abre un objeto de S3 (opcionalmente solo el rango de bytes [start, end]) sin leerlo.
+        Devuelve la respuesta de boto3; el contenido se lee en streaming desde response["Body"].
+        """
+        params = {"Bucket": self.bucket_name, "Key": s3_key}
+        if start is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            return self.s3_client.get_object(**params)
+        except ClientError as e:
+            print(f"Error descargando archivo de S3: {e}")
+            raise Exception("No se pudo descargar el archivo del almacenamiento en la nube.")
+
+    def delete_file(self, s3_key: str) -> None:
+        """
+        Elimina un objeto de S3.
+        """
+        try:
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
+        except ClientError as e:
+            print(f"Error eliminando archivo de S3: {e}")
+            raise Exception("No se pudo eliminar el archivo del almacenamiento en la nube.")
+
+    def list_files(self, prefix: str) -> List[str]:
+        """
+        Devuelve las claves de todos los objetos bajo un prefijo (ej. "user_1/").
+        """
+        keys = []
+        try:
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                keys.extend(obj["Key"] for obj in page.get("Contents", []))
+            return keys
+        except ClientError as e:
+            print(f"Error listando archivos de S3: {e}")
+            raise Exception("No se pudieron listar los archivos del almacenamiento en la nube.")
+
+    def iter_objects(self, prefix: str, page_size: int = 1000) -> Iterator[dict]:
+        """
+        Recorre los objetos bajo un prefijo página a página ({"Key", "LastModified", "Size"}),
+        en el orden de S3 (bytes UTF-8 de la clave), sin acumularlos en memoria.
+        """
+        try:
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            pages = paginator.paginate(
+                Bucket=self.bucket_name, Prefix=prefix, PaginationConfig={"PageSize": page_size}
+            )
+            for page in pages:
+                yield from page.get("Contents", [])
+        except ClientError as e:
+            print(f"Error listando archivos de S3: {e}")
+            raise Exception("No se pudieron listar los archivos del almacenamiento en la nube.")
+
+    def delete_files(self, s3_keys: List[str]) -> List[str]:
+        """
+        Elimina objetos con DeleteObjects, hasta MAX_DELETE_BATCH por llamada.
+        Devuelve las claves que S3 no pudo borrar.
+        """
+        failed = []
+        for start in range(0, len(s3_keys), MAX_DELETE_BATCH):
+            batch = s3_keys[start:start + MAX_DELETE_BATCH]
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+            except ClientError as e:
+                print(f"Error eliminando un lote de {len(batch)} objetos de S3: {e}")
+                failed.extend(batch)
+                continue
+            for error in response.get("Errors", []):
+                print(f"Error eliminando {error.get('Key')} de S3: {error.get('Code')}")
+                failed.append(error["Key"])
+        return failed
+
+    # --- Transferencia directa (el cliente sube y descarga contra S3 con URLs prefirmadas) ---
+    # Los bytes no pasan por la API: el cifrado lo hace S3 en reposo (SSE-KMS), no la app.
+
+    @staticmethod
+    def _sse_kms_params() -> dict:
+        params = {"ServerSideEncryption": "aws:kms"}
+        # Sin clave explícita S3 usa la clave gestionada aws/s3 de la cuenta
+        if settings.S3_SSE_KMS_KEY_ID:
+            params["SSEKMSKeyId"] = settings.S3_SSE_KMS_KEY_ID
+        return params
+
+    def create_direct_upload(self, original_filename: str, user_id: int) -> Tuple[str, str]:
+        """
+        Inicia una subida multiparte cifrada con SSE-KMS. Devuelve (s3_key, upload_id).
+        """
+        s3_key = self.build_key(original_filename, user_id)
+        try:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=s3_key, **self._sse_kms_params()
+            )
+            return s3_key, response["UploadId"]
+        except ClientError as e:
+            print(f"Error iniciando subida directa a S3: {e}")
+            raise Exception("No se pudo iniciar la subida al almacenamiento en la nube.")
+
+    def presign_upload_parts(self, s3_key: str, upload_id: str, part_count: int, expires_in: int) -> List[str]:
+        """
+        URLs prefirmadas (PUT) para las partes 1..part_count de una subida multiparte.
+        Se firman en local, sin llamadas a S3.
+        """
+        return [
+            self.s3_client.generate_presigned_url(
+                "upload_part",
+                Params={"Bucket": self.bucket_name, "Key": s3_key, "UploadId": upload_id, "PartNumber": number},
+                ExpiresIn=expires_in,
+            )
+            for number in range(1, part_count + 1)
+        ]
+
+    def list_uploaded_parts(self, s3_key: str, upload_id: str) -> List[dict]:
+        """
+        Partes ya recibidas de una subida multiparte ({"PartNumber", "ETag", "Size"}).
+        """
+        parts = []
+        try:
+            paginator = self.s3_client.get_paginator("list_parts")
+            for page in paginator.paginate(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id):
+                parts.extend(page.get("Parts", []))
+            return parts
+        except ClientError as e:
+            print(f"Error listando las partes de la subida {upload_id}: {e}")
+            raise Exception("No se pudo consultar la subida en el almacenamiento en la nube.")
+
+    def complete_direct_upload(self, s3_key: str, upload_id: str, parts: List[dict]) -> None:
+        """
+        Cierra una subida multiparte con las partes dadas (las de list_uploaded_parts):
+        el servidor toma los ETag de S3, así el cliente no necesita leerlos de las respuestas.
+        """
+        try:
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    "Parts": [
+                        {"ETag": part["ETag"], "PartNumber": part["PartNumber"]}
+                        for part in sorted(parts, key=lambda part: part["PartNumber"])
+                    ]
+                },
+            )
+        except ClientError as e:
+            print(f"Error completando la subida directa {upload_id}: {e}")
+            raise Exception("No se pudo completar la subida al almacenamiento en la nube.")
+
+    def abort_direct_upload(self, s3_key: str, upload_id: str) -> bool:
+        return self._abort_multipart_upload(s3_key, upload_id)
+
+    def presign_download(self, s3_key: str, filename: str, expires_in: int) -> str:
+        """
+        URL prefirmada (GET) de un objeto. S3 lo descifra (SSE-KMS) y lo sirve con
+        Content-Disposition de descarga y el nombre original.
+        """
+        return self.s3_client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket_name,
+                "Key": s3_key,
+                "ResponseContentDisposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+            },
+            ExpiresIn=expires_in,
+        )
+
+    def upload_stream(
+        self,
+        chunks: Iterable[bytes],
+        original_filename: str,
+        user_id: int,
+        part_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+    ) -> str:
+        """
+        Sube un flujo de bytes a S3 mediante subida multiparte y devuelve la s3_key.
+
+        Las partes se suben en paralelo según van llegando (por ejemplo, desde
+        `encrypt_stream`), con como mucho `max_workers` partes en memoria a la vez.
+        Si el flujo cabe en una sola parte se usa un único put_object.
+        """
+        part_size = part_size or settings.S3_MULTIPART_PART_SIZE
+        max_workers = max_workers or settings.S3_MULTIPART_WORKERS
+        if part_size < MIN_PART_SIZE:
+            raise ValueError("El tamaño de parte debe ser de al menos 5 MiB.")
+
+        s3_key = self.build_key(original_filename, user_id)
+        parts = self._iter_parts(chunks, part_size)
+        head = [next(parts)]
+        following = next(parts, None)
+        if following is None:
+            try:
+                self.s3_client.put_object(Bucket=self.bucket_name, Key=s3_key, Body=head[0])
+                return s3_key
+            except ClientError as e:
+                print(f"Error subiendo archivo a S3: {e}")
+                raise Exception("No se pudo subir el archivo al almacenamiento en la nube.")
+
+        head.append(following)
+        del following
+        try:
+            upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=s3_key
+            )["UploadId"]
+        except ClientError as e:
+            print(f"Error iniciando subida multiparte a S3: {e}")
+            raise Exception("No se pudo subir el archivo al almacenamiento en la nube.")
+
+        try:
+            etags = self._upload_parts(s3_key, upload_id, head, parts, max_workers)
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    "Parts": [
+                        {"ETag": etag, "PartNumber": number}
+                        for number, etag in enumerate(etags, start=1)
+                    ]
+                },
+            )
+            return s3_key
+        except Exception as e:
+            print(f"Error en la subida multiparte a S3, abortando: {e}")
+            self._abort_multipart_upload(s3_key, upload_id)
+            raise Exception("No se pudo subir el archivo al almacenamiento en la nube.")
+
+    def _upload_parts(
+        self,
+        s3_key: str,
+        upload_id: str,
+        head: list,
+        parts: Iterator[bytes],
+        max_workers: int,
+    ) -> list:
+        # El semáforo limita las partes en vuelo: no leemos (ni ciframos) la siguiente
+        # parte hasta que haya un hueco libre, así la memoria no depende del tamaño del archivo.
+        slots = threading.BoundedSemaphore(max_workers)
+        failed = threading.Event()
+        futures = []
+
+        def _on_done(future):
+            if future.exception() is not None:
+                failed.set()
+            slots.release()
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-part") as pool:
+            for number, data in enumerate(_chain(head, parts), start=1):
+                slots.acquire()
+                if failed.is_set():
+                    slots.release()
+                    break
+                future = pool.submit(self._upload_part, s3_key, upload_id, number, data)
+                future.add_done_callback(_on_done)
+                futures.append(future)
+                del data
+
+        # result() relanza la primera excepción de una parte fallida
+        return [future.result() for future in futures]
+
+    def _upload_part(self, s3_key: str, upload_id: str, number: int, data: bytes) -> str:
+        # Reintentamos solo la parte que falla, con espera exponencial
+        attempts = settings.S3_MULTIPART_MAX_RETRIES + 1
+        for attempt in range(attempts):
+            try:
+                response = self.s3_client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=data,
+                )
+                return response["ETag"]
+            except (ClientError, BotoCoreError) as e:
+                if attempt == attempts - 1:
+                    raise
+                print(f"Error subiendo la parte {number} a S3 (intento {attempt + 1}): {e}")
+                time.sleep(0.2 * 2 ** attempt)
+
+    def _abort_multipart_upload(self, s3_key: str, upload_id: str) -> bool:
+        """Aborta una subida multiparte. False si no se pudo (sus partes siguen en S3)."""
+        try:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+                # Ya no existe: se completó o se abortó antes
+                return True
+            print(f"Error abortando la subida multiparte {upload_id}: {e}")
+            return False
+        except BotoCoreError as e:
+            print(f"Error abortando la subida multiparte {upload_id}: {e}")
+            return False
+        return True
+
+    @staticmethod
+    def _iter_parts(chunks: Iterable[bytes], part_size: int) -> Iterator[bytes]:
+        # Agrupa el flujo en partes de `part_size` bytes; la última puede ser más corta.
+        # Siempre produce al menos una parte (vacía si el flujo lo está).
+        buffer = bytearray()
+        produced = False
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= part_size:
+                yield bytes(buffer[:part_size])
+                del buffer[:part_size]
+                produced = True
+        if buffer or not produced:
+            yield bytes(buffer)
+
+
+def _instrument_client(client) -> None:
+    # Medimos en los eventos de botocore, así cada llamada a la API (PutObject, UploadPart,
+    # GetObject...) queda registrada, venga del método que venga. En GetObject se mide
+    # hasta tener la respuesta, no la lectura del cuerpo.
+    def before_call(model, context, **kwargs):
+        context["metrics_call"] = (model.name, time.perf_counter())
+
+    def after_call(context, http_response, **kwargs):
+        _observe_call(context, failed=http_response.status_code >= 400)
+
+    def after_call_error(context, **kwargs):
+        _observe_call(context, failed=True)
+
+    client.meta.events.register("before-call.s3", before_call)
+    client.meta.events.register("after-call.s3", after_call)
+    client.meta.events.register("after-call-error.s3", after_call_error)
+
+
+def _observe_call(context: dict, failed: bool) -> None:
+    call = context.pop("metrics_call", None)
+    if call is None:
+        return
+    operation, start = call
+    S3_LATENCY.observe(time.perf_counter() - start, operation)
+    if failed:
+        S3_ERRORS.inc(operation)
+
+
+def _chain(head: list, rest: Iterator[bytes]) -> Iterator[bytes]:
+    # Vaciamos la lista según avanzamos para no retener las primeras partes en memoria
+    while head:
+        yield head.pop(0)
+    yield from rest
+
 # Instancia global del servicio para ser usada en los endpoints
 # Esto permite reutilizar la conexión a S3 y mantener el código organizado.
 # En un entorno real, podríamos considerar manejar esta instancia con un patrón de diseño más robusto o usar inyección de dependencias.
-s3_service = S3Service()
\ No newline at end of file
+s3_service = S3Service()
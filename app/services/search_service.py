@@ -0,0 +1,172 @@
+import heapq
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import Document
+
+# --- Búsqueda de documentos por nombre ---
+# Tres tipos de coincidencia, en este orden: el nombre empieza por el texto buscado, lo
+# contiene, o se le parece (tolerancia a erratas por similitud de trigramas). Dentro de
+# cada grupo se ordena por similitud y después por id, de más reciente a más antiguo.
+#
+# En PostgreSQL todo se resuelve con el índice GIN de trigramas (pg_trgm) sobre
+# documents.filename: ILIKE '%texto%' y el operador %> lo usan, así que el coste depende
+# de las filas que coinciden y no del total de la tabla. En SQLite (tests y desarrollo)
+# se recorren los nombres del usuario y se puntúan en Python con el mismo criterio.
+
+MATCH_PREFIX = "prefix"
+MATCH_SUBSTRING = "substring"
+MATCH_FUZZY = "fuzzy"
+_MATCH_RANK = {MATCH_PREFIX: 0, MATCH_SUBSTRING: 1, MATCH_FUZZY: 2}
+_MATCH_BY_RANK = {rank: match for match, rank in _MATCH_RANK.items()}
+
+# Como pg_trgm: las palabras son secuencias alfanuméricas; el resto separa
+_WORD = re.compile(r"[^\W_]+")
+
+
+@dataclass
+class SearchHit:
+    id: int
+    filename: str
+    upload_date: datetime
+    is_encrypted: bool
+    size: Optional[int]
+    match: str
+    score: float
+
+
+# --- Trigramas (mismo criterio que pg_trgm, para el modo sin PostgreSQL) ---
+
+def _word_trigrams(word: str) -> List[str]:
+    padded = f"  {word} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigramas de un texto como los calcula pg_trgm (minúsculas, palabras con relleno)."""
+    return {trigram for word in _WORD.findall(text.lower()) for trigram in _word_trigrams(word)}
+
+
+def similarity(a: str, b: str) -> float:
+    """Equivalente a similarity() de pg_trgm: trigramas comunes / trigramas totales."""
+    first, second = trigrams(a), trigrams(b)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def word_similarity(query: str, text: str) -> float:
+    """
+    Equivalente a word_similarity() de pg_trgm: la mayor similitud entre los trigramas de
+    `query` y cualquier tramo continuo de los trigramas de `text`. Así una palabra del
+    nombre se parece a la búsqueda aunque el nombre completo sea mucho más largo.
+    """
+    wanted = trigrams(query)
+    if not wanted:
+        return 0.0
+    ordered = [t for word in _WORD.findall(text.lower()) for t in _word_trigrams(word)]
+    best = 0.0
+    for start in range(len(ordered)):
+        extent: Set[str] = set()
+        shared = 0
+        for trigram in ordered[start:]:
+            if trigram in extent:
+                continue
+            extent.add(trigram)
+            if trigram in wanted:
+                shared += 1
+            if shared:
+                best = max(best, shared / (len(wanted) + len(extent) - shared))
+    return best
+
+
+# --- Búsqueda ---
+
+def _like_pattern(text: str, prefix_only: bool) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%" if prefix_only else f"%{escaped}%"
+
+
+def _search_postgres(db: Session, owner_id: int, query: str, limit: int, offset: int, threshold: float) -> List[SearchHit]:
+    # Umbral de %> solo para esta transacción
+    db.execute(select(func.set_config("pg_trgm.word_similarity_threshold", str(threshold), True)))
+    is_prefix = Document.filename.ilike(_like_pattern(query, True), escape="\\")
+    is_substring = Document.filename.ilike(_like_pattern(query, False), escape="\\")
+    rank = case((is_prefix, 0), (is_substring, 1), else_=2)
+    score = func.word_similarity(query, Document.filename)
+    rows = db.execute(
+        select(
+            Document.id,
+            Document.filename,
+            Document.upload_date,
+            Document.is_encrypted,
+            Document.size,
+            rank.label("rank"),
+            score.label("score"),
+        )
+        .where(Document.owner_id == owner_id, is_substring | Document.filename.op("%>")(query))
+        .order_by(rank, score.desc(), Document.id.desc())
+        .offset(offset)
+        .limit(limit)
+    ).all()
+    return [
+        SearchHit(
+            row.id, row.filename, row.upload_date, row.is_encrypted, row.size, _MATCH_BY_RANK[row.rank], float(row.score)
+        )
+        for row in rows
+    ]
+
+
+def _match(query: str, filename: str, threshold: float):
+    """(rango, similitud) de un nombre, o None si no coincide."""
+    needle, name = query.lower(), filename.lower()
+    score = word_similarity(query, filename)
+    if name.startswith(needle):
+        return _MATCH_RANK[MATCH_PREFIX], score
+    if needle in name:
+        return _MATCH_RANK[MATCH_SUBSTRING], score
+    if score >= threshold:
+        return _MATCH_RANK[MATCH_FUZZY], score
+    return None
+
+
+def _search_python(db: Session, owner_id: int, query: str, limit: int, offset: int, threshold: float) -> List[SearchHit]:
+    rows: Iterable = db.execute(
+        select(Document.id, Document.filename, Document.upload_date, Document.is_encrypted, Document.size)
+        .where(Document.owner_id == owner_id)
+        .execution_options(yield_per=1000)
+    )
+    candidates = []
+    for row in rows:
+        matched = _match(query, row.filename, threshold)
+        if matched is not None:
+            candidates.append((matched[0], -matched[1], -row.id, row))
+    # Solo hace falta ordenar hasta el final de la página pedida
+    best = heapq.nsmallest(offset + limit, candidates)[offset:]
+    return [
+        SearchHit(row.id, row.filename, row.upload_date, row.is_encrypted, row.size, _MATCH_BY_RANK[rank], -negative_score)
+        for rank, negative_score, _, row in best
+    ]
+
+
+def search_documents(
+    db: Session,
+    owner_id: int,
+    query: str,
+    limit: int,
+    offset: int = 0,
+    threshold: float = settings.SEARCH_SIMILARITY_THRESHOLD,
+) -> List[SearchHit]:
+    """Documentos de `owner_id` cuyo nombre coincide con `query`, ordenados por relevancia."""
+    query = query.strip()
+    if not query:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _search_postgres(db, owner_id, query, limit, offset, threshold)
+    return _search_python(db, owner_id, query, limit, offset, threshold)
@@ -0,0 +1,162 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import and_, func, insert, literal, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import Document, UserUsage
+
+# --- Uso de almacenamiento y cuotas ---
+# Cada usuario tiene una fila en user_usage con sus contadores (documentos, bytes
+# originales y bytes en S3) y la versión de sus documentos, que sube con cada cambio y
+# sirve de ETag del listado. Subidas y borrados los actualizan en su propia transacción
+# con un UPDATE relativo (bytes_used = bytes_used + n), que no pierde incrementos
+# concurrentes. La cuota se comprueba en dos momentos:
+# - antes de subir nada (check_quota / remaining_bytes), leyendo solo esa fila, para no
+#   cifrar ni subir archivos que luego no caben;
+# - al registrar los documentos (charge), con la condición dentro del propio UPDATE, así
+#   dos subidas simultáneas no pueden pasarse de la cuota entre las dos.
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, requested: int, available: Optional[int] = None):
+        self.requested = requested
+        self.available = available
+        super().__init__("Cuota de almacenamiento superada")
+
+
+def _quota_expression():
+    """Cuota efectiva en SQL: la del usuario o la general (NULL si no hay límite)."""
+    if settings.STORAGE_QUOTA_BYTES > 0:
+        return func.coalesce(UserUsage.quota_bytes, settings.STORAGE_QUOTA_BYTES)
+    return UserUsage.quota_bytes
+
+
+def _effective_quota(quota_bytes: Optional[int]) -> Optional[int]:
+    if quota_bytes is not None:
+        return quota_bytes
+    return settings.STORAGE_QUOTA_BYTES if settings.STORAGE_QUOTA_BYTES > 0 else None
+
+
+def _ensure_row(db: Session, owner_id: int) -> None:
+    if db.scalar(select(UserUsage.user_id).where(UserUsage.user_id == owner_id)) is not None:
+        return
+    try:
+        # Si otra transacción la crea a la vez, solo se deshace este INSERT
+        with db.begin_nested():
+            db.execute(insert(UserUsage).values(
+                user_id=owner_id, document_count=0, bytes_used=0, bytes_stored=0, documents_version=0
+            ))
+    except IntegrityError:
+        pass
+
+
+def get_usage(db: Session, owner_id: int) -> dict:
+    row = db.execute(
+        select(UserUsage.document_count, UserUsage.bytes_used, UserUsage.bytes_stored, UserUsage.quota_bytes)
+        .where(UserUsage.user_id == owner_id)
+    ).first()
+    count, used, stored, quota = row if row is not None else (0, 0, 0, None)
+    quota = _effective_quota(quota)
+    return {
+        "document_count": count,
+        "bytes_used": used,
+        "bytes_stored": stored,
+        "quota_bytes": quota,
+        "bytes_available": None if quota is None else max(quota - used, 0),
+    }
+
+
+def remaining_bytes(db: Session, owner_id: int) -> Optional[int]:
+    """Bytes que aún caben en la cuota del usuario (None: sin límite)."""
+    return get_usage(db, owner_id)["bytes_available"]
+
+
+def check_quota(db: Session, owner_id: int, incoming_bytes: int) -> None:
+    available = remaining_bytes(db, owner_id)
+    if available is not None and incoming_bytes > available:
+        raise QuotaExceeded(incoming_bytes, available)
+
+
+def charge(db: Session, owner_id: int, documents: int, size: int, stored_size: int, enforce_quota: bool = True) -> None:
+    """
+    Suma documentos al uso del usuario, en la transacción del llamador. Con
+    `enforce_quota` lanza QuotaExceeded (sin cambiar nada) si se pasaría de la cuota.
+    """
+    _ensure_row(db, owner_id)
+    statement = update(UserUsage).where(UserUsage.user_id == owner_id)
+    if enforce_quota and size > 0:
+        quota = _quota_expression()
+        statement = statement.where(or_(quota.is_(None), UserUsage.bytes_used + size <= quota))
+    updated = db.execute(
+        statement.values(
+            document_count=UserUsage.document_count + documents,
+            bytes_used=UserUsage.bytes_used + size,
+            bytes_stored=UserUsage.bytes_stored + stored_size,
+            documents_version=UserUsage.documents_version + 1,
+            updated_at=datetime.now(timezone.utc),
+        )
+    ).rowcount
+    if updated == 0:
+        raise QuotaExceeded(size)
+
+
+def release(db: Session, owner_id: int, documents: int, size: int, stored_size: int) -> None:
+    """Resta documentos borrados del uso del usuario, en la transacción del llamador."""
+    charge(db, owner_id, -documents, -size, -stored_size, enforce_quota=False)
+
+
+def reconcile(db: Session) -> dict:
+    """
+    Recalcula todos los contadores a partir de la tabla documents, en bloque (dos
+    sentencias) y en una transacción. Devuelve cuántos usuarios tenían contadores
+    desviados. Las cuotas propias de cada usuario se conservan.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # Las subidas y borrados que lleguen mientras tanto esperan a que termine, y
+        # después aplican su incremento sobre el valor ya recalculado
+        db.execute(text("LOCK TABLE user_usage IN EXCLUSIVE MODE"))
+
+    owner = Document.owner_id == UserUsage.user_id
+    count = select(func.count(Document.id)).where(owner).scalar_subquery()
+    used = select(func.coalesce(func.sum(Document.size), 0)).where(owner).scalar_subquery()
+    stored = select(func.coalesce(func.sum(Document.stored_size), 0)).where(owner).scalar_subquery()
+
+    drifted = db.scalar(
+        select(func.count(UserUsage.user_id)).where(
+            or_(UserUsage.document_count != count, UserUsage.bytes_used != used, UserUsage.bytes_stored != stored)
+        )
+    )
+    updated = db.execute(
+        update(UserUsage).values(
+            document_count=count,
+            bytes_used=used,
+            bytes_stored=stored,
+            # Los tamaños pueden haber cambiado (--backfill): invalida los listados cacheados
+            documents_version=UserUsage.documents_version + 1,
+            updated_at=datetime.now(timezone.utc),
+        )
+    ).rowcount
+
+    has_row = select(UserUsage.user_id).where(UserUsage.user_id == Document.owner_id).exists()
+    missing = (
+        select(
+            Document.owner_id,
+            func.count(Document.id),
+            func.coalesce(func.sum(Document.size), 0),
+            func.coalesce(func.sum(Document.stored_size), 0),
+            literal(1),
+            func.now(),
+        )
+        .where(and_(Document.owner_id.is_not(None), ~has_row))
+        .group_by(Document.owner_id)
+    )
+    created = db.execute(
+        insert(UserUsage).from_select(
+            ["user_id", "document_count", "bytes_used", "bytes_stored", "documents_version", "updated_at"], missing
+        )
+    ).rowcount
+    db.commit()
+    return {"users": updated + created, "drifted": drifted, "created": created}
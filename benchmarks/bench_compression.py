@@ -0,0 +1,126 @@
+"""
+Benchmark de la compresión antes del cifrado: ratio y throughput sobre un corpus mixto.
+
+El corpus se genera en memoria con los tipos de documento habituales: texto, CSV,
+XML de ofimática, un .docx (XML ya comprimido en ZIP), un "JPEG" y un PDF con imagen
+(estos dos con contenido aleatorio, que es como se comportan frente a un compresor).
+Para cada códec se mide el tamaño almacenado frente al original y los MB/s de cifrado
+y descifrado, y se indica si el muestreo decidió no comprimir.
+
+Uso:
+    python -m benchmarks.bench_compression --size-mb 4 --codecs none zlib zstd
+"""
+import argparse
+import io
+import os
+import random
+import time
+import zipfile
+
+os.environ.setdefault("ENCRYPTION_KEY", "L2xz2fJnTsQqGJZIOwtZ4g1t_EyTGxQzd-5CQANC_3k=")
+
+from app.services.compression import codec_from_name
+from app.services.encryption_service import decrypt_file, encrypt_stream, parse_header
+
+_WORDS = (
+    "contrato cliente factura importe fecha firma documento anexo cláusula proveedor "
+    "servicio pago entrega plazo condiciones acuerdo partes vigencia penalización total"
+).split()
+
+
+def _text(size: int, rng: random.Random) -> bytes:
+    out = io.StringIO()
+    while out.tell() < size:
+        out.write(" ".join(rng.choices(_WORDS, k=12)) + ".\n")
+    return out.getvalue().encode()[:size]
+
+
+def _csv(size: int, rng: random.Random) -> bytes:
+    out = io.StringIO()
+    out.write("id;fecha;cliente;importe;estado\n")
+    i = 0
+    while out.tell() < size:
+        out.write(f"{i};2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d};"
+                  f"cliente_{rng.randint(1, 500)};{rng.uniform(1, 9999):.2f};{rng.choice(['ok', 'pendiente'])}\n")
+        i += 1
+    return out.getvalue().encode()[:size]
+
+
+def _office_xml(size: int, rng: random.Random) -> bytes:
+    out = io.StringIO()
+    out.write('<?xml version="1.0" encoding="UTF-8"?><w:document><w:body>')
+    while out.tell() < size:
+        out.write(f'<w:p><w:r><w:rPr><w:b/></w:rPr><w:t>{" ".join(rng.choices(_WORDS, k=8))}</w:t></w:r></w:p>')
+    return out.getvalue().encode()[:size]
+
+
+def _docx(size: int, rng: random.Random) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("word/document.xml", _office_xml(size * 4, rng))
+    return buffer.getvalue()
+
+
+def _jpeg(size: int, rng: random.Random) -> bytes:
+    return b"\xff\xd8\xff\xe0" + rng.randbytes(size - 4)
+
+
+def _pdf_with_image(size: int, rng: random.Random) -> bytes:
+    head = b"%PDF-1.7\n1 0 obj << /Type /XObject /Subtype /Image /Filter /DCTDecode >>\nstream\n"
+    return head + rng.randbytes(size - len(head))
+
+
+CORPUS = {
+    "texto": _text,
+    "csv": _csv,
+    "xml": _office_xml,
+    "docx": _docx,
+    "jpeg": _jpeg,
+    "pdf-imagen": _pdf_with_image,
+}
+
+
+def measure(payload: bytes, codec: int, level: int) -> dict:
+    start = time.perf_counter()
+    blob = b"".join(encrypt_stream([payload], codec=codec, compression_level=level))
+    encrypted = time.perf_counter()
+    assert decrypt_file(blob) == payload
+    decrypted = time.perf_counter()
+    megabytes = len(payload) / (1024 * 1024)
+    return {
+        "ratio": len(blob) / len(payload),
+        "compressed": parse_header(blob).codec != 0,
+        "encrypt_mb_s": megabytes / (encrypted - start),
+        "decrypt_mb_s": megabytes / (decrypted - encrypted),
+        "stored": len(blob),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=4, help="tamaño de cada documento del corpus")
+    parser.add_argument("--codecs", nargs="+", default=["none", "zlib", "zstd"])
+    parser.add_argument("--level", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    size = int(args.size_mb * 1024 * 1024)
+    corpus = {name: build(size, rng) for name, build in CORPUS.items()}
+    original = sum(len(payload) for payload in corpus.values())
+
+    print(f"{'códec':<6} {'tipo':<11} {'ratio':>6} {'comprime':>9} {'cifrado MB/s':>13} {'descifrado MB/s':>16}")
+    for name in args.codecs:
+        codec = codec_from_name(name)
+        stored = 0
+        for kind, payload in corpus.items():
+            result = measure(payload, codec, args.level)
+            stored += result["stored"]
+            print(
+                f"{name:<6} {kind:<11} {result['ratio']:>6.3f} {'sí' if result['compressed'] else 'no':>9} "
+                f"{result['encrypt_mb_s']:>13.1f} {result['decrypt_mb_s']:>16.1f}"
+            )
+        print(f"{name:<6} {'TOTAL':<11} {stored / original:>6.3f}\n")
+
+
+if __name__ == "__main__":
+    main()
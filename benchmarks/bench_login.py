@@ -0,0 +1,123 @@
+"""
+Benchmark del login: throughput y latencia de /health durante una ráfaga de logins.
+
+Compara dos estrategias de hash:
+- "inline": el hash PBKDF2 se ejecuta en el threadpool de Starlette, como hacían los
+  handlers síncronos originales (compite con /health y el resto de endpoints).
+- "executor": el hash se ejecuta en el pool dedicado de `password_hasher`.
+
+Uso:
+    python -m benchmarks.bench_login --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.routers import auth
+from app.core.security import get_password_hash, password_hasher, pwd_context
+from app.db.database import Base, get_db
+from app.db.models import User
+from app.main import app
+
+USERNAME = "bench"
+PASSWORD = "BenchPass123!"
+
+
+class InlineHasher:
+    """Hash en el threadpool compartido de Starlette (comportamiento anterior)."""
+
+    async def verify_and_update(self, plain_password, hashed_password):
+        return await run_in_threadpool(pwd_context.verify_and_update, plain_password, hashed_password)
+
+    async def hash(self, password):
+        return await run_in_threadpool(pwd_context.hash, password)
+
+
+def _setup_database():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Session() as db:
+        db.add(User(username=USERNAME, email="bench@example.com", hashed_password=get_password_hash(PASSWORD)))
+        db.commit()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+
+async def _run(mode: str, logins: int, concurrency: int) -> dict:
+    auth.password_hasher = InlineHasher() if mode == "inline" else password_hasher
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    health_latencies = []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login():
+            async with semaphore:
+                response = await client.post(
+                    "/api/v1/auth/login", data={"username": USERNAME, "password": PASSWORD}
+                )
+                assert response.status_code in (200, 503), response.text
+                return response.status_code
+
+        async def probe_health():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                health_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.005)
+
+        probe = asyncio.create_task(probe_health())
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe
+
+    health_latencies.sort()
+    return {
+        "mode": mode,
+        "logins": logins,
+        "concurrency": concurrency,
+        "ok": statuses.count(200),
+        "rejected_503": statuses.count(503),
+        "logins_per_second": round(statuses.count(200) / elapsed, 1),
+        "health_p50_ms": round(statistics.median(health_latencies), 2),
+        "health_p95_ms": round(health_latencies[int(len(health_latencies) * 0.95) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    _setup_database()
+    for mode in ("inline", "executor"):
+        result = asyncio.run(_run(mode, args.logins, args.concurrency))
+        print(" ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark de la serialización de un listado de documentos (GET /documents).
+
+Mide el coste de convertir una página de N documentos en el cuerpo de la respuesta por
+cada camino posible:
+- generico: dict + jsonable_encoder + json.dumps (lo que hacía FastAPI sin response_model);
+- modelo+orjson: validación con el esquema, pydantic a tipos JSON y orjson (endpoints con
+  response_model y FastJSONResponse);
+- pydantic: esquema serializado directamente a bytes (model_response, el de los listados).
+Después, el tamaño y el tiempo de comprimir ese JSON con gzip y zstd.
+
+Uso:
+    python -m benchmarks.bench_serialization --items 1000 --repeat 50
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from app.api.schemas import DocumentItem, DocumentPage
+from app.core.responses import FastJSONResponse, available_encodings, compress_body, model_response
+
+
+def _rows(items: int) -> list:
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    return [
+        {
+            "id": i,
+            "name": f"contrato_cliente_{i:05d}.pdf",
+            "size": 10_000 + i * 37,
+            "encrypted": True,
+            "uploaded_at": base - timedelta(minutes=i, microseconds=i),
+        }
+        for i in range(items)
+    ]
+
+
+def _generic(rows: list) -> bytes:
+    content = {"user_requesting": "bench", "documents": rows, "next_cursor": "abc"}
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode()
+
+
+def _model_orjson(rows: list) -> bytes:
+    page = DocumentPage.model_validate({"user_requesting": "bench", "documents": rows, "next_cursor": "abc"})
+    return FastJSONResponse(page.model_dump(mode="json")).body
+
+
+def _pydantic(rows: list) -> bytes:
+    page = DocumentPage(
+        user_requesting="bench", documents=[DocumentItem(**row) for row in rows], next_cursor="abc"
+    )
+    return model_response(page, None, 0).body
+
+
+def _median_ms(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1000, help="documentos en la página")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rows = _rows(args.items)
+    paths = {"generico": _generic, "modelo+orjson": _model_orjson, "pydantic": _pydantic}
+    bodies = {name: func(rows) for name, func in paths.items()}
+    reference = json.loads(bodies["generico"])
+    for name, body in bodies.items():
+        assert json.loads(body)["documents"][0]["id"] == reference["documents"][0]["id"], name
+
+    baseline = None
+    print(f"{'camino':<14} {'ms (p50)':>9} {'vs generico':>12} {'bytes':>9}")
+    for name, func in paths.items():
+        elapsed = _median_ms(lambda: func(rows), args.repeat)
+        baseline = baseline or elapsed
+        print(f"{name:<14} {elapsed:>9.2f} {baseline / elapsed:>11.1f}x {len(bodies[name]):>9}")
+
+    body = bodies["pydantic"]
+    print(f"\n{'compresión':<14} {'ms (p50)':>9} {'ratio':>12} {'bytes':>9}")
+    for encoding in available_encodings():
+        compressed = compress_body(body, encoding)
+        elapsed = _median_ms(lambda: compress_body(body, encoding), args.repeat)
+        print(f"{encoding:<14} {elapsed:>9.2f} {len(compressed) / len(body):>12.3f} {len(compressed):>9}")
+
+
+if __name__ == "__main__":
+    main()
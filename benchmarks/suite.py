@@ -0,0 +1,340 @@
+"""
+Suite de benchmarks de los caminos críticos del vault, con resultados en JSON.
+
+Cubre:
+- encryption: throughput de encrypt_file / decrypt_file por tamaño de documento.
+- login: verify_password aislado y POST /api/v1/auth/login de principio a fin.
+- auth: get_current_user con la caché de tokens fría (jwt.decode) y caliente.
+- listing: GET /documents con muchas filas (primera página y una página profunda).
+- storage: subida y descarga con S3Service contra un S3 local en memoria (moto).
+
+Cada métrica lleva su unidad y si es mejor más alta o más baja, de modo que dos
+ejecuciones se pueden comparar: con --compare se marca como regresión toda métrica
+que empeore más de --threshold respecto a la línea base (y el proceso sale con 1).
+
+Uso:
+    python -m benchmarks.suite --output benchmarks/results/base.json
+    python -m benchmarks.suite --only encryption listing --compare benchmarks/results/base.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+os.environ.setdefault("ENCRYPTION_KEY", "L2xz2fJnTsQqGJZIOwtZ4g1t_EyTGxQzd-5CQANC_3k=")
+os.environ.setdefault("DEDUP_FINGERPRINT_KEY", "bench-dedup-fingerprint-key")
+# Credenciales falsas para el S3 local: nunca se tocan las de verdad
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+USERNAME = "bench"
+PASSWORD = "BenchPass123!"
+FIRST_UPLOAD = datetime(2024, 1, 1)
+
+
+def metric(value: float, unit: str, better: str) -> dict:
+    return {"value": round(value, 4), "unit": unit, "better": better}
+
+
+def _median_seconds(func: Callable[[], object], repeat: int, number: int = 1) -> float:
+    """Mediana del tiempo por llamada de `func` en `repeat` tandas de `number` llamadas."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return statistics.median(samples)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+# --- Benchmarks ---
+
+def bench_encryption(args) -> Dict[str, dict]:
+    from app.services.encryption_service import decrypt_file, encrypt_file
+
+    results = {}
+    for size in (1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024):
+        payload = os.urandom(size)
+        blob = encrypt_file(payload)
+        megabytes = size / (1024 * 1024)
+        repeat = max(3, min(args.repeat * 10, int(64 / max(megabytes, 0.001))))
+        label = f"{size // 1024}KiB"
+        results[f"encrypt_{label}"] = metric(
+            megabytes / _median_seconds(lambda: encrypt_file(payload), repeat), "MB/s", "higher"
+        )
+        results[f"decrypt_{label}"] = metric(
+            megabytes / _median_seconds(lambda: decrypt_file(blob), repeat), "MB/s", "higher"
+        )
+    return results
+
+
+def _setup_app(documents: int = 0):
+    """App con una BD SQLite en memoria y `documents` documentos (3 de cada 4 del usuario del benchmark)."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from app.core.security import get_password_hash
+    from app.db.database import Base, get_db
+    from app.db.models import Document, User
+    from app.main import app
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Session() as db:
+        user = User(username=USERNAME, email="bench@example.com", hashed_password=get_password_hash(PASSWORD))
+        other = User(username="other", email="other@example.com", hashed_password="x")
+        db.add_all([user, other])
+        db.flush()
+        for start in range(0, documents, 10_000):
+            rows = [
+                {
+                    "filename": f"documento_{i}.pdf",
+                    "s3_key": f"user_{user.id if i % 4 else other.id}/{i}.pdf",
+                    "owner_id": user.id if i % 4 else other.id,
+                    "upload_date": FIRST_UPLOAD + timedelta(seconds=i),
+                }
+                for i in range(start, min(start + 10_000, documents))
+            ]
+            db.execute(insert(Document), rows)
+        db.commit()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app), engine
+
+
+def bench_login(args) -> Dict[str, dict]:
+    from app.core.security import get_password_hash, verify_password
+
+    hashed = get_password_hash(PASSWORD)
+    results = {
+        "verify_password": metric(
+            _median_seconds(lambda: verify_password(PASSWORD, hashed), args.repeat) * 1000, "ms", "lower"
+        ),
+    }
+
+    client, engine = _setup_app()
+    try:
+        def login():
+            response = client.post("/api/v1/auth/login", data={"username": USERNAME, "password": PASSWORD})
+            assert response.status_code == 200, response.text
+
+        login()
+        latencies = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            login()
+            latencies.append((time.perf_counter() - start) * 1000)
+        results["login_p50"] = metric(statistics.median(latencies), "ms", "lower")
+        results["login_p95"] = metric(_percentile(latencies, 0.95), "ms", "lower")
+    finally:
+        client.app.dependency_overrides.clear()
+        engine.dispose()
+    return results
+
+
+def bench_auth(args) -> Dict[str, dict]:
+    from app.api.deps import get_current_user, token_cache
+    from app.core.security import create_access_token
+
+    token = create_access_token({"sub": USERNAME})
+    number = 2000
+
+    def cold():
+        token_cache.clear()
+        get_current_user(token)
+
+    token_cache.clear()
+    get_current_user(token)
+    results = {
+        "get_current_user_cold": metric(_median_seconds(cold, args.repeat, number) * 1e6, "us", "lower"),
+        "get_current_user_warm": metric(
+            _median_seconds(lambda: get_current_user(token), args.repeat, number) * 1e6, "us", "lower"
+        ),
+    }
+    token_cache.clear()
+    return results
+
+
+def bench_listing(args) -> Dict[str, dict]:
+    from app.api.routers.documents import _encode_cursor
+    from app.core.security import create_access_token
+
+    client, engine = _setup_app(documents=args.rows)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': USERNAME})}"}
+    # Cursor que apunta cerca del final del listado (página "2.000" con OFFSET)
+    deep = _encode_cursor(FIRST_UPLOAD + timedelta(seconds=args.rows // 50), 0)
+    results = {}
+    try:
+        for name, params in (("first_page", {}), ("deep_page", {"cursor": deep})):
+            def page():
+                response = client.get("/documents", params={"limit": 50, **params}, headers=headers)
+                assert response.status_code == 200, response.text
+                assert response.json()["documents"]
+
+            page()
+            latencies = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                page()
+                latencies.append((time.perf_counter() - start) * 1000)
+            results[f"listing_{name}_p50"] = metric(statistics.median(latencies), "ms", "lower")
+            results[f"listing_{name}_p95"] = metric(_percentile(latencies, 0.95), "ms", "lower")
+    finally:
+        client.app.dependency_overrides.clear()
+        engine.dispose()
+    return results
+
+
+def bench_storage(args) -> Dict[str, dict]:
+    try:
+        from moto import mock_aws
+    except ImportError:
+        print("storage: moto no está instalado (requirements-test.txt), se omite.")
+        return {}
+    from app.core.config import settings
+    from app.services.s3_services import S3Service
+
+    results = {}
+    with mock_aws():
+        service = S3Service()
+        service.s3_client.create_bucket(
+            Bucket=service.bucket_name,
+            CreateBucketConfiguration={"LocationConstraint": settings.AWS_REGION},
+        )
+        for size in (64 * 1024, 1024 * 1024, 8 * 1024 * 1024):
+            payload = os.urandom(size)
+            megabytes = size / (1024 * 1024)
+            keys = []
+            label = f"{size // 1024}KiB"
+            results[f"upload_{label}"] = metric(
+                megabytes / _median_seconds(lambda: keys.append(service.upload_file(payload, "b.bin", 1)), args.repeat),
+                "MB/s",
+                "higher",
+            )
+            results[f"download_{label}"] = metric(
+                megabytes / _median_seconds(lambda: service.download_file(keys[0]), args.repeat), "MB/s", "higher"
+            )
+    return results
+
+
+BENCHMARKS = {
+    "encryption": bench_encryption,
+    "login": bench_login,
+    "auth": bench_auth,
+    "listing": bench_listing,
+    "storage": bench_storage,
+}
+
+
+# --- Resultados y comparación ---
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: List[str], args) -> dict:
+    results = {}
+    for name in names:
+        start = time.perf_counter()
+        results[name] = BENCHMARKS[name](args)
+        print(f"{name}: {len(results[name])} métricas en {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[dict]:
+    """
+    Compara dos ejecuciones métrica a métrica. `change` es la mejora relativa (positiva
+    si mejora, negativa si empeora) y `regression` indica si empeora más de `threshold`.
+    """
+    rows = []
+    for group, metrics in current["results"].items():
+        for name, result in metrics.items():
+            base = baseline.get("results", {}).get(group, {}).get(name)
+            if base is None or not base["value"]:
+                continue
+            ratio = (result["value"] - base["value"]) / base["value"]
+            change = ratio if result["better"] == "higher" else -ratio
+            rows.append({
+                "metric": f"{group}.{name}",
+                "unit": result["unit"],
+                "baseline": base["value"],
+                "current": result["value"],
+                "change": change,
+                "regression": change < -threshold,
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--output", type=Path, help="fichero JSON donde guardar los resultados")
+    parser.add_argument("--compare", type=Path, help="JSON de una ejecución anterior (línea base)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="empeoramiento tolerado (0.10 = 10%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=50, help="peticiones por medida HTTP")
+    parser.add_argument("--rows", type=int, default=100_000, help="documentos en la BD del listado")
+    args = parser.parse_args()
+
+    report = run(args.only, args)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.compare:
+        rows = compare(report, json.loads(args.compare.read_text()), args.threshold)
+        for row in rows:
+            flag = "REGRESIÓN" if row["regression"] else ""
+            print(
+                f"{row['metric']:<40} {row['baseline']:>12.3f} -> {row['current']:>12.3f} {row['unit']:<5} "
+                f"{row['change']:+7.1%} {flag}",
+                file=sys.stderr,
+            )
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,15 +12,21 @@ import os
 os.environ["DATABASE_URL"] = "sqlite://"
 os.environ.setdefault("SECRET_KEY", "test-secret-key")
 os.environ.setdefault("ENCRYPTION_KEY", "L2xz2fJnTsQqGJZIOwtZ4g1t_EyTGxQzd-5CQANC_3k=")
+os.environ.setdefault("INTERNAL_API_TOKEN", "test-internal-token")
+os.environ.setdefault("DEDUP_FINGERPRINT_KEY", "test-dedup-fingerprint-key")
 
 import pytest
 from fastapi.testclient import TestClient
+from moto import mock_aws
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
-from app.db.database import Base, get_db
+from app.api.deps import token_cache
+from app.core.config import settings
+from app.db.database import Base, get_db, get_read_db
 from app.main import app
+from app.services.s3_services import S3Service
 
 engine = create_engine(
     "sqlite://",
@@ -47,11 +53,13 @@ def client(create_test_tables):
             db.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     with TestClient(app) as test_client:
         yield test_client
 
     app.dependency_overrides.clear()
+    token_cache.clear()
 
     # Limpieza completa tras cada test
     with engine.begin() as conn:
@@ -59,6 +67,15 @@ def client(create_test_tables):
             conn.execute(table.delete())
 
 
+@pytest.fixture
+def db_session(create_test_tables):
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 @pytest.fixture
 def registered_user(client):
     credentials = {
@@ -93,3 +110,90 @@ def auth_token(client, registered_user):
 @pytest.fixture
 def auth_headers(auth_token):
     return {"Authorization": f"Bearer {auth_token}"}
+
+
+def batch_files(*items):
+    """Campos multipart de POST /documents/batch a partir de pares (nombre, contenido)."""
+    return [("files", (name, content, "application/octet-stream")) for name, content in items]
+
+
+@pytest.fixture
+def upload_documents(client, auth_headers):
+    """Sube documentos (pares nombre, contenido) con POST /documents/batch y devuelve sus ids."""
+    def _upload(*items):
+        response = client.post("/documents/batch", headers=auth_headers, files=batch_files(*items))
+        assert response.status_code == 200
+        return [result["id"] for result in response.json()["results"]]
+    return _upload
+
+
+@pytest.fixture
+def internal_headers():
+    """Cabecera de los endpoints internos (/internal/*, /metrics)."""
+    return {"Authorization": f"Bearer {settings.INTERNAL_API_TOKEN}"}
+
+
+@pytest.fixture
+def s3():
+    """S3Service contra un bucket en memoria (moto)."""
+    with mock_aws():
+        service = S3Service()
+        service.s3_client.create_bucket(
+            Bucket=service.bucket_name,
+            CreateBucketConfiguration={"LocationConstraint": settings.AWS_REGION},
+        )
+        yield service
+
+
+@pytest.fixture
+def storage(s3, monkeypatch):
+    """Conecta el servicio asíncrono global (el que usan los endpoints) al bucket de moto."""
+    from app.services.async_s3_service import async_s3_service
+
+    monkeypatch.setattr(async_s3_service, "service", s3)
+    return s3
+
+
+@pytest.fixture
+def store_document(storage, db_session, registered_user):
+    """Sube un blob ya cifrado a S3 y registra su documento sin pasar por la API; devuelve el id."""
+    from app.db.models import Document, User
+
+    def _store(blob: bytes, filename: str = "informe.pdf", username: str = None, data_key=None) -> int:
+        owner = db_session.query(User).filter(
+            User.username == (username or registered_user["username"])
+        ).one()
+        document = Document(
+            filename=filename,
+            s3_key=storage.upload_file(blob, filename, owner.id),
+            owner_id=owner.id,
+            wrapped_key=data_key.wrapped if data_key else None,
+            key_provider=data_key.provider if data_key else None,
+        )
+        db_session.add(document)
+        db_session.commit()
+        return document.id
+
+    return _store
+
+
+@pytest.fixture
+def use_keys(monkeypatch):
+    """Cambia las claves configuradas (ENCRYPTION_KEYS) como si la app se reiniciara con ellas."""
+    from app.services import encryption_service
+    from app.services.dedup_service import fingerprinter
+    from app.services.key_service import key_service
+
+    local = key_service.providers["local"]
+
+    def _use(*keys):
+        monkeypatch.setenv("ENCRYPTION_KEYS", ",".join(keys))
+        monkeypatch.setattr(encryption_service, "_cipher_suite", None)
+        monkeypatch.setattr(encryption_service, "_encryption_keys", None)
+        monkeypatch.setattr(encryption_service, "_encryption_key", None)
+        monkeypatch.setattr(local, "_aeads", None)
+        monkeypatch.setattr(fingerprinter, "_key", None)
+        key_service.cache.clear()
+
+    yield _use
+    key_service.cache.clear()
@@ -0,0 +1,86 @@
+"""Tests de la capa asíncrona de almacenamiento — AsyncS3Service (con moto)."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.async_s3_service import AsyncS3Service
+
+
+@pytest.fixture
+def async_s3(s3):
+    service = AsyncS3Service(s3, max_workers=8)
+    yield service
+    service.close()
+
+
+class TestAsyncS3Service:
+    def test_upload_download_roundtrip(self, async_s3):
+        """upload/download deben funcionar desde una corrutina."""
+        async def scenario():
+            key = await async_s3.upload(b"contenido", "a.txt", 1)
+            return key, await async_s3.download(key)
+
+        key, content = asyncio.run(scenario())
+        assert key.startswith("user_1/")
+        assert content == b"contenido"
+
+    def test_upload_accepts_chunk_iterables(self, async_s3):
+        async def scenario():
+            key = await async_s3.upload(iter([b"ab", b"cd"]), "a.txt", 1)
+            return await async_s3.download(key)
+
+        assert asyncio.run(scenario()) == b"abcd"
+
+    def test_list_and_delete(self, async_s3):
+        async def scenario():
+            keys = await asyncio.gather(*(async_s3.upload(b"x", f"{i}.txt", 5) for i in range(3)))
+            listed = await async_s3.list("user_5/")
+            await asyncio.gather(*(async_s3.delete(k) for k in keys))
+            return keys, listed, await async_s3.list("user_5/")
+
+        keys, listed, after = asyncio.run(scenario())
+        assert sorted(listed) == sorted(keys)
+        assert after == []
+
+    def test_calls_do_not_block_event_loop(self, async_s3, monkeypatch):
+        """Mientras S3 tarda, el event loop debe seguir atendiendo otras tareas."""
+        monkeypatch.setattr(async_s3.service, "download_file", lambda key: time.sleep(0.2) or b"x")
+
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                for _ in range(10):
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            await asyncio.gather(async_s3.download("k"), ticker())
+            return ticks
+
+        assert asyncio.run(scenario()) == 10
+
+    def test_concurrency_is_limited_per_operation(self, async_s3, monkeypatch):
+        """No debe haber más descargas simultáneas que el límite configurado."""
+        async_s3._limits["download"] = 2
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def slow_download(key):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.05)
+            with lock:
+                state["active"] -= 1
+            return b"x"
+
+        monkeypatch.setattr(async_s3.service, "download_file", slow_download)
+
+        async def scenario():
+            await asyncio.gather(*(async_s3.download(str(i)) for i in range(6)))
+
+        asyncio.run(scenario())
+        assert state["peak"] == 2
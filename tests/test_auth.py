@@ -1,5 +1,11 @@
 """Tests del módulo de autenticación — /api/v1/auth/*."""
 import pytest
+from fastapi import HTTPException
+from passlib.hash import pbkdf2_sha256
+
+from app.api.routers import auth
+from app.core.config import settings
+from app.db.models import User
 
 
 # ---------------------------------------------------------------------------
@@ -87,6 +93,33 @@ class TestLogin:
         )
         assert response.status_code == 400
 
+    def test_login_rehashes_outdated_password_hash(self, client, db_session):
+        """Un hash con rondas antiguas debe sustituirse tras un login correcto."""
+        weak_hash = pbkdf2_sha256.using(rounds=1000).hash("Secret5!")
+        db_session.add(User(username="erin", email="erin@example.com", hashed_password=weak_hash))
+        db_session.commit()
+
+        response = client.post("/api/v1/auth/login", data={"username": "erin", "password": "Secret5!"})
+        assert response.status_code == 200
+
+        db_session.expire_all()
+        stored = db_session.query(User).filter(User.username == "erin").one().hashed_password
+        assert stored != weak_hash
+        assert pbkdf2_sha256.from_string(stored).rounds == settings.PASSWORD_HASH_ROUNDS
+
+    def test_login_returns_503_when_hashing_is_saturated(self, client, registered_user, monkeypatch):
+        """Con el servicio de hash saturado el login debe fallar rápido con 503."""
+        def saturated(*args):
+            raise HTTPException(status_code=503, detail="saturado", headers={"Retry-After": "1"})
+
+        monkeypatch.setattr(auth.password_hasher, "_submit", saturated)
+        response = client.post(
+            "/api/v1/auth/login",
+            data={"username": registered_user["username"], "password": registered_user["password"]},
+        )
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
 
 # ---------------------------------------------------------------------------
 # GET /api/v1/auth/me
@@ -0,0 +1,80 @@
+"""Tests de la subida por lotes — POST /documents/batch."""
+import os
+
+import pytest
+
+from app.api.routers import documents as documents_router
+from app.core.config import settings
+from app.db.models import Document
+from app.services.document_service import document_service
+from app.services.s3_services import MIN_PART_SIZE
+from tests.conftest import batch_files
+
+
+class TestBatchUpload:
+    def test_requires_authentication(self, client):
+        response = client.post("/documents/batch", files=batch_files(("a.txt", b"a")))
+        assert response.status_code == 401
+
+    def test_batch_stores_every_file(self, client, auth_headers, storage, db_session):
+        """Todos los archivos deben cifrarse, subirse y registrarse con su clave de datos."""
+        payloads = {f"doc_{i}.txt": os.urandom(1000 + i) for i in range(5)}
+        response = client.post("/documents/batch", headers=auth_headers, files=batch_files(*payloads.items()))
+        assert response.status_code == 200
+        data = response.json()
+        assert data["uploaded"] == 5
+        assert data["failed"] == 0
+        assert [r["filename"] for r in data["results"]] == list(payloads)
+
+        for result in data["results"]:
+            document = db_session.get(Document, result["id"])
+            assert document.wrapped_key is not None
+            assert payloads[result["filename"]] not in storage.download_file(document.s3_key)
+            content = client.get(f"/documents/{result['id']}/content", headers=auth_headers)
+            assert content.content == payloads[result["filename"]]
+
+    def test_one_bad_file_does_not_fail_the_batch(self, client, auth_headers, storage, monkeypatch):
+        original_store = document_service.store
+
+        async def flaky_store(incoming, owner_id):
+            if incoming.filename == "roto.txt":
+                raise Exception("fallo simulado")
+            return await original_store(incoming, owner_id)
+
+        monkeypatch.setattr(document_service, "store", flaky_store)
+        response = client.post(
+            "/documents/batch",
+            headers=auth_headers,
+            files=batch_files(("bueno.txt", b"ok"), ("roto.txt", b"ko"), ("otro.txt", b"ok")),
+        )
+        data = response.json()
+        assert data["uploaded"] == 2
+        assert data["failed"] == 1
+        statuses = {r["filename"]: r["status"] for r in data["results"]}
+        assert statuses == {"bueno.txt": "ok", "roto.txt": "error", "otro.txt": "ok"}
+        failed = next(r for r in data["results"] if r["status"] == "error")
+        assert "fallo simulado" not in failed["detail"]
+
+    def test_large_file_goes_through_multipart(self, client, auth_headers, storage, monkeypatch):
+        monkeypatch.setattr(settings, "S3_MULTIPART_PART_SIZE", MIN_PART_SIZE)
+        payload = os.urandom(MIN_PART_SIZE + 4096)
+        response = client.post("/documents/batch", headers=auth_headers, files=batch_files(("grande.bin", payload)))
+        document_id = response.json()["results"][0]["id"]
+        assert client.get(f"/documents/{document_id}/content", headers=auth_headers).content == payload
+
+    def test_too_many_files_returns_413(self, client, auth_headers, monkeypatch):
+        monkeypatch.setattr(settings, "BATCH_UPLOAD_MAX_FILES", 1)
+        response = client.post(
+            "/documents/batch", headers=auth_headers, files=batch_files(("a.txt", b"a"), ("b.txt", b"b"))
+        )
+        assert response.status_code == 413
+
+    def test_failed_insert_removes_uploaded_objects(self, client, auth_headers, storage, monkeypatch, registered_user):
+        """Si el INSERT masivo falla, los objetos ya subidos no deben quedar huérfanos en S3."""
+        def broken_insert(*args):
+            raise RuntimeError("BD caída")
+
+        monkeypatch.setattr(documents_router, "_insert_documents", broken_insert)
+        response = client.post("/documents/batch", headers=auth_headers, files=batch_files(("a.txt", b"a")))
+        assert response.status_code == 500
+        assert storage.list_files("user_") == []
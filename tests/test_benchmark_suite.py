@@ -0,0 +1,27 @@
+"""Tests de la comparación de resultados de la suite de benchmarks — benchmarks/suite.py."""
+from benchmarks.suite import compare, metric
+
+
+def _report(**metrics):
+    return {"results": {"grupo": metrics}}
+
+
+class TestCompare:
+    def test_direction_of_each_metric_is_respected(self):
+        baseline = _report(throughput=metric(100, "MB/s", "higher"), latency=metric(10, "ms", "lower"))
+        current = _report(throughput=metric(80, "MB/s", "higher"), latency=metric(8, "ms", "lower"))
+        rows = {row["metric"]: row for row in compare(current, baseline, threshold=0.1)}
+        assert rows["grupo.throughput"]["regression"] is True
+        assert round(rows["grupo.throughput"]["change"], 2) == -0.2
+        assert rows["grupo.latency"]["regression"] is False
+        assert round(rows["grupo.latency"]["change"], 2) == 0.2
+
+    def test_changes_within_threshold_are_not_regressions(self):
+        baseline = _report(latency=metric(10, "ms", "lower"))
+        current = _report(latency=metric(10.5, "ms", "lower"))
+        assert compare(current, baseline, threshold=0.1)[0]["regression"] is False
+
+    def test_metrics_missing_from_baseline_are_skipped(self):
+        baseline = _report()
+        current = _report(latency=metric(10, "ms", "lower"))
+        assert compare(current, baseline, threshold=0.1) == []
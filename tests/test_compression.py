@@ -0,0 +1,125 @@
+"""Tests de la compresión antes del cifrado — services/compression.py."""
+import io
+import os
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.services.compression import (
+    CODEC_NONE,
+    CODEC_ZLIB,
+    CODEC_ZSTD,
+    codec_from_name,
+    worth_compressing,
+)
+from app.services.encryption_service import (
+    HEADER_SIZE,
+    SegmentDecryptor,
+    decrypt_file,
+    decrypt_stream,
+    encrypt_stream,
+    parse_header,
+)
+
+SEGMENT = 1024
+TEXT = b"".join(f"linea {i};cliente {i % 37};importe {i * 3.5:.2f}\n".encode() for i in range(3000))
+
+
+def _encrypt(payload, codec, segment_size=SEGMENT):
+    return b"".join(encrypt_stream([payload], segment_size=segment_size, codec=codec))
+
+
+class TestCodecSelection:
+    def test_codec_names(self):
+        assert codec_from_name("none") == CODEC_NONE
+        assert codec_from_name("") == CODEC_NONE
+        assert codec_from_name("ZLIB") == CODEC_ZLIB
+        with pytest.raises(ValueError):
+            codec_from_name("lzma")
+
+    def test_sampling_skips_incompressible_data(self):
+        assert worth_compressing(TEXT[:SEGMENT], CODEC_ZLIB, 3, 0.9)
+        assert not worth_compressing(os.urandom(SEGMENT), CODEC_ZLIB, 3, 0.9)
+        assert not worth_compressing(b"a" * 100, CODEC_ZLIB, 3, 0.9), "muestras diminutas no compensan"
+
+    def test_already_compressed_file_is_stored_as_is(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("datos.txt", b"".join(os.urandom(8).hex().encode() + b"\n" for _ in range(5000)))
+        blob = _encrypt(buffer.getvalue(), CODEC_ZLIB)
+        assert parse_header(blob).codec == CODEC_NONE
+        assert decrypt_file(blob) == buffer.getvalue()
+
+
+@pytest.mark.parametrize("codec", [CODEC_ZLIB, CODEC_ZSTD])
+class TestCompressedRoundTrip:
+    def test_roundtrip_and_header_records_codec(self, codec):
+        if codec == CODEC_ZSTD:
+            pytest.importorskip("zstandard")
+        blob = _encrypt(TEXT, codec)
+        assert parse_header(blob).codec == codec
+        assert len(blob) < len(TEXT) / 3
+        assert decrypt_file(blob) == TEXT
+        assert b"".join(decrypt_stream(io.BytesIO(blob))) == TEXT
+
+    def test_incremental_decryptor_decompresses(self, codec):
+        if codec == CODEC_ZSTD:
+            pytest.importorskip("zstandard")
+        blob = _encrypt(TEXT, codec)
+        decryptor = SegmentDecryptor(parse_header(blob), None)
+        output = []
+        for i in range(HEADER_SIZE, len(blob), 700):
+            output.extend(decryptor.update(blob[i:i + 700]))
+        output.extend(decryptor.finalize())
+        assert b"".join(output) == TEXT
+
+
+class TestCompressedIntegrity:
+    def test_codec_flag_is_authenticated(self):
+        """Cambiar el códec de la cabecera debe detectarse (la cabecera es AAD)."""
+        blob = bytearray(_encrypt(TEXT, CODEC_ZLIB))
+        blob[5] = CODEC_NONE
+        with pytest.raises(HTTPException):
+            decrypt_file(bytes(blob))
+
+    def test_random_access_is_rejected(self):
+        header = parse_header(_encrypt(TEXT, CODEC_ZLIB))
+        with pytest.raises(ValueError):
+            SegmentDecryptor(header, 10, first_index=3)
+
+
+class TestCompressedDownload:
+    def test_range_works_by_default_for_compressible_documents(self, client, auth_headers, storage):
+        response = client.post(
+            "/documents/batch", headers=auth_headers, files=[("files", ("datos.csv", TEXT, "text/csv"))]
+        )
+        document_id = response.json()["results"][0]["id"]
+        stored = storage.download_file(storage.list_files("user_")[0])
+        assert parse_header(stored).codec == CODEC_NONE
+
+        ranged = client.get(f"/documents/{document_id}/content", headers={**auth_headers, "Range": "bytes=10-19"})
+        assert ranged.status_code == 206
+        assert ranged.content == TEXT[10:20]
+        assert ranged.headers["content-length"] == "10"
+
+    def test_compressed_document_is_served_whole(self, client, auth_headers, storage, monkeypatch):
+        monkeypatch.setattr(settings, "COMPRESSION_CODEC", "zlib")
+        response = client.post(
+            "/documents/batch", headers=auth_headers, files=[("files", ("datos.csv", TEXT, "text/csv"))]
+        )
+        document_id = response.json()["results"][0]["id"]
+        stored = storage.download_file(storage.list_files("user_")[0])
+        assert parse_header(stored).codec == CODEC_ZLIB
+
+        url = f"/documents/{document_id}/content"
+        full = client.get(url, headers=auth_headers)
+        assert full.content == TEXT
+        assert full.headers["accept-ranges"] == "none"
+        ranged = client.get(url, headers={**auth_headers, "Range": "bytes=0-9"})
+        assert ranged.status_code == 200
+        assert ranged.content == TEXT
+
+        export = client.get("/documents/export", headers=auth_headers)
+        assert zipfile.ZipFile(io.BytesIO(export.content)).read("datos.csv") == TEXT
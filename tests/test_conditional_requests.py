@@ -0,0 +1,94 @@
+"""Tests de ETag y peticiones condicionales — GET /documents y GET /documents/{id}/content."""
+import hashlib
+
+import pytest
+
+from app.core.metrics import S3_LATENCY
+from app.db.models import Document, User
+from app.services.encryption_service import encrypt_file
+
+
+def _s3_calls():
+    return S3_LATENCY.count("GetObject") + S3_LATENCY.count("HeadObject")
+
+
+class TestListingETag:
+    def test_unchanged_listing_returns_304(self, client, auth_headers, storage, upload_documents):
+        upload_documents(("a.txt", b"a"))
+        first = client.get("/documents", headers=auth_headers)
+        etag = first.headers["ETag"]
+        assert first.headers["Cache-Control"] == "private, no-cache"
+
+        again = client.get("/documents", headers={**auth_headers, "If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["ETag"] == etag
+
+    def test_uploads_and_deletes_change_the_etag(self, client, auth_headers, storage, upload_documents):
+        document_id, = upload_documents(("a.txt", b"a"))
+        before = client.get("/documents", headers=auth_headers).headers["ETag"]
+        upload_documents(("b.txt", b"b"))
+        after_upload = client.get("/documents", headers={**auth_headers, "If-None-Match": before})
+        assert after_upload.status_code == 200
+        assert len(after_upload.json()["documents"]) == 2
+
+        client.delete(f"/documents/{document_id}", headers=auth_headers)
+        after_delete = client.get("/documents", headers={**auth_headers, "If-None-Match": after_upload.headers["ETag"]})
+        assert after_delete.status_code == 200
+        assert len(after_delete.json()["documents"]) == 1
+
+    def test_etag_depends_on_the_page(self, client, auth_headers, storage, upload_documents):
+        upload_documents(("a.txt", b"a"))
+        full = client.get("/documents", headers=auth_headers).headers["ETag"]
+        page = client.get("/documents", params={"limit": 1}, headers=auth_headers).headers["ETag"]
+        assert full != page
+
+    @pytest.mark.parametrize("header", ["*", "W/{etag}", '"otro", {etag}'])
+    def test_if_none_match_forms(self, client, auth_headers, header):
+        etag = client.get("/documents", headers=auth_headers).headers["ETag"]
+        response = client.get("/documents", headers={**auth_headers, "If-None-Match": header.format(etag=etag)})
+        assert response.status_code == 304
+
+
+class TestContentETag:
+    def test_etag_is_the_ciphertext_checksum(self, client, auth_headers, storage, db_session, upload_documents):
+        document_id, = upload_documents(("a.txt", b"contenido"))
+        document = db_session.get(Document, document_id)
+        expected = hashlib.sha256(storage.download_file(document.s3_key)).hexdigest()
+        response = client.get(f"/documents/{document_id}/content", headers=auth_headers)
+        assert response.headers["ETag"] == f'"{expected}"'
+        assert response.headers["Cache-Control"] == "private, no-cache"
+
+    def test_304_before_any_s3_call(self, client, auth_headers, storage, upload_documents):
+        document_id, = upload_documents(("a.txt", b"contenido"))
+        etag = client.get(f"/documents/{document_id}/content", headers=auth_headers).headers["ETag"]
+
+        before = _s3_calls()
+        for extra in ({}, {"Range": "bytes=0-3"}):
+            response = client.get(
+                f"/documents/{document_id}/content", headers={**auth_headers, "If-None-Match": etag, **extra}
+            )
+            assert response.status_code == 304
+            assert response.content == b""
+        assert _s3_calls() == before
+
+    def test_stale_etag_gets_the_content(self, client, auth_headers, storage, upload_documents):
+        document_id, = upload_documents(("a.txt", b"contenido"))
+        response = client.get(f"/documents/{document_id}/content", headers={**auth_headers, "If-None-Match": '"viejo"'})
+        assert response.status_code == 200
+        assert response.content == b"contenido"
+
+    def test_documents_without_checksum_get_a_stable_etag(
+        self, client, auth_headers, storage, db_session, registered_user
+    ):
+        owner = db_session.query(User).filter(User.username == registered_user["username"]).one()
+        document = Document(
+            filename="antiguo.txt", s3_key=storage.upload_file(encrypt_file(b"antiguo"), "antiguo.txt", owner.id), owner_id=owner.id
+        )
+        db_session.add(document)
+        db_session.commit()
+
+        first = client.get(f"/documents/{document.id}/content", headers=auth_headers)
+        assert first.content == b"antiguo"
+        again = client.get(f"/documents/{document.id}/content", headers={**auth_headers, "If-None-Match": first.headers["ETag"]})
+        assert again.status_code == 304
@@ -0,0 +1,58 @@
+"""Tests de la instrumentación del pool de conexiones — db/database.py."""
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.db.database import InstrumentedQueuePool, instrument_engine, pool_stats
+
+
+@pytest.fixture
+def small_pool_engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05,
+    )
+    instrument_engine(engine)
+    pool_stats.reset()
+    yield engine
+    engine.dispose()
+    pool_stats.reset()
+
+
+class TestPoolInstrumentation:
+    def test_checkout_and_checkin_are_counted(self, small_pool_engine):
+        with small_pool_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            assert pool_stats.snapshot()["in_use"] == 1
+        stats = pool_stats.snapshot()
+        assert stats["checkouts"] == 1
+        assert stats["checkins"] == 1
+        assert stats["in_use"] == 0
+        assert sum(stats["wait_histogram"].values()) == 1
+
+    def test_overflow_and_timeout_are_recorded(self, small_pool_engine):
+        """Superar pool_size cuenta como overflow; superar el overflow agota el timeout."""
+        first = small_pool_engine.connect()
+        second = small_pool_engine.connect()
+        try:
+            with pytest.raises(exc.TimeoutError):
+                small_pool_engine.connect()
+            stats = pool_stats.snapshot()
+            assert stats["overflow_events"] == 1
+            assert stats["timeouts"] == 1
+            assert stats["peak_in_use"] == 2
+            assert stats["wait_max_ms"] >= 0
+        finally:
+            first.close()
+            second.close()
+
+
+class TestPoolEndpoint:
+    def test_internal_pool_endpoint_exposes_stats(self, client, internal_headers):
+        response = client.get("/internal/db/pool", headers=internal_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert "pool_class" in data
+        assert {"checkouts", "in_use", "overflow_events", "wait_avg_ms"} <= data["stats"].keys()
@@ -0,0 +1,171 @@
+"""Tests de la deduplicación por contenido — services/dedup_service.py y DELETE /documents/{id}."""
+import io
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.db.models import DedupEntry, Document
+from app.main import app
+from app.services import dedup_service
+from app.services.dedup_service import ContentFingerprinter
+from app.services.document_service import document_service
+from tests.conftest import batch_files
+
+
+def _objects(storage):
+    return storage.list_files("user_")
+
+
+class TestContentFingerprinter:
+    def test_same_content_same_owner_matches(self):
+        fingerprinter = ContentFingerprinter(master_key=os.urandom(32))
+        assert fingerprinter.fingerprint(io.BytesIO(b"abc"), 1) == fingerprinter.fingerprint(io.BytesIO(b"abc"), 1)
+        assert fingerprinter.fingerprint(io.BytesIO(b"abc"), 1) != fingerprinter.fingerprint(io.BytesIO(b"abd"), 1)
+
+    def test_fingerprint_is_keyed_per_owner(self):
+        """El mismo archivo de dos usuarios no debe dar la misma huella (no se comparan entre usuarios)."""
+        fingerprinter = ContentFingerprinter(master_key=os.urandom(32))
+        assert fingerprinter.fingerprint(io.BytesIO(b"abc"), 1) != fingerprinter.fingerprint(io.BytesIO(b"abc"), 2)
+        other_key = ContentFingerprinter(master_key=os.urandom(32))
+        assert fingerprinter.fingerprint(io.BytesIO(b"abc"), 1) != other_key.fingerprint(io.BytesIO(b"abc"), 1)
+
+    def test_file_position_is_restored(self):
+        file = io.BytesIO(b"contenido")
+        ContentFingerprinter(master_key=os.urandom(32)).fingerprint(file, 1)
+        assert file.read() == b"contenido"
+
+
+class TestDedupAcrossKeyRotation:
+    def test_duplicates_are_found_after_rotating_keys(
+        self, client, auth_headers, storage, db_session, use_keys, upload_documents
+    ):
+        old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        use_keys(old_key)
+        payload = os.urandom(5000)
+        upload_documents(("a.pdf", payload))
+
+        # Rotación completa: clave nueva como principal y, después, sin la antigua
+        use_keys(new_key, old_key)
+        upload_documents(("b.pdf", payload))
+        use_keys(new_key)
+        upload_documents(("c.pdf", payload))
+
+        assert db_session.query(DedupEntry).one().ref_count == 3
+        assert len(_objects(storage)) == 1
+
+    def test_fingerprint_key_is_required_when_dedup_is_enabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "DEDUP_FINGERPRINT_KEY", "")
+        with pytest.raises(RuntimeError):
+            dedup_service.check_configuration()
+        monkeypatch.setattr(settings, "DEDUP_ENABLED", False)
+        dedup_service.check_configuration()
+
+    def test_app_does_not_start_without_fingerprint_key(self, monkeypatch):
+        monkeypatch.setattr(settings, "DEDUP_FINGERPRINT_KEY", "")
+        with pytest.raises(RuntimeError):
+            with TestClient(app):
+                pass
+
+
+class TestDedupUpload:
+    def test_duplicate_upload_reuses_object(
+        self, client, auth_headers, storage, db_session, monkeypatch, upload_documents
+    ):
+        """Un archivo repetido no se cifra ni se sube otra vez: apunta al objeto existente."""
+        payload = os.urandom(5000)
+        first, = upload_documents(("a.pdf", payload))
+
+        stores = []
+        original_store = document_service.store
+
+        async def counting_store(incoming, owner_id):
+            stores.append(incoming.filename)
+            return await original_store(incoming, owner_id)
+
+        monkeypatch.setattr(document_service, "store", counting_store)
+        second, third = upload_documents(("copia.pdf", payload), ("otra.pdf", b"distinto"))
+
+        assert stores == ["otra.pdf"]
+        assert len(_objects(storage)) == 2
+        documents = {d.id: d for d in db_session.query(Document).all()}
+        assert documents[first].s3_key == documents[second].s3_key
+        assert documents[first].wrapped_key == documents[second].wrapped_key
+        entry = db_session.query(DedupEntry).filter_by(s3_key=documents[first].s3_key).one()
+        assert entry.ref_count == 2
+        assert client.get(f"/documents/{second}/content", headers=auth_headers).content == payload
+
+    def test_duplicates_within_one_batch_share_object(
+        self, client, auth_headers, storage, db_session, upload_documents
+    ):
+        ids = upload_documents(("a.txt", b"igual"), ("b.txt", b"igual"), ("c.txt", b"igual"))
+        assert len(_objects(storage)) == 1
+        assert db_session.query(DedupEntry).one().ref_count == 3
+        for document_id in ids:
+            assert client.get(f"/documents/{document_id}/content", headers=auth_headers).content == b"igual"
+
+    def test_disabled_dedup_stores_every_copy(
+        self, client, auth_headers, storage, db_session, monkeypatch, upload_documents
+    ):
+        monkeypatch.setattr(settings, "DEDUP_ENABLED", False)
+        upload_documents(("a.txt", b"igual"), ("b.txt", b"igual"))
+        assert len(_objects(storage)) == 2
+        assert db_session.query(DedupEntry).count() == 0
+
+    def test_concurrent_delete_of_reused_object_returns_409(
+        self, client, auth_headers, storage, db_session, monkeypatch, upload_documents
+    ):
+        """Si el objeto a reutilizar se borra entre la búsqueda y el registro, el lote se rechaza."""
+        upload_documents(("a.txt", b"igual"))
+        original_add = dedup_service.add_references
+
+        def racing_add(db, owner_id, stored):
+            db.query(DedupEntry).update({"ref_count": 0})
+            return original_add(db, owner_id, stored)
+
+        monkeypatch.setattr(dedup_service, "add_references", racing_add)
+        response = client.post("/documents/batch", headers=auth_headers, files=batch_files(("b.txt", b"igual")))
+        assert response.status_code == 409
+        # El objeto reutilizado pertenece a otro documento: no se borra
+        assert len(_objects(storage)) == 1
+
+
+class TestDeleteDocument:
+    def test_requires_authentication(self, client):
+        assert client.delete("/documents/1").status_code == 401
+
+    def test_unknown_document_returns_404(self, client, auth_headers, storage):
+        assert client.delete("/documents/999", headers=auth_headers).status_code == 404
+
+    def test_shared_object_deleted_with_last_reference(
+        self, client, auth_headers, storage, db_session, upload_documents
+    ):
+        first, second = upload_documents(("a.txt", b"igual"), ("b.txt", b"igual"))
+
+        assert client.delete(f"/documents/{first}", headers=auth_headers).status_code == 204
+        assert len(_objects(storage)) == 1
+        assert db_session.query(DedupEntry).one().ref_count == 1
+        assert client.get(f"/documents/{second}/content", headers=auth_headers).content == b"igual"
+
+        assert client.delete(f"/documents/{second}", headers=auth_headers).status_code == 204
+        assert _objects(storage) == []
+        assert db_session.query(DedupEntry).count() == 0
+        assert db_session.query(Document).count() == 0
+
+    def test_object_outside_index_is_deleted(
+        self, client, auth_headers, storage, db_session, monkeypatch, upload_documents
+    ):
+        """Los documentos sin entrada en el índice (antiguos) son dueños únicos de su objeto."""
+        monkeypatch.setattr(settings, "DEDUP_ENABLED", False)
+        document_id, = upload_documents(("a.txt", b"solo"))
+        assert client.delete(f"/documents/{document_id}", headers=auth_headers).status_code == 204
+        assert _objects(storage) == []
+
+    def test_reupload_after_delete_stores_again(self, client, auth_headers, storage, db_session, upload_documents):
+        document_id, = upload_documents(("a.txt", b"igual"))
+        client.delete(f"/documents/{document_id}", headers=auth_headers)
+        document_id, = upload_documents(("a.txt", b"igual"))
+        assert len(_objects(storage)) == 1
+        assert client.get(f"/documents/{document_id}/content", headers=auth_headers).content == b"igual"
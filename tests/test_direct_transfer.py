@@ -0,0 +1,187 @@
+"""Tests de la transferencia directa con URLs prefirmadas — services/direct_transfer_service.py."""
+import io
+import os
+import zipfile
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.models import DirectUpload, Document, User
+from app.jobs.orphan_gc import OrphanGCJob
+from app.services.direct_transfer_service import direct_transfer_service
+from app.services.s3_services import MIN_PART_SIZE
+
+
+@pytest.fixture
+def direct(storage, monkeypatch):
+    """Despliegue con los dos modos y el servicio de transferencia directa sobre el bucket de moto."""
+    monkeypatch.setattr(settings, "TRANSFER_MODE", "both")
+    monkeypatch.setattr(direct_transfer_service, "storage", storage)
+    monkeypatch.setattr(direct_transfer_service, "part_size", MIN_PART_SIZE)
+    return storage
+
+
+def _start(client, auth_headers, filename, size):
+    return client.post("/documents/direct-uploads", headers=auth_headers, json={"filename": filename, "size": size})
+
+
+def _upload_parts(storage, db_session, upload_id, payload, numbers=None):
+    """Hace de cliente: sube las partes a S3 (lo que haría con las URLs prefirmadas)."""
+    upload = db_session.get(DirectUpload, upload_id)
+    db_session.expire(upload)
+    size = direct_transfer_service.part_size
+    for number in numbers or range(1, upload.part_count + 1):
+        storage.s3_client.upload_part(
+            Bucket=storage.bucket_name,
+            Key=upload.s3_key,
+            UploadId=upload.upload_id,
+            PartNumber=number,
+            Body=payload[(number - 1) * size:number * size],
+        )
+
+
+class TestDirectUpload:
+    def test_disabled_in_proxied_deployments(self, client, auth_headers, direct, monkeypatch):
+        monkeypatch.setattr(settings, "TRANSFER_MODE", "proxied")
+        assert _start(client, auth_headers, "a.bin", 10).status_code == 403
+
+    def test_direct_only_deployment_rejects_proxied_uploads(self, client, auth_headers, direct, monkeypatch):
+        monkeypatch.setattr(settings, "TRANSFER_MODE", "direct")
+        response = client.post(
+            "/documents/batch", headers=auth_headers, files=[("files", ("a.txt", b"x", "text/plain"))]
+        )
+        assert response.status_code == 403
+
+    def test_returns_one_presigned_url_per_part(self, client, auth_headers, direct):
+        response = _start(client, auth_headers, "video.mp4", MIN_PART_SIZE * 2 + 1)
+        assert response.status_code == 201
+        body = response.json()
+        assert body["part_size"] == MIN_PART_SIZE
+        assert [part["part_number"] for part in body["parts"]] == [1, 2, 3]
+        query = parse_qs(urlparse(body["parts"][1]["url"]).query)
+        assert query["partNumber"] == ["2"]
+        assert "uploadId" in query and "X-Amz-Signature" in query
+
+    def test_upload_is_registered_on_completion(self, client, auth_headers, direct, db_session):
+        payload = os.urandom(MIN_PART_SIZE + 1000)
+        upload_id = _start(client, auth_headers, "informe.pdf", len(payload)).json()["upload_id"]
+        _upload_parts(direct, db_session, upload_id, payload)
+
+        response = client.post(f"/documents/direct-uploads/{upload_id}/complete", headers=auth_headers)
+        assert response.status_code == 201
+        document = db_session.get(Document, response.json()["id"])
+        assert document.transfer_mode == "direct"
+        assert document.filename == "informe.pdf"
+        assert db_session.query(DirectUpload).count() == 0
+
+        stored = direct.s3_client.head_object(Bucket=direct.bucket_name, Key=document.s3_key)
+        assert stored["ServerSideEncryption"] == "aws:kms"
+        assert stored["ContentLength"] == len(payload)
+
+    def test_missing_parts_can_be_uploaded_later(self, client, auth_headers, direct, db_session):
+        payload = os.urandom(MIN_PART_SIZE + 10)
+        upload_id = _start(client, auth_headers, "a.bin", len(payload)).json()["upload_id"]
+        _upload_parts(direct, db_session, upload_id, payload, numbers=[2])
+
+        response = client.post(f"/documents/direct-uploads/{upload_id}/complete", headers=auth_headers)
+        assert response.status_code == 409
+        assert db_session.query(Document).count() == 0
+
+        _upload_parts(direct, db_session, upload_id, payload, numbers=[1])
+        response = client.post(f"/documents/direct-uploads/{upload_id}/complete", headers=auth_headers)
+        assert response.status_code == 201
+
+    def test_size_mismatch_is_rejected(self, client, auth_headers, direct, db_session):
+        upload_id = _start(client, auth_headers, "a.bin", 100).json()["upload_id"]
+        _upload_parts(direct, db_session, upload_id, b"x" * 50)
+        response = client.post(f"/documents/direct-uploads/{upload_id}/complete", headers=auth_headers)
+        assert response.status_code == 409
+        assert db_session.query(Document).count() == 0
+
+    def test_other_users_upload_returns_404(self, client, auth_headers, direct, db_session):
+        other = User(username="otro", email="otro@example.com", hashed_password="x")
+        db_session.add(other)
+        db_session.commit()
+        upload = DirectUpload(owner_id=other.id, filename="a", s3_key="user_x/a", upload_id="u", size=1, part_count=1)
+        db_session.add(upload)
+        db_session.commit()
+        response = client.post(f"/documents/direct-uploads/{upload.id}/complete", headers=auth_headers)
+        assert response.status_code == 404
+
+    def test_abort_discards_upload(self, client, auth_headers, direct, db_session):
+        upload_id = _start(client, auth_headers, "a.bin", 10).json()["upload_id"]
+        assert client.delete(f"/documents/direct-uploads/{upload_id}", headers=auth_headers).status_code == 204
+        assert db_session.query(DirectUpload).count() == 0
+        assert "Uploads" not in direct.s3_client.list_multipart_uploads(Bucket=direct.bucket_name)
+
+
+class TestExpiredUploads:
+    def _pending(self, direct):
+        return direct.s3_client.list_multipart_uploads(Bucket=direct.bucket_name).get("Uploads", [])
+
+    def _gc(self, direct, db_session, dry_run=False):
+        job = OrphanGCJob(sessionmaker(bind=db_session.get_bind()), storage=direct, log=lambda _: None)
+        return job.run(dry_run=dry_run)
+
+    def test_abandoned_uploads_are_aborted_and_removed(self, client, auth_headers, direct, db_session):
+        payload = os.urandom(MIN_PART_SIZE + 10)
+        abandoned = _start(client, auth_headers, "abandonada.bin", len(payload)).json()["upload_id"]
+        _upload_parts(direct, db_session, abandoned, payload, numbers=[1])
+        recent = _start(client, auth_headers, "reciente.bin", 10).json()["upload_id"]
+        old = datetime.now(timezone.utc) - timedelta(seconds=settings.DIRECT_UPLOAD_TTL_SECONDS + 60)
+        db_session.execute(update(DirectUpload).where(DirectUpload.id == abandoned).values(created_at=old))
+        db_session.commit()
+
+        assert self._gc(direct, db_session, dry_run=True)["expired_uploads"] == 1
+        assert len(self._pending(direct)) == 2
+
+        report = self._gc(direct, db_session)
+        assert report["expired_uploads"] == 1
+        assert report["expired_upload_errors"] == 0
+        db_session.expire_all()
+        assert [upload.id for upload in db_session.query(DirectUpload)] == [recent]
+        assert len(self._pending(direct)) == 1
+        response = client.post(f"/documents/direct-uploads/{abandoned}/complete", headers=auth_headers)
+        assert response.status_code == 404
+
+
+class TestDirectDownload:
+    @pytest.fixture
+    def direct_document(self, client, auth_headers, direct, db_session):
+        upload_id = _start(client, auth_headers, "foto.jpg", 11).json()["upload_id"]
+        _upload_parts(direct, db_session, upload_id, b"hola, mundo")
+        return client.post(f"/documents/direct-uploads/{upload_id}/complete", headers=auth_headers).json()["id"]
+
+    def test_content_redirects_to_presigned_url(self, client, auth_headers, direct_document):
+        response = client.get(
+            f"/documents/{direct_document}/content", headers=auth_headers, follow_redirects=False
+        )
+        assert response.status_code == 307
+        location = urlparse(response.headers["location"])
+        assert "X-Amz-Signature" in parse_qs(location.query)
+        assert "response-content-disposition" in parse_qs(location.query)
+
+    def test_download_url(self, client, auth_headers, direct_document):
+        body = client.get(f"/documents/{direct_document}/download-url", headers=auth_headers).json()
+        assert body["expires_in"] == direct_transfer_service.expires_in
+        assert "X-Amz-Signature" in body["url"]
+
+    def test_download_url_not_available_for_app_encrypted_documents(self, client, auth_headers, direct):
+        response = client.post(
+            "/documents/batch", headers=auth_headers, files=[("files", ("a.txt", b"x", "text/plain"))]
+        )
+        document_id = response.json()["results"][0]["id"]
+        assert client.get(f"/documents/{document_id}/download-url", headers=auth_headers).status_code == 409
+
+    def test_export_includes_direct_documents(self, client, auth_headers, direct_document):
+        response = client.get("/documents/export", headers=auth_headers)
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert archive.read("foto.jpg") == b"hola, mundo"
+
+    def test_delete_removes_object(self, client, auth_headers, direct, direct_document):
+        assert client.delete(f"/documents/{direct_document}", headers=auth_headers).status_code == 204
+        assert direct.list_files("user_") == []
@@ -0,0 +1,118 @@
+"""Tests de la descarga en streaming — GET /documents/{id}/content."""
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.services.encryption_service import HEADER_SIZE, TAG_SIZE, encrypt_stream
+from app.services.key_service import key_service
+
+SEGMENT = 1024
+
+
+@pytest.fixture
+def spied_storage(storage, monkeypatch):
+    """El bucket de moto del fixture storage, registrando los rangos que se piden a S3."""
+    requested = []
+    original = storage.get_object
+
+    def spy(s3_key, start=None, end=None):
+        requested.append((start, end))
+        return original(s3_key, start, end)
+
+    monkeypatch.setattr(storage, "get_object", spy)
+    storage.requested_ranges = requested
+    return storage
+
+
+PAYLOAD = os.urandom(10 * SEGMENT + 300)
+
+
+def _encrypted(payload=PAYLOAD):
+    return b"".join(encrypt_stream([payload], segment_size=SEGMENT))
+
+
+class TestDocumentContent:
+    def test_requires_authentication(self, client):
+        assert client.get("/documents/1/content").status_code == 401
+
+    def test_unknown_document_returns_404(self, client, auth_headers, storage):
+        assert client.get("/documents/999/content", headers=auth_headers).status_code == 404
+
+    def test_other_users_document_returns_404(self, client, auth_headers, store_document):
+        """Un documento de otro usuario no debe ser accesible (ni revelar que existe)."""
+        client.post(
+            "/api/v1/auth/register",
+            params={"username": "mallory", "email": "m@example.com", "password": "x"},
+        )
+        document_id = store_document(_encrypted(), username="mallory")
+        assert client.get(f"/documents/{document_id}/content", headers=auth_headers).status_code == 404
+
+    def test_full_download_decrypts_content(self, client, auth_headers, store_document):
+        document_id = store_document(_encrypted())
+        response = client.get(f"/documents/{document_id}/content", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.content == PAYLOAD
+        assert response.headers["content-length"] == str(len(PAYLOAD))
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["content-type"] == "application/pdf"
+
+    def test_range_returns_partial_content(self, client, auth_headers, store_document):
+        document_id = store_document(_encrypted())
+        headers = {**auth_headers, "Range": "bytes=2000-5000"}
+        response = client.get(f"/documents/{document_id}/content", headers=headers)
+        assert response.status_code == 206
+        assert response.content == PAYLOAD[2000:5001]
+        assert response.headers["content-range"] == f"bytes 2000-5000/{len(PAYLOAD)}"
+
+    def test_range_only_fetches_needed_segments(self, client, auth_headers, store_document, spied_storage):
+        """Un rango debe traducirse solo a los segmentos cifrados que lo contienen."""
+        document_id = store_document(_encrypted())
+        headers = {**auth_headers, "Range": "bytes=2000-2100"}
+        client.get(f"/documents/{document_id}/content", headers=headers)
+        encrypted_segment = SEGMENT + TAG_SIZE
+        assert spied_storage.requested_ranges == [
+            (0, HEADER_SIZE - 1),
+            (HEADER_SIZE + encrypted_segment, HEADER_SIZE + 3 * encrypted_segment - 1),
+        ]
+
+    def test_suffix_and_open_ended_ranges(self, client, auth_headers, store_document):
+        document_id = store_document(_encrypted())
+        url = f"/documents/{document_id}/content"
+        suffix = client.get(url, headers={**auth_headers, "Range": "bytes=-500"})
+        assert suffix.content == PAYLOAD[-500:]
+        open_ended = client.get(url, headers={**auth_headers, "Range": "bytes=9000-"})
+        assert open_ended.content == PAYLOAD[9000:]
+
+    def test_unsatisfiable_range_returns_416(self, client, auth_headers, store_document):
+        document_id = store_document(_encrypted())
+        headers = {**auth_headers, "Range": f"bytes={len(PAYLOAD)}-"}
+        response = client.get(f"/documents/{document_id}/content", headers=headers)
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(PAYLOAD)}"
+
+    def test_empty_document(self, client, auth_headers, store_document):
+        document_id = store_document(_encrypted(b""))
+        response = client.get(f"/documents/{document_id}/content", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.content == b""
+
+    def test_legacy_fernet_document_supports_ranges(self, client, auth_headers, store_document):
+        """Los documentos Fernet antiguos deben seguir descargándose, también por rangos."""
+        legacy = Fernet(os.environ["ENCRYPTION_KEY"].encode()).encrypt(b"documento antiguo")
+        document_id = store_document(legacy, filename="viejo.txt")
+        url = f"/documents/{document_id}/content"
+        assert client.get(url, headers=auth_headers).content == b"documento antiguo"
+        partial = client.get(url, headers={**auth_headers, "Range": "bytes=0-8"})
+        assert partial.status_code == 206
+        assert partial.content == b"documento"
+
+    def test_envelope_encrypted_document(self, client, auth_headers, store_document):
+        """Un documento con clave de datos propia debe descifrarse con ella, también por rangos."""
+        data_key = key_service.new_data_key()
+        blob = b"".join(encrypt_stream([PAYLOAD], key=data_key.plaintext, segment_size=SEGMENT))
+        document_id = store_document(blob, data_key=data_key)
+        url = f"/documents/{document_id}/content"
+        assert client.get(url, headers=auth_headers).content == PAYLOAD
+        partial = client.get(url, headers={**auth_headers, "Range": "bytes=3000-3999"})
+        assert partial.content == PAYLOAD[3000:4000]
@@ -0,0 +1,122 @@
+"""Tests de la exportación en ZIP — GET /documents/export."""
+import asyncio
+import io
+import os
+import zipfile
+from datetime import datetime
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.services.encryption_service import encrypt_stream
+from app.services.export_service import ExportMember, ExportService, _member_names
+from app.services.key_service import key_service
+
+SEGMENT = 1024
+
+
+def _envelope(payload: bytes):
+    data_key = key_service.new_data_key()
+    blob = b"".join(encrypt_stream([payload], key=data_key.plaintext, segment_size=SEGMENT))
+    return blob, data_key
+
+
+class TestExportEndpoint:
+    def test_requires_authentication(self, client):
+        assert client.get("/documents/export").status_code == 401
+
+    def test_exports_all_documents_decrypted(self, client, auth_headers, store_document):
+        first = os.urandom(5 * SEGMENT + 17)
+        blob, data_key = _envelope(first)
+        store_document(blob, "informe.pdf", data_key=data_key)
+        legacy = Fernet(os.environ["ENCRYPTION_KEY"].encode()).encrypt(b"documento antiguo")
+        store_document(legacy, "viejo.txt")
+        blob, data_key = _envelope(b"")
+        store_document(blob, "vacio.txt", data_key=data_key)
+
+        response = client.get("/documents/export", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert archive.testzip() is None
+        assert archive.namelist() == ["informe.pdf", "viejo.txt", "vacio.txt"]
+        assert archive.read("informe.pdf") == first
+        assert archive.read("viejo.txt") == b"documento antiguo"
+        assert archive.read("vacio.txt") == b""
+
+    def test_exports_only_requested_ids(self, client, auth_headers, store_document):
+        blob, data_key = _envelope(b"uno")
+        first = store_document(blob, "a.txt", data_key=data_key)
+        blob, data_key = _envelope(b"dos")
+        store_document(blob, "b.txt", data_key=data_key)
+
+        response = client.get("/documents/export", params={"ids": [first]}, headers=auth_headers)
+        assert zipfile.ZipFile(io.BytesIO(response.content)).namelist() == ["a.txt"]
+
+    def test_other_users_document_returns_404(self, client, auth_headers, store_document):
+        """Pedir un documento ajeno da 404 antes de empezar a generar el ZIP."""
+        client.post(
+            "/api/v1/auth/register",
+            params={"username": "mallory", "email": "m@example.com", "password": "x"},
+        )
+        blob, data_key = _envelope(b"secreto")
+        foreign = store_document(blob, "ajeno.txt", username="mallory", data_key=data_key)
+        response = client.get("/documents/export", params={"ids": [foreign]}, headers=auth_headers)
+        assert response.status_code == 404
+
+
+class _FakeDocuments:
+    """Sustituto de DocumentService que registra cuántas descargas hay abiertas a la vez."""
+
+    def __init__(self, contents):
+        self.contents = contents
+        self.open = 0
+        self.max_open = 0
+
+    async def iter_plaintext(self, s3_key, wrapped_key=None, key_provider=None, direct=False):
+        self.open += 1
+        self.max_open = max(self.max_open, self.open)
+        try:
+            for i in range(0, len(self.contents[s3_key]), 100):
+                await asyncio.sleep(0)
+                yield self.contents[s3_key][i:i + 100]
+        finally:
+            self.open -= 1
+
+
+def _members(count):
+    return [ExportMember(f"doc{i}.bin", f"k{i}", None, None, datetime(2024, 1, 1)) for i in range(count)]
+
+
+class TestExportService:
+    def test_prefetch_window_bounds_concurrent_downloads(self):
+        contents = {f"k{i}": os.urandom(1000) for i in range(10)}
+        documents = _FakeDocuments(contents)
+        service = ExportService(documents, prefetch_window=2, prefetch_chunks=1)
+
+        async def collect():
+            return b"".join([chunk async for chunk in service.stream_zip(_members(10))])
+
+        archive = zipfile.ZipFile(io.BytesIO(asyncio.run(collect())))
+        assert [archive.read(f"doc{i}.bin") for i in range(10)] == [contents[f"k{i}"] for i in range(10)]
+        # El documento actual más dos por adelantado, nunca todos a la vez
+        assert 1 < documents.max_open <= 3
+
+    def test_chunks_are_streamed_not_accumulated(self):
+        """Cada trozo del ZIP se entrega según se escribe: ninguno contiene el documento entero."""
+        documents = _FakeDocuments({"k0": os.urandom(10_000)})
+        service = ExportService(documents, prefetch_window=1, prefetch_chunks=1)
+
+        async def sizes():
+            return [len(chunk) async for chunk in service.stream_zip(_members(1))]
+
+        chunk_sizes = asyncio.run(sizes())
+        assert max(chunk_sizes) < 1000
+        assert sum(chunk_sizes) > 10_000
+
+    def test_member_names_are_sanitized_and_unique(self):
+        members = [
+            ExportMember(name, "k", None, None, datetime(2024, 1, 1))
+            for name in ["a.pdf", "A.pdf", "../../etc/passwd", "dir\\b.txt", ".."]
+        ]
+        assert _member_names(members) == ["a.pdf", "A (1).pdf", "passwd", "b.txt", "documento"]
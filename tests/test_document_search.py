@@ -0,0 +1,100 @@
+"""Tests de la búsqueda por nombre — GET /documents/search y app/services/search_service.py."""
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.db.models import Document, User
+from app.services import search_service
+from app.services.search_service import similarity, trigrams, word_similarity
+
+FILENAMES = [
+    "contrato_alquiler.pdf",
+    "anexo_contrato.pdf",
+    "factura_enero.pdf",
+    "factura_febrero.pdf",
+    "Contrato Laboral 2024.docx",
+    "foto.png",
+    "100%_real.txt",
+]
+
+
+@pytest.fixture
+def named_documents(db_session, registered_user):
+    owner = db_session.query(User).filter(User.username == registered_user["username"]).one()
+    other = User(username="otro", email="otro@example.com", hashed_password="x")
+    db_session.add(other)
+    db_session.flush()
+    db_session.add_all([Document(filename=name, s3_key=f"user_{owner.id}/{i}", owner_id=owner.id) for i, name in enumerate(FILENAMES)])
+    db_session.add(Document(filename="contrato_ajeno.pdf", s3_key=f"user_{other.id}/x", owner_id=other.id))
+    db_session.commit()
+
+
+def _search(client, auth_headers, **params):
+    response = client.get("/documents/search", params=params, headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestTrigrams:
+    def test_matches_pg_trgm(self):
+        # Valores de referencia de la documentación de pg_trgm
+        assert trigrams("cat") == {"  c", " ca", "cat", "at "}
+        assert word_similarity("word", "two words") == pytest.approx(0.8)
+        assert similarity("word", "two words") == pytest.approx(4 / 11)
+
+    def test_case_and_separators_are_ignored(self):
+        assert trigrams("Factura_Enero") == trigrams("factura enero")
+
+
+class TestDocumentSearch:
+    def test_requires_auth(self, client):
+        assert client.get("/documents/search", params={"q": "contrato"}).status_code == 401
+
+    def test_prefix_before_substring_and_only_own_documents(self, client, auth_headers, named_documents):
+        body = _search(client, auth_headers, q="contrato")
+        names = [(d["name"], d["match"]) for d in body["documents"]]
+        # Misma similitud: a igualdad, el más reciente primero
+        assert names == [
+            ("Contrato Laboral 2024.docx", "prefix"),
+            ("contrato_alquiler.pdf", "prefix"),
+            ("anexo_contrato.pdf", "substring"),
+        ]
+
+    def test_typos_are_tolerated(self, client, auth_headers, named_documents):
+        body = _search(client, auth_headers, q="fctura")
+        assert {d["name"] for d in body["documents"]} == {"factura_enero.pdf", "factura_febrero.pdf"}
+        assert all(d["match"] == "fuzzy" for d in body["documents"])
+
+    def test_unrelated_query_returns_nothing(self, client, auth_headers, named_documents):
+        assert _search(client, auth_headers, q="zzzz")["documents"] == []
+
+    def test_like_wildcards_are_literal(self, client, auth_headers, named_documents):
+        body = _search(client, auth_headers, q="100%")
+        assert [d["name"] for d in body["documents"]] == ["100%_real.txt"]
+
+    def test_pagination(self, client, auth_headers, named_documents):
+        everything = _search(client, auth_headers, q="pdf")["documents"]
+        first = _search(client, auth_headers, q="pdf", limit=2)
+        assert first["next_offset"] == 2
+        second = _search(client, auth_headers, q="pdf", limit=2, offset=2)
+        last = _search(client, auth_headers, q="pdf", limit=2, offset=4)
+        assert first["documents"] + second["documents"] + last["documents"] == everything
+        assert last["next_offset"] is None
+
+    def test_postgres_query_uses_trigram_operators(self):
+        captured = []
+
+        class FakeSession:
+            def execute(self, statement):
+                captured.append(str(statement.compile(dialect=postgresql.dialect())))
+
+                class Result:
+                    def all(self):
+                        return []
+                return Result()
+
+        search_service._search_postgres(FakeSession(), 1, "factura", 10, 0, 0.3)
+        assert "set_config" in captured[0]
+        assert "documents.filename ILIKE" in captured[1]
+        # "%>" escapado como "%%>" por el paramstyle pyformat de psycopg2
+        assert "documents.filename %%> " in captured[1]
+        assert "word_similarity" in captured[1]
@@ -1,6 +1,26 @@
 """Tests del endpoint de documentos — GET /documents."""
+from datetime import datetime, timedelta
+
 import pytest
 
+from app.db.models import Document, User
+
+
+@pytest.fixture
+def user_documents(db_session, registered_user):
+    """Crea 5 documentos del usuario de test con fechas distintas (y dos empatadas)."""
+    owner = db_session.query(User).filter(User.username == registered_user["username"]).one()
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    dates = [base, base + timedelta(hours=1), base + timedelta(hours=1), base + timedelta(hours=2), base + timedelta(hours=3)]
+    documents = [
+        Document(filename=f"doc_{i}.pdf", s3_key=f"user_{owner.id}/{i}.pdf", owner_id=owner.id, upload_date=date)
+        for i, date in enumerate(dates)
+    ]
+    db_session.add_all(documents)
+    db_session.commit()
+    # Orden esperado: más recientes primero y, a igualdad de fecha, id descendente
+    return sorted(documents, key=lambda d: (d.upload_date, d.id), reverse=True)
+
 
 class TestDocuments:
     def test_get_documents_without_auth_returns_401(self, client):
@@ -33,15 +53,53 @@ class TestDocuments:
         response = client.get("/documents", headers=headers)
         assert response.status_code == 401
 
-    def test_get_documents_items_have_required_fields(self, client, auth_headers):
-        """Cada documento de la lista debe tener los campos: id, name, size, encrypted."""
+    def test_get_documents_items_have_required_fields(self, client, auth_headers, user_documents):
+        """Cada documento de la lista debe tener los campos: id, name, size, encrypted, uploaded_at."""
         response = client.get("/documents", headers=auth_headers)
         documents = response.json()["documents"]
-        # La fase 1 devuelve datos mock; si en fases futuras la lista pudiera estar
-        # vacía, este test se debe actualizar para crear documentos de prueba primero.
-        assert len(documents) > 0, "Se esperan documentos mock en la respuesta de la Fase 1"
+        assert len(documents) == len(user_documents)
         for doc in documents:
             assert "id" in doc
             assert "name" in doc
             assert "size" in doc
             assert "encrypted" in doc
+            assert "uploaded_at" in doc
+
+    def test_get_documents_only_lists_own_documents(self, client, auth_headers, db_session, user_documents):
+        """Los documentos de otros usuarios no deben aparecer en el listado."""
+        other = User(username="otro", email="otro@example.com", hashed_password="x")
+        db_session.add(other)
+        db_session.commit()
+        db_session.add(Document(filename="ajeno.pdf", s3_key="user_x/ajeno.pdf", owner_id=other.id))
+        db_session.commit()
+        names = [d["name"] for d in client.get("/documents", headers=auth_headers).json()["documents"]]
+        assert "ajeno.pdf" not in names
+
+
+class TestDocumentsPagination:
+    def test_pages_follow_keyset_order_without_gaps(self, client, auth_headers, user_documents):
+        """Recorrer todas las páginas debe devolver cada documento una vez, en orden."""
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            data = client.get("/documents", headers=auth_headers, params=params).json()
+            assert len(data["documents"]) <= 2
+            seen.extend(d["id"] for d in data["documents"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == [d.id for d in user_documents]
+
+    def test_last_page_has_no_cursor(self, client, auth_headers, user_documents):
+        data = client.get("/documents", headers=auth_headers, params={"limit": 10}).json()
+        assert data["next_cursor"] is None
+
+    def test_invalid_cursor_returns_400(self, client, auth_headers):
+        response = client.get("/documents", headers=auth_headers, params={"cursor": "no-es-un-cursor"})
+        assert response.status_code == 400
+
+    def test_limit_is_bounded(self, client, auth_headers):
+        response = client.get("/documents", headers=auth_headers, params={"limit": 10_000})
+        assert response.status_code == 422
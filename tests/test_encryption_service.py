@@ -1,9 +1,20 @@
-"""Tests unitarios del servicio de cifrado (Fernet) — encryption_service."""
+"""Tests unitarios del servicio de cifrado — encryption_service."""
+import io
+import os
+
 import pytest
 from cryptography.fernet import Fernet
 
 # Reutilizamos la clave de test ya definida en el entorno
-from app.services.encryption_service import encrypt_file, decrypt_file
+from app.services.encryption_service import (
+    DEFAULT_SEGMENT_SIZE,
+    HEADER_SIZE,
+    TAG_SIZE,
+    decrypt_file,
+    decrypt_stream,
+    encrypt_file,
+    encrypt_stream,
+)
 
 
 class TestEncryptFile:
@@ -22,7 +33,7 @@ class TestEncryptFile:
         """encrypt_file debe manejar contenido vacío sin errores."""
         result = encrypt_file(b"")
         assert isinstance(result, bytes)
-        assert len(result) > 0  # Fernet siempre añade overhead (IV + HMAC)
+        assert len(result) > 0  # Siempre hay overhead (cabecera + tag)
 
     def test_encrypt_large_content(self):
         """encrypt_file debe manejar archivos grandes correctamente."""
@@ -61,3 +72,60 @@ class TestDecryptFile:
         tampered[20] ^= 0xFF
         with pytest.raises(HTTPException):
             decrypt_file(bytes(tampered))
+
+
+class TestStreamEncryption:
+    def test_stream_roundtrip_from_chunks(self):
+        """El cifrado por segmentos debe recuperar el contenido aunque lleguen trozos irregulares."""
+        original = os.urandom(300_000)
+        chunks = [original[i:i + 7_000] for i in range(0, len(original), 7_000)]
+        encrypted = b"".join(encrypt_stream(chunks, segment_size=4096))
+        assert b"".join(decrypt_stream([encrypted])) == original
+
+    def test_stream_roundtrip_from_file_object(self):
+        """encrypt_stream/decrypt_stream deben aceptar objetos tipo fichero."""
+        original = b"linea de texto\n" * 10_000
+        encrypted = io.BytesIO(b"".join(encrypt_stream(io.BytesIO(original), segment_size=1024)))
+        assert b"".join(decrypt_stream(encrypted)) == original
+
+    def test_stream_roundtrip_exact_segment_multiple(self):
+        """Un contenido múltiplo exacto del segmento debe descifrarse correctamente."""
+        original = b"B" * 8192
+        encrypted = b"".join(encrypt_stream([original], segment_size=4096))
+        assert decrypt_file(encrypted) == original
+
+    def test_stream_has_no_base64_overhead(self):
+        """El formato por segmentos solo añade cabecera y un tag por segmento."""
+        original = b"A" * 1_000_000
+        encrypted = encrypt_file(original)
+        segments = len(original) // DEFAULT_SEGMENT_SIZE + 1
+        assert len(encrypted) == HEADER_SIZE + len(original) + segments * TAG_SIZE
+
+    def test_stream_yields_one_segment_at_a_time(self):
+        """Cada trozo devuelto por encrypt_stream debe tener como máximo un segmento."""
+        pieces = list(encrypt_stream([b"x" * 50_000], segment_size=4096))
+        assert len(pieces[0]) == HEADER_SIZE
+        assert max(len(p) for p in pieces[1:]) <= 4096 + TAG_SIZE
+
+    def test_truncated_stream_raises_http_exception(self):
+        """Eliminar el último segmento debe detectarse como manipulación."""
+        from fastapi import HTTPException
+        encrypted = b"".join(encrypt_stream([b"C" * 10_000], segment_size=4096))
+        with pytest.raises(HTTPException):
+            decrypt_file(encrypted[:HEADER_SIZE + 2 * (4096 + TAG_SIZE)])
+
+    def test_reordered_segments_raise_http_exception(self):
+        """Intercambiar segmentos cifrados debe fallar la autenticación."""
+        from fastapi import HTTPException
+        size = 4096 + TAG_SIZE
+        encrypted = b"".join(encrypt_stream([os.urandom(10_000)], segment_size=4096))
+        body = encrypted[HEADER_SIZE:]
+        swapped = encrypted[:HEADER_SIZE] + body[size:2 * size] + body[:size] + body[2 * size:]
+        with pytest.raises(HTTPException):
+            decrypt_file(swapped)
+
+    def test_legacy_fernet_blob_still_decrypts(self):
+        """Los documentos guardados con Fernet deben seguir siendo legibles."""
+        legacy = Fernet(os.environ["ENCRYPTION_KEY"].encode()).encrypt(b"documento antiguo")
+        assert decrypt_file(legacy) == b"documento antiguo"
+        assert b"".join(decrypt_stream([legacy])) == b"documento antiguo"
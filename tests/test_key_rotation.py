@@ -0,0 +1,167 @@
+"""Tests de la rotación de claves — varias claves activas y app/jobs/key_rotation.py."""
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+from fastapi import HTTPException
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import DedupEntry, Document, KeyRotationCheckpoint, User
+from app.jobs.key_rotation import KeyRotationJob, RateLimiter
+from app.services import encryption_service
+from app.services.encryption_service import decrypt_file, encrypt_file
+from app.services.key_service import LocalKeyProvider, key_service
+
+OLD_KEY = Fernet.generate_key().decode()
+NEW_KEY = Fernet.generate_key().decode()
+
+
+class TestMultipleKeys:
+    def test_old_documents_stay_readable_after_adding_a_key(self, use_keys):
+        use_keys(OLD_KEY)
+        segmented = encrypt_file(b"documento")
+        fernet = Fernet(OLD_KEY.encode()).encrypt(b"antiguo")
+
+        use_keys(NEW_KEY, OLD_KEY)
+        assert decrypt_file(segmented) == b"documento"
+        assert decrypt_file(fernet) == b"antiguo"
+
+        use_keys(NEW_KEY)
+        with pytest.raises(HTTPException):
+            decrypt_file(segmented)
+        with pytest.raises(HTTPException):
+            decrypt_file(fernet)
+
+    def test_new_documents_use_the_primary_key(self, use_keys):
+        use_keys(NEW_KEY, OLD_KEY)
+        blob = encrypt_file(b"nuevo")
+        use_keys(NEW_KEY)
+        assert decrypt_file(blob) == b"nuevo"
+
+    def test_local_provider_reports_which_key_unwraps(self):
+        old, new = b"o" * 32, b"n" * 32
+        plaintext, wrapped = LocalKeyProvider(master_key=old).generate_data_key()
+        provider = LocalKeyProvider(master_keys=[new, old])
+        assert provider.unwrap_with_index(wrapped) == (plaintext, 1)
+        assert provider.unwrap_with_index(provider.wrap(plaintext)) == (plaintext, 0)
+
+
+class TestRateLimiter:
+    def test_limits_acquisitions_per_second(self):
+        limiter = RateLimiter(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        assert time.monotonic() - start >= 0.09
+
+    def test_zero_rate_means_unlimited(self):
+        limiter = RateLimiter(rate=0)
+        start = time.monotonic()
+        for _ in range(1000):
+            limiter.acquire()
+        assert time.monotonic() - start < 0.5
+
+
+class TestKeyRotationJob:
+    @pytest.fixture
+    def vault(self, client, registered_user, storage, db_session, use_keys):
+        """Documentos de todos los tipos cifrados con la clave antigua."""
+        use_keys(OLD_KEY)
+        owner = db_session.query(User).filter(User.username == registered_user["username"]).one()
+        data_key = key_service.new_data_key()
+        documents = {
+            "segmentos.txt": (encrypt_file(b"segmentos"), None, None),
+            "fernet.txt": (Fernet(OLD_KEY.encode()).encrypt(b"fernet"), None, None),
+            "envolvente.txt": (
+                b"".join(encryption_service.encrypt_stream([b"envolvente"], key=data_key.plaintext)),
+                data_key.wrapped,
+                data_key.provider,
+            ),
+        }
+        for filename, (blob, wrapped, provider) in documents.items():
+            db_session.add(Document(
+                filename=filename,
+                s3_key=storage.upload_file(blob, filename, owner.id),
+                owner_id=owner.id,
+                wrapped_key=wrapped,
+                key_provider=provider,
+            ))
+        db_session.commit()
+        use_keys(NEW_KEY, OLD_KEY)
+        return sessionmaker(bind=db_session.get_bind())
+
+    def _contents(self, client, auth_headers, db_session):
+        return {
+            document.filename: client.get(f"/documents/{document.id}/content", headers=auth_headers).content
+            for document in db_session.query(Document).all()
+        }
+
+    def test_rotation_leaves_only_the_new_key_needed(self, client, auth_headers, storage, db_session, vault, use_keys):
+        old_keys = {d.s3_key for d in db_session.query(Document).filter(Document.wrapped_key.is_(None))}
+        state = KeyRotationJob(vault, storage=storage, batch_size=2, max_objects_per_second=0, log=lambda _: None).run()
+
+        assert state["processed"] == 3
+        assert state["reencrypted"] == 2
+        assert state["rewrapped"] == 1
+        assert state["failed"] == 0
+        assert state["finished_at"] is not None
+        assert not old_keys & set(storage.list_files("user_"))
+
+        use_keys(NEW_KEY)
+        db_session.expire_all()
+        assert self._contents(client, auth_headers, db_session) == {
+            "segmentos.txt": b"segmentos",
+            "fernet.txt": b"fernet",
+            "envolvente.txt": b"envolvente",
+        }
+
+    def test_deduplicated_copies_and_their_index_entry_are_rewrapped(
+        self, client, auth_headers, storage, db_session, use_keys
+    ):
+        use_keys(OLD_KEY)
+        for _ in range(2):
+            client.post("/documents/batch", headers=auth_headers, files=[("files", ("copia.txt", b"igual", "text/plain"))])
+        use_keys(NEW_KEY, OLD_KEY)
+        state = KeyRotationJob(
+            sessionmaker(bind=db_session.get_bind()), storage=storage, max_objects_per_second=0, log=lambda _: None
+        ).run()
+        assert state["rewrapped"] == 2
+
+        use_keys(NEW_KEY)
+        db_session.expire_all()
+        documents = db_session.query(Document).all()
+        assert [client.get(f"/documents/{d.id}/content", headers=auth_headers).content for d in documents] == [b"igual"] * 2
+        entry = db_session.query(DedupEntry).one()
+        assert key_service.unwrap(entry.key_provider, entry.wrapped_key)
+
+    def test_second_run_skips_rotated_documents(self, storage, vault):
+        KeyRotationJob(vault, storage=storage, max_objects_per_second=0, log=lambda _: None).run()
+        state = KeyRotationJob(vault, storage=storage, max_objects_per_second=0, log=lambda _: None).run(restart=True)
+        assert state["skipped"] == 3
+        assert state["reencrypted"] == state["rewrapped"] == 0
+
+    def test_interrupted_run_resumes_from_checkpoint(self, storage, db_session, vault):
+        first = KeyRotationJob(vault, storage=storage, batch_size=1, max_objects_per_second=0, log=lambda _: None)
+        first.log = lambda _: first.stop_event.set()
+        state = first.run()
+        assert state["processed"] == 1
+        assert state["finished_at"] is None
+
+        rotated = []
+        second = KeyRotationJob(vault, storage=storage, batch_size=1, max_objects_per_second=0, log=lambda _: None)
+        original = second._rotate
+        second._rotate = lambda row: rotated.append(row.id) or original(row)
+        state = second.run()
+        assert state["processed"] == 3
+        assert len(rotated) == 2
+        assert db_session.query(KeyRotationCheckpoint).one().last_document_id == max(
+            d.id for d in db_session.query(Document).all()
+        )
+
+    def test_progress_endpoint(self, client, storage, vault, internal_headers):
+        assert client.get("/internal/keys/rotation", headers=internal_headers).status_code == 404
+        KeyRotationJob(vault, storage=storage, max_objects_per_second=0, log=lambda _: None).run()
+        body = client.get("/internal/keys/rotation", headers=internal_headers).json()
+        assert body["processed"] == body["total"] == 3
+        assert body["eta_seconds"] == 0
+        assert body["documents_per_second"] > 0
@@ -0,0 +1,141 @@
+"""Tests del cifrado envolvente — services/key_service.py."""
+import os
+import time
+
+import boto3
+import pytest
+from fastapi import HTTPException
+from moto import mock_aws
+
+from app.core.config import settings
+from app.services.encryption_service import decrypt_stream, encrypt_stream
+from app.services.key_service import (
+    DataKeyCache,
+    EnvelopeKeyService,
+    KeyProvider,
+    KmsKeyProvider,
+    LocalKeyProvider,
+)
+
+
+class CountingProvider(KeyProvider):
+    """Proveedor local que cuenta las llamadas, para comprobar el efecto de la caché."""
+    name = "local"
+
+    def __init__(self):
+        self.inner = LocalKeyProvider()
+        self.calls = 0
+
+    def generate_data_key(self):
+        self.calls += 1
+        return self.inner.generate_data_key()
+
+    def decrypt_data_key(self, wrapped):
+        self.calls += 1
+        return self.inner.decrypt_data_key(wrapped)
+
+
+def _service(provider, max_size=10, ttl=60, max_uses=100):
+    return EnvelopeKeyService({"local": provider}, "local", DataKeyCache(max_size, ttl, max_uses))
+
+
+class TestLocalKeyProvider:
+    def test_wrap_unwrap_roundtrip(self):
+        provider = LocalKeyProvider()
+        plaintext, wrapped = provider.generate_data_key()
+        assert len(plaintext) == 32
+        assert plaintext not in wrapped
+        assert provider.decrypt_data_key(wrapped) == plaintext
+
+    def test_tampered_wrapped_key_is_rejected(self):
+        provider = LocalKeyProvider()
+        _, wrapped = provider.generate_data_key()
+        tampered = bytearray(wrapped)
+        tampered[-1] ^= 0x01
+        with pytest.raises(Exception):
+            provider.decrypt_data_key(bytes(tampered))
+
+    def test_data_key_encrypts_document_stream(self):
+        """La clave de datos debe servir como clave del formato por segmentos."""
+        plaintext, _ = LocalKeyProvider().generate_data_key()
+        encrypted = b"".join(encrypt_stream([b"secreto"], key=plaintext))
+        assert b"".join(decrypt_stream([encrypted], key=plaintext)) == b"secreto"
+        with pytest.raises(HTTPException):
+            b"".join(decrypt_stream([encrypted]))
+
+
+class TestKmsKeyProvider:
+    def test_kms_provider_roundtrip(self):
+        with mock_aws():
+            key_id = boto3.client("kms", region_name=settings.AWS_REGION).create_key()["KeyMetadata"]["KeyId"]
+            provider = KmsKeyProvider(key_id)
+            plaintext, wrapped = provider.generate_data_key()
+            assert provider.decrypt_data_key(wrapped) == plaintext
+
+
+class TestKeyProvider:
+    def test_incomplete_provider_fails_on_instantiation(self):
+        class WrapOnly(KeyProvider):
+            def generate_data_key(self):
+                return b"k", b"w"
+
+        with pytest.raises(TypeError):
+            WrapOnly()
+
+
+class TestEnvelopeKeyService:
+    def test_hot_document_skips_provider_calls(self):
+        """Desenvolver repetidamente la misma clave solo debe llamar al proveedor una vez."""
+        provider = CountingProvider()
+        service = _service(provider)
+        _, wrapped = provider.inner.generate_data_key()
+        keys = {service.unwrap("local", wrapped) for _ in range(5)}
+        assert len(keys) == 1
+        assert provider.calls == 1
+        stats = service.stats()
+        assert stats["provider_calls"] == 1
+        assert stats["provider_calls_avoided"] == 4
+
+    def test_new_data_key_is_cached(self):
+        provider = CountingProvider()
+        service = _service(provider)
+        data_key = service.new_data_key()
+        assert service.unwrap(data_key.provider, data_key.wrapped) == data_key.plaintext
+        assert provider.calls == 1
+
+    def test_cache_respects_ttl(self):
+        provider = CountingProvider()
+        service = _service(provider, ttl=0.01)
+        _, wrapped = provider.inner.generate_data_key()
+        service.unwrap("local", wrapped)
+        time.sleep(0.02)
+        service.unwrap("local", wrapped)
+        assert provider.calls == 2
+
+    def test_cache_respects_max_uses(self):
+        provider = CountingProvider()
+        service = _service(provider, max_uses=2)
+        _, wrapped = provider.inner.generate_data_key()
+        for _ in range(4):
+            service.unwrap("local", wrapped)
+        # 1 llamada inicial + 2 usos desde caché + 1 llamada al agotar los usos
+        assert provider.calls == 2
+
+    def test_cache_is_bounded_by_size(self):
+        provider = CountingProvider()
+        service = _service(provider, max_size=2)
+        for _ in range(3):
+            service.new_data_key()
+        assert service.stats()["cache"]["size"] == 2
+        assert service.stats()["cache"]["evictions"] == 1
+
+    def test_unknown_provider_raises_500(self):
+        service = _service(CountingProvider())
+        with pytest.raises(HTTPException) as exc_info:
+            service.unwrap("kms", os.urandom(32))
+        assert exc_info.value.status_code == 500
+
+    def test_invalid_wrapped_key_raises_500(self):
+        service = _service(CountingProvider())
+        with pytest.raises(HTTPException):
+            service.unwrap("local", b"\x01" + os.urandom(60))
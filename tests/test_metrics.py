@@ -0,0 +1,162 @@
+"""Tests de las métricas — core/metrics.py y GET /metrics."""
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+
+from app.core.metrics import (
+    AUTH_FAILURES,
+    DB_QUERY_LATENCY,
+    ENCRYPTION_BYTES,
+    ENCRYPTION_LATENCY,
+    HTTP_REQUESTS,
+    PASSWORD_VERIFY_LATENCY,
+    S3_ERRORS,
+    S3_LATENCY,
+    MetricsRegistry,
+    _Metric,
+    statement_kind,
+)
+from app.core.security import get_password_hash, verify_password
+from app.db.database import instrument_engine
+from app.services.encryption_service import decrypt_file, encrypt_file
+
+
+class TestRegistry:
+    def test_counter_exposition(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("peticiones_total", "Peticiones.", ("ruta",))
+        counter.inc("/a")
+        counter.inc("/a", amount=2)
+        counter.inc('/b"c')
+        lines = registry.render().splitlines()
+        assert "# TYPE peticiones_total counter" in lines
+        assert 'peticiones_total{ruta="/a"} 3' in lines
+        assert 'peticiones_total{ruta="/b\\"c"} 1' in lines
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latencia_seconds", "Latencia.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value)
+        lines = registry.render().splitlines()
+        assert 'latencia_seconds_bucket{le="0.1"} 1' in lines
+        assert 'latencia_seconds_bucket{le="1.0"} 3' in lines
+        assert 'latencia_seconds_bucket{le="+Inf"} 4' in lines
+        assert "latencia_seconds_count 4" in lines
+        assert "latencia_seconds_sum 4.25" in lines
+
+    def test_registering_twice_returns_same_metric(self):
+        registry = MetricsRegistry()
+        assert registry.counter("x_total", "X.") is registry.counter("x_total", "X.")
+
+    def test_failing_collector_does_not_break_exposition(self):
+        registry = MetricsRegistry()
+        registry.counter("x_total", "X.").inc()
+
+        def broken():
+            raise RuntimeError("fallo")
+
+        registry.add_collector(broken)
+        registry.add_collector(lambda: ["extra 1"])
+        output = registry.render()
+        assert "x_total 1" in output
+        assert "extra 1" in output
+
+    def test_statement_kind(self):
+        assert statement_kind("  select 1") == "SELECT"
+        assert statement_kind("INSERT INTO t VALUES (1)") == "INSERT"
+        assert statement_kind("PRAGMA foreign_keys") == "OTHER"
+
+
+    def test_incomplete_metric_fails_on_instantiation(self):
+        class RenderOnly(_Metric):
+            def render(self):
+                return []
+
+        with pytest.raises(TypeError):
+            RenderOnly("incompleta", "Sin clear().")
+
+
+class TestMetricsEndpoint:
+    def test_route_template_is_used_as_label(self, client):
+        before = HTTP_REQUESTS.value("GET", "/documents/{document_id}/content", "401")
+        client.get("/documents/123/content")
+        client.get("/documents/456/content")
+        after = HTTP_REQUESTS.value("GET", "/documents/{document_id}/content", "401")
+        assert after - before == 2
+
+    def test_unknown_paths_share_one_label(self, client):
+        before = HTTP_REQUESTS.value("GET", "unmatched", "404")
+        client.get("/no-existe-1")
+        client.get("/no-existe-2")
+        assert HTTP_REQUESTS.value("GET", "unmatched", "404") - before == 2
+
+    def test_exposition_format(self, client, internal_headers):
+        client.get("/health")
+        response = client.get("/metrics", headers=internal_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/health",le="+Inf"}' in response.text
+        assert "# TYPE s3_request_duration_seconds histogram" in response.text
+
+
+class TestInternalAccess:
+    @pytest.mark.parametrize("path", ["/metrics", "/internal/db/pool", "/internal/keys/rotation"])
+    def test_requires_the_internal_token(self, client, auth_headers, path):
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers={"Authorization": "Bearer otro"}).status_code == 401
+        # Un JWT de usuario tampoco vale
+        assert client.get(path, headers=auth_headers).status_code == 401
+
+    @pytest.mark.parametrize("path", ["/metrics", "/internal/db/pool", "/internal/keys/rotation"])
+    def test_disabled_without_a_configured_token(self, client, monkeypatch, path):
+        monkeypatch.setattr(settings, "INTERNAL_API_TOKEN", "")
+        assert client.get(path).status_code == 404
+        assert client.get(path, headers={"Authorization": "Bearer "}).status_code == 404
+
+
+class TestHooks:
+    def test_s3_calls_are_timed(self, s3):
+        before = S3_LATENCY.count("PutObject")
+        errors_before = S3_ERRORS.value("GetObject")
+        s3.upload_file(b"contenido", "a.txt", 1)
+        try:
+            s3.download_file("user_1/no-existe.txt")
+        except Exception:
+            pass
+        assert S3_LATENCY.count("PutObject") == before + 1
+        assert S3_ERRORS.value("GetObject") == errors_before + 1
+
+    def test_encryption_is_timed(self):
+        before = ENCRYPTION_LATENCY.count("encrypt_file")
+        bytes_before = ENCRYPTION_BYTES.value("decrypt")
+        decrypt_file(encrypt_file(b"x" * 1000))
+        assert ENCRYPTION_LATENCY.count("encrypt_file") == before + 1
+        assert ENCRYPTION_BYTES.value("decrypt") == bytes_before + 1000
+
+    def test_password_verification_is_timed(self):
+        hashed = get_password_hash("secreto")
+        before = PASSWORD_VERIFY_LATENCY.count()
+        verify_password("secreto", hashed)
+        assert PASSWORD_VERIFY_LATENCY.count() == before + 1
+
+    def test_auth_failures_are_counted(self, client, registered_user):
+        before = AUTH_FAILURES.value("bad_password")
+        invalid_before = AUTH_FAILURES.value("invalid_token")
+        client.post(
+            "/api/v1/auth/login",
+            data={"username": registered_user["username"], "password": "incorrecta"},
+        )
+        client.get("/api/v1/auth/me", headers={"Authorization": "Bearer no-es-un-jwt"})
+        assert AUTH_FAILURES.value("bad_password") == before + 1
+        assert AUTH_FAILURES.value("invalid_token") == invalid_before + 1
+
+    def test_db_statements_are_timed(self):
+        engine = create_engine("sqlite://")
+        instrument_engine(engine)
+        before = DB_QUERY_LATENCY.count("SELECT")
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        assert DB_QUERY_LATENCY.count("SELECT") == before + 1
+        engine.dispose()
@@ -0,0 +1,204 @@
+"""Tests de la caché en disco de objetos cifrados — services/object_cache.py y su uso en AsyncS3Service."""
+import asyncio
+import io
+import os
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.core.metrics import S3_LATENCY
+from app.db.models import Document
+from app.services.async_s3_service import AsyncS3Service, async_s3_service
+from app.services.object_cache import ObjectCache
+
+
+def _opener(data: bytes, calls=None, delay: float = 0):
+    def open_object():
+        if calls is not None:
+            calls.append(1)
+        time.sleep(delay)
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+    return open_object
+
+
+def _fill(cache: ObjectCache, key: str, data: bytes):
+    future, leader = cache.claim(key)
+    if leader:
+        cache.fill(key, future, _opener(data))
+    return future.result()
+
+
+def _fernet(content: bytes) -> bytes:
+    return Fernet(os.environ["ENCRYPTION_KEY"].encode()).encrypt(content)
+
+
+def _cache_files(cache: ObjectCache):
+    if cache.path is None:
+        return []
+    return [name for name in os.listdir(cache.path) if name.endswith(".obj")]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    object_cache = ObjectCache(str(tmp_path), max_bytes=10 * 1024 * 1024, max_object_bytes=1024 * 1024)
+    monkeypatch.setattr(async_s3_service, "cache", object_cache)
+    yield object_cache
+    object_cache.clear()
+
+
+class TestObjectCache:
+    def test_lru_eviction_by_total_bytes(self, tmp_path):
+        cache = ObjectCache(str(tmp_path), max_bytes=250, max_object_bytes=100)
+        for key in ("a", "b"):
+            _fill(cache, key, key.encode() * 100)
+        assert cache.get("a") is not None  # "a" pasa a ser el más reciente
+        _fill(cache, "c", b"c" * 100)
+
+        assert cache.get("b") is None
+        assert cache.get("a").read() == b"a" * 100
+        assert cache.stats()["bytes"] == 200
+        assert cache.stats()["evictions"] == 1
+        assert len(_cache_files(cache)) == 2
+
+    def test_objects_over_the_limit_are_not_stored(self, tmp_path):
+        cache = ObjectCache(str(tmp_path), max_bytes=1000, max_object_bytes=10)
+        assert _fill(cache, "grande", b"x" * 11) is None
+        assert cache.get("grande") is None
+        assert _cache_files(cache) == []
+
+    def test_reads_ranges_from_the_mapping(self, tmp_path):
+        cache = ObjectCache(str(tmp_path), max_bytes=1000, max_object_bytes=1000)
+        entry = _fill(cache, "k", bytes(range(200)))
+        assert entry.read(10, 19) == bytes(range(10, 20))
+        assert entry.read(190, 500) == bytes(range(190, 200))
+        assert b"".join(entry.iter_range(5, 104, chunk_size=30)) == bytes(range(5, 105))
+
+    def test_invalidation_during_a_fill_does_not_store_it(self, tmp_path):
+        cache = ObjectCache(str(tmp_path), max_bytes=1000, max_object_bytes=1000)
+        future, leader = cache.claim("k")
+        assert leader
+        cache.invalidate("k")
+        cache.fill("k", future, _opener(b"viejo"))
+        assert future.result().read() == b"viejo"
+        assert cache.get("k") is None
+        assert _cache_files(cache) == []
+
+    def test_workers_sharing_the_directory_keep_their_own_files(self, tmp_path):
+        (tmp_path / "otro.txt").write_bytes(b"y")
+        first = ObjectCache(str(tmp_path), max_bytes=1000, max_object_bytes=1000)
+        second = ObjectCache(str(tmp_path), max_bytes=1000, max_object_bytes=1000)
+        _fill(first, "k", b"primero")
+        _fill(second, "k", b"segundo")
+        assert first.path != second.path
+        assert first.get("k").read() == b"primero"
+        assert len(_cache_files(first)) == len(_cache_files(second)) == 1
+
+        second.clear()
+        assert first.get("k").read() == b"primero"
+        assert sorted(os.listdir(tmp_path)) == sorted(["otro.txt", os.path.basename(first.path)])
+
+    def test_concurrent_misses_share_one_download(self, tmp_path):
+        calls = []
+
+        class FakeS3:
+            def get_object(self, s3_key, start=None, end=None):
+                return _opener(b"z" * 500, calls, delay=0.05)()
+
+        cache = ObjectCache(str(tmp_path), max_bytes=1000, max_object_bytes=1000)
+        service = AsyncS3Service(FakeS3(), cache=cache)
+
+        async def main():
+            return await asyncio.gather(*(service.download("k", object_size=500) for _ in range(10)))
+
+        try:
+            results = asyncio.run(main())
+        finally:
+            service.close()
+        assert results == [b"z" * 500] * 10
+        assert len(calls) == 1
+        assert cache.stats()["coalesced"] == 9
+
+    def test_threads_waiting_on_a_fill_get_the_same_entry(self, tmp_path):
+        cache = ObjectCache(str(tmp_path), max_bytes=1000, max_object_bytes=1000)
+        future, leader = cache.claim("k")
+        waiters = [cache.claim("k") for _ in range(3)]
+        assert leader and not any(is_leader for _, is_leader in waiters)
+        threading.Thread(target=cache.fill, args=("k", future, _opener(b"abc", delay=0.02))).start()
+        assert {id(waiter.result(timeout=5)) for waiter, _ in waiters} == {id(future.result())}
+
+
+class TestCachedDownloads:
+    def test_hot_documents_are_served_without_s3(self, client, auth_headers, storage, cache, upload_documents):
+        # Contenido aleatorio: no se comprime y admite peticiones Range
+        content = os.urandom(10_000)
+        document_id, = upload_documents(("plantilla.bin", content))
+        first = client.get(f"/documents/{document_id}/content", headers=auth_headers)
+        assert first.content == content
+
+        before = S3_LATENCY.count("GetObject")
+        for _ in range(3):
+            response = client.get(f"/documents/{document_id}/content", headers=auth_headers)
+            assert response.content == content
+        partial = client.get(f"/documents/{document_id}/content", headers={**auth_headers, "Range": "bytes=10-19"})
+        assert partial.status_code == 206
+        assert partial.content == content[10:20]
+        assert S3_LATENCY.count("GetObject") == before
+        assert (cache.stats()["hits"], cache.stats()["misses"]) == (4, 1)
+
+    def test_only_ciphertext_is_written_to_disk(
+        self, client, auth_headers, storage, cache, db_session, upload_documents
+    ):
+        document_id, = upload_documents(("secreto.txt", b"texto muy secreto " * 100))
+        client.get(f"/documents/{document_id}/content", headers=auth_headers)
+        files = _cache_files(cache)
+        assert len(files) == 1
+        with open(os.path.join(cache.path, files[0]), "rb") as f:
+            on_disk = f.read()
+        assert b"secreto" not in on_disk
+        assert on_disk == storage.download_file(db_session.get(Document, document_id).s3_key)
+
+    def test_delete_invalidates_the_entry(self, client, auth_headers, storage, cache, upload_documents):
+        document_id, = upload_documents(("a.txt", b"contenido"))
+        client.get(f"/documents/{document_id}/content", headers=auth_headers)
+        assert cache.stats()["entries"] == 1
+
+        client.delete(f"/documents/{document_id}", headers=auth_headers)
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["invalidations"] == 1
+        assert _cache_files(cache) == []
+
+    def test_hit_ratio_is_exported(self, client, auth_headers, storage, cache, internal_headers, upload_documents):
+        document_id, = upload_documents(("a.txt", b"contenido"))
+        for _ in range(2):
+            client.get(f"/documents/{document_id}/content", headers=auth_headers)
+        # Una consulta por descarga: el primer fallo y el acierto de la segunda
+        assert "object_cache_hit_ratio 0.5" in client.get("/metrics", headers=internal_headers).text
+        status = client.get("/internal/cache/objects", headers=internal_headers).json()
+        assert status["enabled"] is True
+        assert (status["hits"], status["misses"]) == (1, 1)
+
+    def test_legacy_document_over_the_limit_is_fetched_once(
+        self, client, auth_headers, storage, cache, store_document, monkeypatch
+    ):
+        content = os.urandom(2 * 1024 * 1024)
+        document_id = store_document(_fernet(content), "antiguo.bin")
+        calls = []
+        original = storage.s3_client.get_object
+
+        def counting_get_object(**kwargs):
+            calls.append(kwargs.get("Range"))
+            return original(**kwargs)
+
+        monkeypatch.setattr(storage.s3_client, "get_object", counting_get_object)
+        assert client.get(f"/documents/{document_id}/content", headers=auth_headers).content == content
+        # La cabecera y una sola descarga completa, sin pasar por la caché
+        assert len(calls) == 2
+        assert cache.stats()["entries"] == 0
+
+    def test_small_legacy_document_is_cached(self, client, auth_headers, cache, store_document):
+        document_id = store_document(_fernet(b"contenido antiguo"), "antiguo.txt")
+        for _ in range(2):
+            assert client.get(f"/documents/{document_id}/content", headers=auth_headers).content == b"contenido antiguo"
+        assert cache.stats()["entries"] == 1
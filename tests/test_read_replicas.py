@@ -0,0 +1,170 @@
+"""Tests del enrutado de lecturas a réplicas — app/db/replicas.py y get_read_db."""
+import time
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.metrics import DB_READ_SESSIONS
+from app.db import database, replicas
+from app.db.database import Base, get_read_db
+from app.db.models import Document, User
+from app.db.replicas import ReplicaRouter, RoutingSession
+from app.main import app
+from app.services.search_service import search_documents
+from tests.conftest import engine as test_engine
+
+
+def _memory_engine():
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+def _seed(target, username):
+    Base.metadata.create_all(bind=target)
+    with sessionmaker(bind=target)() as session:
+        session.add(User(username=username, email=f"{username}@example.com", hashed_password="x"))
+        session.commit()
+
+
+@pytest.fixture
+def primary():
+    target = _memory_engine()
+    _seed(target, "en_primario")
+    yield target
+    target.dispose()
+
+
+def _replica_engines(*names):
+    engines = {}
+    for name in names:
+        engines[name] = _memory_engine()
+        _seed(engines[name], name)
+    return engines
+
+
+def _router(engines, max_lag=5, check_interval=60):
+    return ReplicaRouter(list(engines), lambda url: engines[url], max_lag=max_lag, check_interval=check_interval)
+
+
+def _session(primary, router):
+    return sessionmaker(class_=RoutingSession, bind=primary, router=router)()
+
+
+def _username(session):
+    return session.scalar(select(User.username))
+
+
+class TestRoutingSession:
+    def test_reads_go_to_a_replica(self, primary):
+        router = _router(_replica_engines("replica_a"))
+        before = DB_READ_SESSIONS.value("replica")
+        with _session(primary, router) as session:
+            assert _username(session) == "replica_a"
+            assert session.query(User.username).scalar() == "replica_a"
+        assert DB_READ_SESSIONS.value("replica") == before + 1
+
+    def test_without_router_everything_uses_the_primary(self, primary):
+        with _session(primary, None) as session:
+            assert _username(session) == "en_primario"
+
+    def test_a_write_pins_the_session_to_the_primary(self, primary):
+        with _session(primary, _router(_replica_engines("replica_a"))) as session:
+            assert _username(session) == "replica_a"
+            session.add(User(username="nuevo", email="nuevo@example.com", hashed_password="x"))
+            session.flush()
+            # Lee lo que acaba de escribir, aunque la sentencia sea un SELECT normal
+            assert session.scalar(select(User.id).where(User.username == "nuevo")) is not None
+            assert _username(session) == "en_primario"
+
+    @pytest.mark.parametrize("statement", [
+        select(User.username).with_for_update(),
+        text("SELECT username FROM users"),
+    ])
+    def test_locking_and_raw_statements_use_the_primary(self, primary, statement):
+        with _session(primary, _router(_replica_engines("replica_a"))) as session:
+            assert session.scalar(statement) == "en_primario"
+
+    def test_replicas_are_balanced_round_robin(self, primary):
+        router = _router(_replica_engines("replica_a", "replica_b"))
+        seen = []
+        for _ in range(4):
+            with _session(primary, router) as session:
+                seen.append(_username(session))
+        assert seen == ["replica_a", "replica_b", "replica_a", "replica_b"]
+
+    def test_search_runs_on_the_replica(self, primary):
+        engines = _replica_engines("replica_a")
+        with sessionmaker(bind=engines["replica_a"])() as session:
+            session.add(Document(filename="informe_replica.pdf", s3_key="k", owner_id=1, size=1))
+            session.commit()
+        with _session(primary, _router(engines)) as session:
+            hits = search_documents(session, 1, "informe", limit=10)
+            assert [hit.filename for hit in hits] == ["informe_replica.pdf"]
+            assert "primary" not in session.info
+            assert session.info["replica"] is engines["replica_a"]
+
+
+class TestReplicaHealth:
+    def test_unreachable_replica_falls_back_to_the_primary(self, primary, tmp_path):
+        missing = f"sqlite:///{tmp_path}/no/existe.db"
+        router = ReplicaRouter([missing], create_engine, max_lag=5, check_interval=60)
+        with _session(primary, router) as session:
+            assert _username(session) == "en_primario"
+        status = router.status()[0]
+        assert status["healthy"] is False
+        assert status["last_error"]
+        assert "url" not in status
+
+    def test_lagging_replica_is_skipped_until_it_catches_up(self, primary, monkeypatch):
+        router = _router(_replica_engines("replica_a"), max_lag=5, check_interval=0.05)
+        monkeypatch.setattr(replicas, "replica_lag", lambda connection: 30.0)
+        with _session(primary, router) as session:
+            assert _username(session) == "en_primario"
+        assert router.status()[0]["lag_seconds"] == 30.0
+
+        monkeypatch.setattr(replicas, "replica_lag", lambda connection: 0.5)
+        # Dentro del intervalo se reutiliza el último resultado
+        with _session(primary, router) as session:
+            assert _username(session) == "en_primario"
+        time.sleep(0.06)
+        with _session(primary, router) as session:
+            assert _username(session) == "replica_a"
+
+    def test_disconnect_during_a_query_marks_the_replica_down(self, primary):
+        router = _router(_replica_engines("replica_a"))
+        replica = router.replicas[0]
+        assert router.choose() is not None
+
+        class Context:
+            is_disconnect = True
+            original_exception = ConnectionError("conexión perdida")
+
+        replica._on_error(Context())
+        assert router.choose() is None
+        assert replica.status()["last_error"] == "conexión perdida"
+
+
+class TestReadEndpoints:
+    def test_listing_and_usage_read_from_the_replica(self, client, auth_headers, internal_headers, monkeypatch):
+        # Réplica sobre la misma base de los tests: mismos datos, pero se cuenta como réplica
+        router = ReplicaRouter(["replica"], lambda url: test_engine, max_lag=5, check_interval=60)
+        monkeypatch.setattr(database, "replica_router", router)
+
+        def override_get_read_db():
+            with sessionmaker(class_=RoutingSession, bind=test_engine, router=router)() as session:
+                yield session
+
+        app.dependency_overrides[get_read_db] = override_get_read_db
+        before = DB_READ_SESSIONS.value("replica")
+        assert client.get("/documents", headers=auth_headers).status_code == 200
+        assert client.get("/documents/usage", headers=auth_headers).status_code == 200
+        assert DB_READ_SESSIONS.value("replica") == before + 2
+
+        status = client.get("/internal/db/replicas", headers=internal_headers).json()
+        assert status["configured"] == 1
+        assert status["replicas"][0]["healthy"] is True
+        assert "db_replicas_healthy 1" in client.get("/metrics", headers=internal_headers).text
+
+    def test_status_without_replicas(self, client, internal_headers):
+        assert client.get("/internal/db/replicas", headers=internal_headers).json() == {"configured": 0, "replicas": []}
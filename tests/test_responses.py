@@ -0,0 +1,113 @@
+"""Tests de los esquemas de respuesta, la serialización JSON y la compresión de listados — app/core/responses.py."""
+import json
+from datetime import datetime
+
+import pytest
+
+from app.core import responses
+from app.core.config import settings
+from app.core.responses import FastJSONResponse, negotiate_encoding
+from app.db.models import Document, User
+
+
+@pytest.fixture
+def many_documents(db_session, registered_user):
+    """Crea 200 documentos: la página completa pasa de sobra de unos pocos KB de JSON."""
+    owner = db_session.query(User).filter(User.username == registered_user["username"]).one()
+    db_session.add_all([
+        Document(filename=f"informe_{i:03d}.pdf", s3_key=f"user_{owner.id}/{i}.pdf", owner_id=owner.id, size=i,
+                 upload_date=datetime(2024, 1, 1, 12, 0, i % 60))
+        for i in range(200)
+    ])
+    db_session.commit()
+
+
+class TestFastJSONResponse:
+    def test_renders_the_same_json_as_the_standard_library(self):
+        content = {"nombre": "contrato ñ.pdf", "ids": [1, 2], "vacío": None, "ok": True}
+        assert json.loads(FastJSONResponse(content).body) == content
+
+    def test_is_the_app_default(self, client):
+        response = client.get("/health")
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["status"] == "ok"
+
+
+class TestNegotiateEncoding:
+    @pytest.mark.parametrize("header, expected", [
+        (None, None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("gzip;q=0", None),
+        ("br, *", "gzip"),
+        ("*;q=0", None),
+    ])
+    def test_gzip(self, monkeypatch, header, expected):
+        monkeypatch.setattr(responses, "zstandard", None)
+        assert negotiate_encoding(header) == expected
+
+    def test_prefers_zstd_when_available(self):
+        pytest.importorskip("zstandard")
+        assert negotiate_encoding("gzip, zstd") == "zstd"
+        assert negotiate_encoding("gzip, zstd;q=0") == "gzip"
+
+
+class TestListingCompression:
+    def test_large_pages_are_compressed(self, client, auth_headers, many_documents, monkeypatch):
+        monkeypatch.setattr(responses, "zstandard", None)
+        response = client.get("/documents", params={"limit": 200}, headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Authorization, Accept-Encoding"
+        assert response.headers["ETag"].endswith('-gzip"')
+        assert len(response.json()["documents"]) == 200
+        # httpx ya ha descomprimido el cuerpo; Content-Length es el tamaño comprimido
+        assert int(response.headers["Content-Length"]) < len(response.content) / 4
+
+    def test_small_pages_and_identity_are_not_compressed(self, client, auth_headers, many_documents):
+        small = client.get("/documents", params={"limit": 1}, headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in small.headers
+        assert small.headers["Vary"] == "Authorization, Accept-Encoding"
+
+        identity = client.get("/documents", params={"limit": 200}, headers={**auth_headers, "Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in identity.headers
+        assert len(identity.json()["documents"]) == 200
+
+    def test_threshold_zero_disables_compression(self, client, auth_headers, many_documents, monkeypatch):
+        monkeypatch.setattr(settings, "RESPONSE_COMPRESSION_MIN_BYTES", 0)
+        response = client.get("/documents", params={"limit": 200}, headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+    def test_compressed_etag_revalidates(self, client, auth_headers, many_documents, monkeypatch):
+        monkeypatch.setattr(responses, "zstandard", None)
+        headers = {**auth_headers, "Accept-Encoding": "gzip"}
+        etag = client.get("/documents", params={"limit": 200}, headers=headers).headers["ETag"]
+        again = client.get("/documents", params={"limit": 200}, headers={**headers, "If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.headers["ETag"] == etag
+
+    def test_search_is_compressed_too(self, client, auth_headers, many_documents, monkeypatch):
+        monkeypatch.setattr(responses, "zstandard", None)
+        response = client.get(
+            "/documents/search", params={"q": "informe", "limit": 100}, headers={**auth_headers, "Accept-Encoding": "gzip"}
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert len(response.json()["documents"]) == 100
+
+
+class TestResponseModels:
+    def test_login_returns_only_the_token_fields(self, client, registered_user):
+        response = client.post(
+            "/api/v1/auth/login",
+            data={"username": registered_user["username"], "password": registered_user["password"]},
+        )
+        assert set(response.json()) == {"access_token", "token_type"}
+
+    def test_batch_results_omit_empty_fields(self, client, auth_headers, storage):
+        response = client.post(
+            "/documents/batch", headers=auth_headers, files=[("files", ("a.txt", b"a", "text/plain"))]
+        )
+        assert response.json()["results"][0].keys() == {"filename", "status", "id"}
+
+    def test_schemas_are_published_in_openapi(self, client):
+        schemas = client.get("/openapi.json").json()["components"]["schemas"]
+        assert {"Token", "UserCreated", "DocumentPage", "DocumentItem", "StorageUsage"} <= set(schemas)
@@ -0,0 +1,95 @@
+"""Tests del servicio de almacenamiento S3 — s3_services (con moto como S3 local)."""
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.services import s3_services
+from app.services.encryption_service import decrypt_file, encrypt_stream
+from app.services.s3_services import MIN_PART_SIZE
+
+
+def _read(service, key):
+    return service.s3_client.get_object(Bucket=service.bucket_name, Key=key)["Body"].read()
+
+
+class TestUploadFile:
+    def test_upload_file_returns_key_under_user_prefix(self, s3):
+        """La clave generada debe ir bajo la carpeta del usuario y conservar la extensión."""
+        key = s3.upload_file(b"contenido", "informe.pdf", 7)
+        assert key.startswith("user_7/")
+        assert key.endswith(".pdf")
+        assert _read(s3, key) == b"contenido"
+
+
+class TestUploadStream:
+    def test_small_stream_uses_single_put(self, s3):
+        """Un flujo menor que una parte debe subirse sin multiparte."""
+        key = s3.upload_stream([b"abc", b"def"], "a.txt", 1)
+        assert _read(s3, key) == b"abcdef"
+
+    def test_large_stream_is_uploaded_in_parts(self, s3):
+        """Un flujo de varias partes debe reconstruirse íntegro en S3."""
+        payload = os.urandom(2 * MIN_PART_SIZE + 1234)
+        chunks = [payload[i:i + 100_000] for i in range(0, len(payload), 100_000)]
+        key = s3.upload_stream(chunks, "grande.bin", 1, part_size=MIN_PART_SIZE, max_workers=2)
+        head = s3.s3_client.head_object(Bucket=s3.bucket_name, Key=key)
+        assert head["ETag"].endswith('-3"')
+        assert _read(s3, key) == payload
+
+    def test_encrypted_stream_roundtrip(self, s3):
+        """La salida de encrypt_stream debe poder subirse directamente por partes."""
+        payload = os.urandom(MIN_PART_SIZE + 10_000)
+        key = s3.upload_stream(encrypt_stream([payload]), "doc.pdf", 3, part_size=MIN_PART_SIZE)
+        assert decrypt_file(_read(s3, key)) == payload
+
+    def test_part_size_below_s3_minimum_is_rejected(self, s3):
+        with pytest.raises(ValueError):
+            s3.upload_stream([b"x"], "a.txt", 1, part_size=1024)
+
+    def test_failed_part_is_retried(self, s3, monkeypatch):
+        """Un fallo puntual en una parte debe reintentarse sin reiniciar la subida."""
+        monkeypatch.setattr(s3_services.time, "sleep", lambda _: None)
+        original = s3.s3_client.upload_part
+        calls = {"failures": 0}
+
+        def flaky_upload_part(**kwargs):
+            if kwargs["PartNumber"] == 2 and calls["failures"] == 0:
+                calls["failures"] += 1
+                raise ClientError({"Error": {"Code": "InternalError"}}, "UploadPart")
+            return original(**kwargs)
+
+        monkeypatch.setattr(s3.s3_client, "upload_part", flaky_upload_part)
+        payload = os.urandom(2 * MIN_PART_SIZE)
+        key = s3.upload_stream([payload], "a.bin", 1, part_size=MIN_PART_SIZE)
+        assert calls["failures"] == 1
+        assert _read(s3, key) == payload
+
+    def test_persistent_failure_aborts_upload(self, s3, monkeypatch):
+        """Si una parte agota los reintentos, la subida multiparte debe abortarse."""
+        monkeypatch.setattr(s3_services.time, "sleep", lambda _: None)
+
+        def broken_upload_part(**kwargs):
+            raise ClientError({"Error": {"Code": "InternalError"}}, "UploadPart")
+
+        monkeypatch.setattr(s3.s3_client, "upload_part", broken_upload_part)
+        with pytest.raises(Exception, match="No se pudo subir"):
+            s3.upload_stream([os.urandom(2 * MIN_PART_SIZE)], "a.bin", 1, part_size=MIN_PART_SIZE)
+        pending = s3.s3_client.list_multipart_uploads(Bucket=s3.bucket_name)
+        assert pending.get("Uploads", []) == []
+
+
+class TestDownloadDeleteList:
+    def test_download_file_returns_content(self, s3):
+        key = s3.upload_file(b"datos", "a.txt", 1)
+        assert s3.download_file(key) == b"datos"
+
+    def test_delete_file_removes_object(self, s3):
+        key = s3.upload_file(b"datos", "a.txt", 1)
+        s3.delete_file(key)
+        assert s3.list_files("user_1/") == []
+
+    def test_list_files_is_scoped_to_prefix(self, s3):
+        own = s3.upload_file(b"1", "a.txt", 1)
+        s3.upload_file(b"2", "b.txt", 2)
+        assert s3.list_files("user_1/") == [own]
@@ -1,8 +1,17 @@
 """Tests unitarios de las utilidades de seguridad — core/security.py."""
+import asyncio
+import threading
+
 import pytest
 import jwt
+from passlib.hash import pbkdf2_sha256
 
-from app.core.security import verify_password, get_password_hash, create_access_token
+from app.core.security import (
+    PasswordHashingService,
+    create_access_token,
+    get_password_hash,
+    verify_password,
+)
 from app.core.config import settings
 
 
@@ -56,3 +65,42 @@ class TestCreateAccessToken:
     def test_invalid_token_raises_decode_error(self):
         with pytest.raises(jwt.InvalidTokenError):
             jwt.decode("token.invalido.aqui", settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+
+class TestPasswordHashingService:
+    def test_hash_and_verify_in_executor(self):
+        service = PasswordHashingService(max_workers=2, max_pending=4)
+        try:
+            hashed = asyncio.run(service.hash("secreto"))
+            assert asyncio.run(service.verify_and_update("secreto", hashed)) == (True, None)
+            assert asyncio.run(service.verify_and_update("otro", hashed))[0] is False
+        finally:
+            service.shutdown()
+
+    def test_outdated_hash_is_returned_for_rehash(self):
+        """Un hash con menos rondas de las configuradas debe devolver su reemplazo."""
+        service = PasswordHashingService(max_workers=1, max_pending=4)
+        weak_hash = pbkdf2_sha256.using(rounds=1000).hash("secreto")
+        try:
+            verified, new_hash = asyncio.run(service.verify_and_update("secreto", weak_hash))
+        finally:
+            service.shutdown()
+        assert verified is True
+        assert new_hash is not None
+        assert pbkdf2_sha256.from_string(new_hash).rounds == settings.PASSWORD_HASH_ROUNDS
+
+    def test_saturated_service_fails_fast_with_503(self):
+        """Con la cola llena debe responder 503 al momento en lugar de encolar."""
+        from fastapi import HTTPException
+        service = PasswordHashingService(max_workers=1, max_pending=1)
+        release = threading.Event()
+        blocked = service._submit(release.wait)
+        try:
+            with pytest.raises(HTTPException) as exc_info:
+                service._submit(lambda: None)
+            assert exc_info.value.status_code == 503
+            assert exc_info.value.headers["Retry-After"] == "1"
+        finally:
+            release.set()
+            blocked.result()
+            service.shutdown()
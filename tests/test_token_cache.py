@@ -0,0 +1,94 @@
+"""Tests de la caché de tokens verificados — core/token_cache.py y get_current_user."""
+import time
+
+import jwt
+import pytest
+
+from app.api import deps
+from app.core.security import create_access_token
+from app.core.token_cache import VerifiedTokenCache
+
+
+class TestVerifiedTokenCache:
+    def test_miss_then_hit(self):
+        cache = VerifiedTokenCache(max_size=10)
+        assert cache.get("a.b.c") is None
+        cache.put("a.b.c", {"username": "alice"}, time.time() + 60)
+        assert cache.get("a.b.c") == {"username": "alice"}
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_entry_expires_with_token(self):
+        """Una entrada no debe sobrevivir al exp del token."""
+        cache = VerifiedTokenCache(max_size=10)
+        cache.put("a.b.c", {"username": "alice"}, time.time() - 1)
+        assert cache.get("a.b.c") is None
+        assert cache.stats()["size"] == 0
+
+    def test_tokens_without_exp_are_not_cached(self):
+        cache = VerifiedTokenCache(max_size=10)
+        cache.put("a.b.c", {"username": "alice"}, None)
+        assert cache.stats()["size"] == 0
+
+    def test_lru_eviction(self):
+        cache = VerifiedTokenCache(max_size=2)
+        exp = time.time() + 60
+        cache.put("t1", {"username": "1"}, exp)
+        cache.put("t2", {"username": "2"}, exp)
+        cache.get("t1")  # t1 pasa a ser el más reciente
+        cache.put("t3", {"username": "3"}, exp)
+        assert cache.get("t2") is None
+        assert cache.get("t1") is not None
+        assert cache.get("t3") is not None
+
+    def test_zero_size_disables_cache(self):
+        cache = VerifiedTokenCache(max_size=0)
+        cache.put("a.b.c", {"username": "alice"}, time.time() + 60)
+        assert cache.get("a.b.c") is None
+
+
+class TestGetCurrentUserCache:
+    @pytest.fixture(autouse=True)
+    def count_decodes(self, monkeypatch):
+        deps.token_cache.clear()
+        calls = {"n": 0}
+        original = jwt.decode
+
+        def counting_decode(*args, **kwargs):
+            calls["n"] += 1
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(deps.jwt, "decode", counting_decode)
+        yield calls
+        deps.token_cache.clear()
+
+    def test_repeated_token_skips_verification(self, count_decodes):
+        token = create_access_token({"sub": "alice"})
+        assert deps.get_current_user(token) == {"username": "alice"}
+        assert deps.get_current_user(token) == {"username": "alice"}
+        assert count_decodes["n"] == 1
+
+    def test_tampered_token_does_not_reuse_cached_result(self, count_decodes):
+        """Un token con la firma alterada debe verificarse (y rechazarse) aunque el original esté en caché."""
+        from fastapi import HTTPException
+        token = create_access_token({"sub": "alice"})
+        deps.get_current_user(token)
+        header, payload, signature = token.split(".")
+        tampered = ".".join([header, payload, signature[:-2] + ("AA" if signature[-2:] != "AA" else "BB")])
+        with pytest.raises(HTTPException) as exc_info:
+            deps.get_current_user(tampered)
+        assert exc_info.value.status_code == 401
+        assert count_decodes["n"] == 2
+
+    def test_cached_result_cannot_be_mutated_by_callers(self):
+        token = create_access_token({"sub": "alice"})
+        deps.get_current_user(token)["username"] = "mallory"
+        assert deps.get_current_user(token) == {"username": "alice"}
+
+    def test_stats_are_exported(self, client, internal_headers):
+        token = create_access_token({"sub": "alice"})
+        for _ in range(2):
+            deps.get_current_user(token)
+        status = client.get("/internal/auth/token-cache", headers=internal_headers).json()
+        assert (status["hits"], status["misses"], status["hit_ratio"]) == (1, 1, 0.5)
+        assert "token_cache_hit_ratio 0.5" in client.get("/metrics", headers=internal_headers).text
@@ -0,0 +1,150 @@
+"""Tests del uso de almacenamiento y las cuotas — services/usage_service.py y app/jobs/usage_reconcile.py."""
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.models import Document, User, UserUsage
+from app.jobs.usage_reconcile import backfill_sizes
+from app.services import usage_service
+from app.services.encryption_service import encrypt_file
+from app.services.direct_transfer_service import direct_transfer_service
+from tests.conftest import batch_files
+
+
+def _usage(client, auth_headers):
+    response = client.get("/documents/usage", headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def owner_id(db_session, registered_user):
+    return db_session.query(User.id).filter(User.username == registered_user["username"]).scalar()
+
+
+class TestUsageCounters:
+    def test_new_user_has_no_usage(self, client, auth_headers):
+        assert _usage(client, auth_headers) == {
+            "document_count": 0,
+            "bytes_used": 0,
+            "bytes_stored": 0,
+            "quota_bytes": None,
+            "bytes_available": None,
+        }
+
+    def test_uploads_and_deletes_update_the_counters(self, client, auth_headers, storage, db_session):
+        response = client.post(
+            "/documents/batch", headers=auth_headers, files=batch_files(("a.txt", b"a" * 100), ("b.txt", b"b" * 50))
+        )
+        ids = [result["id"] for result in response.json()["results"]]
+        documents = db_session.query(Document).order_by(Document.id).all()
+        assert [d.size for d in documents] == [100, 50]
+        assert all(d.stored_size == len(storage.download_file(d.s3_key)) for d in documents)
+
+        usage = _usage(client, auth_headers)
+        assert usage["document_count"] == 2
+        assert usage["bytes_used"] == 150
+        assert usage["bytes_stored"] == sum(d.stored_size for d in documents)
+
+        client.delete(f"/documents/{ids[0]}", headers=auth_headers)
+        usage = _usage(client, auth_headers)
+        assert usage["document_count"] == 1
+        assert usage["bytes_used"] == 50
+        assert usage["bytes_stored"] == documents[1].stored_size
+
+    def test_deduplicated_copies_count_in_full(self, client, auth_headers, storage):
+        client.post("/documents/batch", headers=auth_headers, files=batch_files(("a.txt", b"x" * 64)))
+        client.post("/documents/batch", headers=auth_headers, files=batch_files(("copia.txt", b"x" * 64)))
+        usage = _usage(client, auth_headers)
+        assert usage["document_count"] == 2
+        assert usage["bytes_used"] == 128
+        assert len(storage.list_files("user_")) == 1
+
+    def test_listing_shows_the_size(self, client, auth_headers, storage):
+        client.post("/documents/batch", headers=auth_headers, files=batch_files(("a.txt", b"a" * 10)))
+        documents = client.get("/documents", headers=auth_headers).json()["documents"]
+        assert documents[0]["size"] == 10
+
+
+class TestQuota:
+    def test_files_over_quota_are_rejected_before_uploading(self, client, auth_headers, storage, monkeypatch):
+        monkeypatch.setattr(settings, "STORAGE_QUOTA_BYTES", 100)
+        response = client.post(
+            "/documents/batch",
+            headers=auth_headers,
+            files=batch_files(("a.txt", b"a" * 60), ("b.txt", b"b" * 60), ("c.txt", b"c" * 40)),
+        )
+        body = response.json()
+        assert [r["status"] for r in body["results"]] == ["ok", "error", "ok"]
+        assert "Cuota" in body["results"][1]["detail"]
+        assert len(storage.list_files("user_")) == 2
+        assert _usage(client, auth_headers)["bytes_available"] == 0
+
+    def test_charge_checks_the_quota_atomically(self, client, db_session, owner_id, monkeypatch):
+        monkeypatch.setattr(settings, "STORAGE_QUOTA_BYTES", 100)
+        usage_service.charge(db_session, owner_id, 1, 80, 90)
+        with pytest.raises(usage_service.QuotaExceeded):
+            usage_service.charge(db_session, owner_id, 1, 30, 30)
+        db_session.commit()
+        assert usage_service.get_usage(db_session, owner_id)["bytes_used"] == 80
+
+    def test_per_user_quota_overrides_the_default(self, client, auth_headers, db_session, owner_id):
+        db_session.add(UserUsage(user_id=owner_id, document_count=0, bytes_used=0, bytes_stored=0, quota_bytes=10))
+        db_session.commit()
+        response = client.post("/documents/batch", headers=auth_headers, files=batch_files(("a.txt", b"a" * 11)))
+        assert response.json()["uploaded"] == 0
+        assert _usage(client, auth_headers)["quota_bytes"] == 10
+
+    def test_race_at_insert_returns_413_and_cleans_up(self, client, auth_headers, storage, monkeypatch):
+        monkeypatch.setattr(settings, "STORAGE_QUOTA_BYTES", 100)
+        # Como si otra subida hubiera ocupado el espacio entre la comprobación previa y el INSERT
+        monkeypatch.setattr(usage_service, "remaining_bytes", lambda db, owner_id: None)
+        client.post("/documents/batch", headers=auth_headers, files=batch_files(("a.txt", b"a" * 90)))
+        response = client.post("/documents/batch", headers=auth_headers, files=batch_files(("b.txt", b"b" * 20)))
+        assert response.status_code == 413
+        assert len(storage.list_files("user_")) == 1
+
+    def test_direct_upload_over_quota_is_rejected(self, client, auth_headers, storage, monkeypatch):
+        monkeypatch.setattr(settings, "TRANSFER_MODE", "both")
+        monkeypatch.setattr(settings, "STORAGE_QUOTA_BYTES", 100)
+        monkeypatch.setattr(direct_transfer_service, "storage", storage)
+        response = client.post(
+            "/documents/direct-uploads", headers=auth_headers, json={"filename": "grande.bin", "size": 101}
+        )
+        assert response.status_code == 413
+
+
+class TestReconcile:
+    def test_rebuilds_drifted_and_missing_counters(self, client, db_session, owner_id):
+        other = User(username="otro", email="otro@example.com", hashed_password="x")
+        db_session.add(other)
+        db_session.flush()
+        db_session.add_all([
+            Document(filename="a", s3_key="user_x/a", owner_id=owner_id, size=10, stored_size=40),
+            Document(filename="b", s3_key="user_x/b", owner_id=owner_id, size=5, stored_size=None),
+            Document(filename="c", s3_key="user_y/c", owner_id=other.id, size=7, stored_size=30),
+        ])
+        db_session.add(UserUsage(user_id=owner_id, document_count=9, bytes_used=999, bytes_stored=0, quota_bytes=500))
+        db_session.commit()
+
+        assert usage_service.reconcile(db_session) == {"users": 2, "drifted": 1, "created": 1}
+        assert usage_service.get_usage(db_session, owner_id) == {
+            "document_count": 2,
+            "bytes_used": 15,
+            "bytes_stored": 40,
+            "quota_bytes": 500,
+            "bytes_available": 485,
+        }
+        assert usage_service.get_usage(db_session, other.id)["bytes_stored"] == 30
+        assert usage_service.reconcile(db_session)["drifted"] == 0
+
+    def test_backfill_reads_sizes_from_the_objects(self, client, s3, db_session, owner_id):
+        blob = encrypt_file(b"z" * 1000)
+        db_session.add(Document(filename="antiguo.bin", s3_key=s3.upload_file(blob, "antiguo.bin", owner_id), owner_id=owner_id))
+        db_session.commit()
+
+        report = backfill_sizes(sessionmaker(bind=db_session.get_bind()), storage=s3, log=lambda _: None)
+        assert report == {"documents": 1, "with_size": 1, "failed": 0}
+        document = db_session.query(Document).one()
+        db_session.refresh(document)
+        assert (document.size, document.stored_size) == (1000, len(blob))